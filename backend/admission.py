@@ -0,0 +1,62 @@
+# Control de admisión para el trabajo de CPU de los endpoints async (decodificar + inferir):
+# un pool de hilos propio con un tope de tareas en curso + en cola. Si está lleno, submit
+# lanza Saturated al momento y el endpoint responde 503 con Retry-After en vez de encolar
+# sin límite (y sin bloquear el event loop mientras tanto).
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class Saturated(Exception):
+    pass
+
+
+class BoundedExecutor:
+    def __init__(self, workers: int, queue_limit: int, name: str):
+        self.workers = max(1, workers)
+        self.capacity = self.workers + max(0, queue_limit)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._slot_free = threading.Condition(self._lock)
+        self._inflight = 0
+        self._accepted = 0
+        self._rejected = 0
+
+    def submit(self, fn, *args) -> Future:
+        with self._lock:
+            if self._inflight >= self.capacity:
+                self._rejected += 1
+                raise Saturated()
+            self._inflight += 1
+            self._accepted += 1
+        try:
+            fut = self._pool.submit(fn, *args)
+        except BaseException:
+            self._release(None)
+            raise
+        fut.add_done_callback(self._release)
+        return fut
+
+    def _release(self, _fut):
+        with self._lock:
+            self._inflight -= 1
+            self._slot_free.notify_all()
+
+    def wait_for_slot(self, timeout: float) -> bool:
+        # Para quien prefiere esperar a un 503 (p. ej. un lote en curso): True en cuanto hay
+        # hueco (sin reservarlo: submit puede volver a fallar), False si se agota timeout
+        with self._slot_free:
+            return self._slot_free.wait_for(lambda: self._inflight < self.capacity, timeout)
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "inflight": self._inflight,
+                "accepted": self._accepted,
+                "rejected": self._rejected,
+            }
@@ -26,6 +26,7 @@ if not JWT_SECRET:
     JWT_SECRET = "dev_insecure_change_me"
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="/auth/login", auto_error=False)
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -48,12 +49,26 @@ def decode_token(token: str) -> str:
     except JWTError:
         raise HTTPException(status_code=401, detail="Token inválido o expirado")
 
-def get_current_user(
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme),
-) -> User:
+def user_from_token(db: Session, token: str) -> User:
     user_id = decode_token(token)
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=401, detail="Usuario no existe")
     return user
+
+def get_current_user(
+    db: Session = Depends(get_db),
+    token: str = Depends(oauth2_scheme),
+) -> User:
+    return user_from_token(db, token)
+
+def get_current_user_stream(
+    db: Session = Depends(get_db),
+    token: str | None = Depends(oauth2_scheme_optional),
+    access_token: str | None = None,
+) -> User:
+    # EventSource no puede enviar cabeceras: se acepta también ?access_token=
+    token = token or access_token
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    return user_from_token(db, token)
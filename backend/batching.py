@@ -0,0 +1,143 @@
+# Micro-batching de inferencia entre peticiones: imágenes, frames de directo y lotes de vídeo
+# entran en una cola y un único hilo las agrupa en lotes de hasta max_batch, esperando como
+# mucho max_wait_ms desde la primera para juntar más. Cada petición recibe un Future.
+# El lote se infiere con la conf mínima del lote y cada petición se queda con las detecciones
+# >= su conf (el NMS no cambia: una caja solo la suprime otra de más confianza).
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+
+_LATENCY_WINDOW = 1000  # últimas peticiones para los percentiles
+
+
+class _Request:
+    __slots__ = ("image", "conf", "future", "submitted")
+
+    def __init__(self, image, conf: float):
+        self.image = image
+        self.conf = conf
+        self.future = Future()
+        self.submitted = time.perf_counter()
+
+
+def _percentile(values: list, q: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 1)
+
+
+class BatchPredictor:
+    def __init__(self, predict_batch, max_batch: int = 8, max_wait_ms: float = 5.0):
+        # predict_batch(images, conf) -> [[det, ...], ...] en el mismo orden
+        self.predict_batch = predict_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        self._metrics_lock = threading.Lock()
+        self._batches = 0
+        self._requests = 0
+        self._errors = 0
+        self._batch_sizes = {}  # tamaño de lote -> nº de lotes
+        self._latency_ms = deque(maxlen=_LATENCY_WINDOW)  # cola + inferencia, por petición
+        self._infer_ms = deque(maxlen=_LATENCY_WINDOW)  # inferencia, por lote
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="infer-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, image, conf: float) -> Future:
+        self._ensure_started()
+        req = _Request(image, float(conf))
+        self._queue.put(req)
+        return req.future
+
+    def predict(self, images: list, conf: float) -> list[list[dict]]:
+        # Bloqueante: encola todas y espera (los lotes de vídeo también se mezclan con el resto)
+        futures = [self.submit(img, conf) for img in images]
+        return [f.result() for f in futures]
+
+    def close(self):
+        # Termina el hilo cuando se vacíe lo ya encolado (versión de modelo retirada)
+        if self._thread is not None:
+            self._queue.put(None)
+
+    def _collect(self) -> list[_Request] | None:
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                req = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if req is None:
+                self._queue.put(None)
+                break
+            batch.append(req)
+        # Futures cancelados por quien esperaba (p. ej. cliente desconectado) no se infieren
+        return [r for r in batch if r.future.set_running_or_notify_cancel()]
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            if batch:
+                self._run_batch(batch)
+
+    def _run_batch(self, batch: list[_Request]):
+        t0 = time.perf_counter()
+        try:
+            out = self.predict_batch([r.image for r in batch], min(r.conf for r in batch))
+        except Exception as e:
+            with self._metrics_lock:
+                self._errors += len(batch)
+            for r in batch:
+                r.future.set_exception(e)
+            return
+        t1 = time.perf_counter()
+
+        for r, dets in zip(batch, out):
+            r.future.set_result([d for d in dets if d["confidence"] >= r.conf])
+
+        with self._metrics_lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+            self._infer_ms.append((t1 - t0) * 1000)
+            self._latency_ms.extend((t1 - r.submitted) * 1000 for r in batch)
+
+    def metrics(self) -> dict:
+        with self._metrics_lock:
+            latency = list(self._latency_ms)
+            infer = list(self._infer_ms)
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": self._batches,
+                "requests": self._requests,
+                "errors": self._errors,
+                "avg_batch_size": round(self._requests / self._batches, 2) if self._batches else None,
+                "batch_sizes": dict(sorted(self._batch_sizes.items())),
+                "latency_ms": {
+                    "p50": _percentile(latency, 0.50),
+                    "p95": _percentile(latency, 0.95),
+                    "p99": _percentile(latency, 0.99),
+                },
+                "batch_infer_ms_avg": round(sum(infer) / len(infer), 2) if infer else None,
+            }
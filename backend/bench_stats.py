@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# Micro-benchmark: estadísticas de vídeo con el cálculo anterior (listas completas +
+# top_for_segment recorriendo todas las detecciones por segmento) frente a StatsAccumulator.
+# Uso: python bench_stats.py [minutos] [fps] [stride]
+import sys
+import time
+import random
+
+from stats import video_stats
+
+SEGMENT_GAP_SECONDS = 1.0
+SPECIES = [f"species_{i}" for i in range(30)]
+
+
+def _segments_from_times(times, gap_s):
+    if not times:
+        return []
+    times = sorted(times)
+    segs = []
+    start = times[0]
+    last = times[0]
+    for t in times[1:]:
+        if (t - last) <= gap_s:
+            last = t
+        else:
+            segs.append({"start_time": start, "end_time": last})
+            start = last = t
+    segs.append({"start_time": start, "end_time": last})
+    return segs
+
+
+def legacy_stats(frame_dets, fps, gap_s):
+    detect_times = []
+    species_counter = {}
+    species_times = {}
+    for frame_idx, dets in frame_dets:
+        tsec = frame_idx / fps
+        for det in dets:
+            cls_name = det["class"]
+            species_counter[cls_name] = species_counter.get(cls_name, 0) + 1
+            species_times.setdefault(cls_name, []).append(tsec)
+        if dets:
+            detect_times.append(tsec)
+
+    segments = _segments_from_times(detect_times, gap_s)
+    species_segments = {sp: _segments_from_times(ts, gap_s) for sp, ts in species_times.items()}
+    species_ranking = sorted(
+        [{"species": sp, "count": c} for sp, c in species_counter.items()],
+        key=lambda x: x["count"],
+        reverse=True
+    )
+
+    def top_for_segment(seg):
+        s, e = seg["start_time"], seg["end_time"]
+        best_sp, best_cnt = None, 0
+        for sp, ts in species_times.items():
+            cnt = sum(1 for t in ts if s <= t <= e)
+            if cnt > best_cnt:
+                best_cnt = cnt
+                best_sp = sp
+        return {"species": best_sp, "count": best_cnt}
+
+    segments_enriched = []
+    for seg in segments:
+        enriched = dict(seg)
+        enriched["top_species"] = top_for_segment(seg)
+        segments_enriched.append(enriched)
+
+    return {
+        "num_inference_points_with_detections": len(detect_times),
+        "top_species_overall": species_ranking[0]["species"] if species_ranking else None,
+        "segments": segments_enriched,
+        "species_ranking": species_ranking,
+        "species_individuals": None,
+        "species_segments": species_segments,
+    }
+
+
+def synthetic(minutes, fps, stride, seed=0):
+    # Escena densa: ráfagas de actividad con varias aves por frame y huecos de más de gap_s
+    rnd = random.Random(seed)
+    frame_dets = []
+    active = True
+    for frame_idx in range(0, int(minutes * 60 * fps), stride):
+        if rnd.random() < 0.01:
+            active = not active
+        dets = []
+        if active:
+            for _ in range(rnd.randint(1, 6)):
+                dets.append({"class": rnd.choice(SPECIES), "confidence": 0.5, "bbox": [0, 0, 10, 10]})
+        frame_dets.append((frame_idx, dets))
+    return frame_dets
+
+
+def _best_of(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, out
+
+
+def main():
+    minutes = float(sys.argv[1]) if len(sys.argv) > 1 else 15
+    fps = float(sys.argv[2]) if len(sys.argv) > 2 else 30
+    stride = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+
+    frame_dets = synthetic(minutes, fps, stride)
+    n_dets = sum(len(d) for _, d in frame_dets)
+    print(f"{minutes:g} min @ {fps:g} fps, stride {stride}: {len(frame_dets)} frames inferidos, {n_dets} detecciones")
+
+    t_old, old = _best_of(lambda: legacy_stats(frame_dets, fps, SEGMENT_GAP_SECONDS), 3)
+    t_new, new = _best_of(lambda: video_stats(frame_dets, fps, SEGMENT_GAP_SECONDS), 3)
+    if old != new:
+        raise SystemExit("Los resultados no coinciden")
+
+    print(f"segmentos: {len(new['segments'])}")
+    print(f"anterior:          {t_old * 1000:9.1f} ms")
+    print(f"StatsAccumulator:  {t_new * 1000:9.1f} ms  (x{t_old / max(t_new, 1e-9):.1f})")
+
+
+if __name__ == "__main__":
+    main()
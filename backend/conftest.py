@@ -0,0 +1,6 @@
+# Los tests usan una base SQLite temporal: db.py crea el engine al importarse, así que la
+# variable tiene que estar antes de que ningún test importe db, models o jobs
+import os
+import tempfile
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='birds-tests-'), 'test.db')}")
@@ -0,0 +1,93 @@
+# Decodificación de imágenes subidas según su tamaño. Se lee la cabecera (JPEG/PNG) sin
+# decodificar: si pasa del límite de píxeles se rechaza antes de reservar memoria, y un JPEG
+# mucho mayor que el tamaño de inferencia se decodifica ya reducido 1/2, 1/4 o 1/8 por libjpeg
+# (IMREAD_REDUCED_*), que es más rápido y ocupa una fracción de la memoria. Mientras el lado
+# largo reducido siga siendo >= target el letterbox a target no pierde nada.
+import struct
+
+import cv2
+import numpy as np
+
+
+_REDUCED = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+# SOFn (tamaño del frame); C4 (DHT), C8 (JPG) y CC (DAC) comparten rango pero no lo son
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class ImageTooLarge(Exception):
+    def __init__(self, width: int, height: int, max_pixels: int):
+        super().__init__(f"Imagen demasiado grande ({width}x{height}). Máximo {max_pixels / 1e6:.0f} MP.")
+
+
+def _jpeg_size(data: bytes) -> tuple[int, int] | None:
+    i = 2
+    n = len(data)
+    while i + 4 <= n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # relleno
+            i += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:  # sin longitud
+            i += 2
+            continue
+        if marker in (0xD9, 0xDA):  # fin o inicio de datos sin haber visto SOF
+            return None
+        length = struct.unpack(">H", data[i + 2:i + 4])[0]
+        if marker in _SOF_MARKERS:
+            if i + 9 > n:
+                return None
+            h, w = struct.unpack(">HH", data[i + 5:i + 9])
+            return w, h
+        i += 2 + length
+    return None
+
+
+def image_header(data: bytes) -> tuple[str, int, int] | None:
+    # (formato, ancho, alto) de la cabecera sin decodificar; None si no se reconoce
+    if data[:3] == b"\xff\xd8\xff":
+        size = _jpeg_size(data)
+        return ("jpeg", *size) if size else None
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and data[12:16] == b"IHDR":
+        w, h = struct.unpack(">II", data[16:24])
+        return "png", w, h
+    return None
+
+
+def reduced_factor(width: int, height: int, target: int) -> int:
+    # Mayor reducción de libjpeg que deja el lado largo >= target
+    long_side = max(width, height)
+    for factor in (8, 4, 2):
+        if long_side // factor >= target:
+            return factor
+    return 1
+
+
+def decode_image(data: bytes, target: int, max_pixels: int) -> tuple[np.ndarray, int, int] | None:
+    # -> (imagen BGR, ancho original, alto original); la imagen puede venir reducida y las
+    # cajas se pasan a píxeles originales con ancho/img.shape[1] y alto/img.shape[0].
+    # None si no se puede decodificar; ImageTooLarge si supera max_pixels
+    header = image_header(data)
+    factor = 1
+    if header is not None:
+        fmt, w, h = header
+        if max_pixels and w * h > max_pixels:
+            raise ImageTooLarge(w, h, max_pixels)
+        if fmt == "jpeg":
+            factor = reduced_factor(w, h, target)
+
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), _REDUCED[factor] if factor > 1 else cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    ih, iw = img.shape[:2]
+    if factor == 1:
+        if max_pixels and iw * ih > max_pixels:
+            raise ImageTooLarge(iw, ih, max_pixels)
+        return img, iw, ih
+
+    # La orientación EXIF se aplica al decodificar: si la imagen quedó girada, la cabecera
+    # tiene ancho y alto intercambiados
+    if abs(iw - -(-w // factor)) > 1 or abs(ih - -(-h // factor)) > 1:
+        w, h = h, w
+    return img, w, h
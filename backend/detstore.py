@@ -0,0 +1,161 @@
+# Almacén columnar de detecciones crudas de un vídeo (base del cache de detecciones).
+# Tres ficheros por clave en OUTPUT_DIR:
+#   <base>.dets    registros DET_DTYPE (frame_idx, class_id, conf, bbox) en orden de frame
+#   <base>.frames  int32 con todos los frames inferidos (también los que no tienen detecciones)
+#   <base>.json    metadatos (clases, min_conf, vídeo); se escribe el último = almacén completo
+# Se escribe de forma incremental (append) y se lee con np.memmap: cortar por frames o por
+# tiempo son vistas sobre el fichero, sin cargar el vídeo entero en memoria.
+import os
+import json
+import math
+import uuid
+
+import numpy as np
+
+
+DET_DTYPE = np.dtype([
+    ("frame_idx", "<i4"),
+    ("class_id", "<u2"),
+    ("conf", "<f4"),
+    ("bbox", "<f4", (4,)),
+])
+FRAME_DTYPE = np.dtype("<i4")
+
+
+def store_paths(base: str) -> tuple[str, str, str]:
+    return f"{base}.dets", f"{base}.frames", f"{base}.json"
+
+
+class DetectionWriter:
+    # Escribe en ficheros .part y los publica en close(); abort() los descarta
+    def __init__(self, base: str, buffer_rows: int = 4096):
+        self.base = base
+        self.paths = store_paths(base)
+        self.buffer_rows = buffer_rows
+        self.classes = []
+        self.class_idx = {}
+        self.rows = []
+        self.frames = []
+        self.num_dets = 0
+        self.num_frames = 0
+        # Sufijo único: dos jobs con la misma clave no se pisan (gana el último close)
+        self.part = f".{uuid.uuid4().hex[:12]}.part"
+        self.f_dets = open(self.paths[0] + self.part, "wb")
+        self.f_frames = open(self.paths[1] + self.part, "wb")
+
+    def add(self, frame_idx: int, dets: list[dict]):
+        self.frames.append(frame_idx)
+        for d in dets:
+            cls_name = d["class"]
+            if cls_name not in self.class_idx:
+                self.class_idx[cls_name] = len(self.classes)
+                self.classes.append(cls_name)
+            self.rows.append((frame_idx, self.class_idx[cls_name], d["confidence"], d["bbox"]))
+        if len(self.rows) >= self.buffer_rows or len(self.frames) >= self.buffer_rows:
+            self._flush()
+
+    def _flush(self):
+        if self.rows:
+            np.array(self.rows, dtype=DET_DTYPE).tofile(self.f_dets)
+            self.num_dets += len(self.rows)
+            self.rows.clear()
+        if self.frames:
+            np.array(self.frames, dtype=FRAME_DTYPE).tofile(self.f_frames)
+            self.num_frames += len(self.frames)
+            self.frames.clear()
+
+    def close(self, min_conf: float, video: dict) -> "DetectionStore":
+        self._flush()
+        self.f_dets.close()
+        self.f_frames.close()
+        meta = {
+            "version": 1,
+            "min_conf": float(min_conf),
+            "video": video,
+            "classes": self.classes,
+            "num_dets": self.num_dets,
+            "num_frames": self.num_frames,
+        }
+        dets_path, frames_path, meta_path = self.paths
+        os.replace(dets_path + self.part, dets_path)
+        os.replace(frames_path + self.part, frames_path)
+        with open(meta_path + self.part, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(meta_path + self.part, meta_path)
+        return DetectionStore(self.base)
+
+    def abort(self):
+        for f in (self.f_dets, self.f_frames):
+            try:
+                f.close()
+            except Exception:
+                pass
+        for path in self.paths[:2]:
+            try:
+                os.remove(path + self.part)
+            except OSError:
+                pass
+
+
+def _memmap(path: str, dtype: np.dtype, count: int):
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+
+class DetectionStore:
+    def __init__(self, base: str):
+        dets_path, frames_path, meta_path = store_paths(base)
+        with open(meta_path, "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.classes = self.meta["classes"]
+        self.min_conf = self.meta["min_conf"]
+        self.video = self.meta["video"]
+        self.dets = _memmap(dets_path, DET_DTYPE, self.meta["num_dets"])
+        self.frames = _memmap(frames_path, FRAME_DTYPE, self.meta["num_frames"])
+
+    @classmethod
+    def open(cls, base: str):
+        # None si no existe o está incompleto (sin metadatos o ficheros truncados)
+        dets_path, frames_path, meta_path = store_paths(base)
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            store = cls(base)
+        except (OSError, ValueError, KeyError):
+            return None
+        return store
+
+    def frame_bounds(self, start_frame: int, end_frame: int) -> tuple[slice, slice]:
+        # Filas de [start_frame, end_frame) en dets y en frames (búsqueda binaria, columnas ordenadas)
+        fi = self.dets["frame_idx"]
+        d0, d1 = np.searchsorted(fi, [start_frame, end_frame], side="left")
+        f0, f1 = np.searchsorted(self.frames, [start_frame, end_frame], side="left")
+        return slice(int(d0), int(d1)), slice(int(f0), int(f1))
+
+    def slice_frames(self, start_frame: int, end_frame: int):
+        # Vistas (sin copia) de los registros y frames inferidos del rango
+        ds, fs = self.frame_bounds(start_frame, end_frame)
+        return self.dets[ds], self.frames[fs]
+
+    def slice_time(self, t0: float, t1: float):
+        fps = self.video["fps"]
+        return self.slice_frames(math.ceil(t0 * fps), math.ceil(t1 * fps))
+
+    def frame_dets(self, start_frame: int = 0, end_frame: int | None = None, min_conf: float = 0.0):
+        # [(frame_idx, dets)] con dicts como los de dets_from_result, para el pipeline y las stats
+        if end_frame is None:
+            end_frame = np.iinfo(np.int32).max
+        dets, frames = self.slice_frames(start_frame, end_frame)
+        if min_conf > self.min_conf:
+            dets = dets[dets["conf"] >= min_conf]
+        by_frame = {}
+        columns = zip(dets["frame_idx"].tolist(), dets["class_id"].tolist(), dets["conf"].tolist(),
+                      dets["bbox"].tolist())
+        for frame_idx, class_id, conf, bbox in columns:
+            by_frame.setdefault(frame_idx, []).append({
+                "class": self.classes[class_id],
+                "confidence": conf,
+                "bbox": bbox,
+            })
+        return [(idx, by_frame.get(idx, [])) for idx in frames.tolist()]
@@ -0,0 +1,259 @@
+# Motores de inferencia intercambiables. Todos exponen predict(images, conf) -> [[det, ...], ...]
+# con los mismos dicts de detección ({"class", "confidence", "bbox": [x1, y1, x2, y2]} en píxeles
+# de la imagen original) y names {id: clase}.
+#   ultralytics  YOLO(.pt) con PyTorch (por defecto)
+#   onnxruntime  ONNX exportado por modelo/export.py, CPUExecutionProvider
+#   openvino     mismo ONNX (o IR .xml) compilado para CPU con OpenVINO
+#   remote       cliente de infer_server.py: el modelo vive en otro proceso (memoria compartida)
+# onnxruntime/openvino hacen su propio letterbox y NMS (no cargan torch ni ultralytics).
+import os
+import ast
+import logging
+
+import cv2
+import numpy as np
+
+
+log = logging.getLogger("birds-backend")
+
+ENGINES = ("ultralytics", "onnxruntime", "openvino", "remote")
+NMS_IOU = 0.7  # mismos valores por defecto que ultralytics
+MAX_DET = 300
+_MAX_WH = 7680  # desplazamiento por clase para hacer un único NMS por clases
+
+
+def dets_from_result(r) -> list[dict]:
+    dets = []
+    boxes = r.boxes
+    names = r.names
+    if boxes is not None and len(boxes) > 0:
+        for box in boxes:
+            x1, y1, x2, y2 = box.xyxy[0].tolist()
+            cls_id = int(box.cls[0])
+            c = float(box.conf[0])
+            cls_name = names.get(cls_id, f"class_{cls_id}")
+            dets.append({"class": cls_name, "confidence": float(c), "bbox": [x1, y1, x2, y2]})
+    return dets
+
+
+def engine_for(path: str, engine: str | None = None) -> str:
+    # Sin INFER_ENGINE explícito se deduce de la extensión del modelo
+    if engine:
+        if engine not in ENGINES:
+            raise ValueError(f"INFER_ENGINE desconocido: {engine} (opciones: {', '.join(ENGINES)})")
+        return engine
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".onnx":
+        return "onnxruntime"
+    if ext == ".xml":
+        return "openvino"
+    return "ultralytics"
+
+
+def load_engine(path: str, imgsz: int, engine: str | None = None, threads: int | None = None):
+    kind = engine_for(path, engine)
+    log.info("Motor de inferencia: %s (%s)", kind, path)
+    if kind == "onnxruntime":
+        return OnnxRuntimeEngine(path, imgsz, threads)
+    if kind == "openvino":
+        return OpenVinoEngine(path, imgsz, threads)
+    if kind == "remote":
+        from infer_server import RemoteEngine
+        return RemoteEngine()
+    return UltralyticsEngine(path, imgsz, threads)
+
+
+class UltralyticsEngine:
+    name = "ultralytics"
+
+    def __init__(self, path: str, imgsz: int, threads: int | None = None):
+        if threads:
+            try:
+                import torch
+                torch.set_num_threads(max(1, threads))
+            except Exception:
+                pass
+        from ultralytics import YOLO
+        self.model = YOLO(path)
+        self.names = self.model.names
+        self.imgsz = imgsz
+
+    def predict(self, images: list, conf: float) -> list[list[dict]]:
+        results = self.model.predict(source=images, conf=conf, imgsz=self.imgsz, verbose=False)
+        return [dets_from_result(r) for r in results]
+
+
+# ---------------- Pre/postproceso propios (ONNX) ----------------
+def letterbox(img: np.ndarray, size: int, color: int = 114) -> tuple[np.ndarray, float, tuple[int, int]]:
+    # Redimensiona manteniendo aspecto y rellena hasta size x size (como LetterBox de ultralytics
+    # con forma fija). Devuelve (imagen, escala, (pad_x, pad_y))
+    h, w = img.shape[:2]
+    r = min(size / h, size / w)
+    new_w, new_h = int(round(w * r)), int(round(h * r))
+    if (new_w, new_h) != (w, h):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    dw, dh = (size - new_w) / 2, (size - new_h) / 2
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(color, color, color))
+    return img, r, (left, top)
+
+
+def preprocess(images: list, size: int) -> tuple[np.ndarray, list]:
+    # BGR uint8 -> tensor NCHW RGB float32 [0, 1]; metas para deshacer el letterbox
+    batch = np.empty((len(images), 3, size, size), dtype=np.float32)
+    metas = []
+    for i, img in enumerate(images):
+        boxed, r, pad = letterbox(img, size)
+        batch[i] = boxed[:, :, ::-1].transpose(2, 0, 1)
+        metas.append((r, pad, img.shape[:2]))
+    batch *= 1.0 / 255.0
+    return batch, metas
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_thres: float, max_det: int = MAX_DET) -> np.ndarray:
+    # NMS greedy con IoU vectorizado contra todas las cajas restantes en cada paso
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1).clip(0) * (y2 - y1).clip(0)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size and len(keep) < max_det:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = (np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest])).clip(0)
+        h = (np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest])).clip(0)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_thres]
+    return np.array(keep, dtype=np.int64)
+
+
+def postprocess(pred: np.ndarray, metas: list, conf: float, names: dict,
+                iou_thres: float = NMS_IOU, max_det: int = MAX_DET) -> list[list[dict]]:
+    # pred: (B, 4 + nc, N) con cx, cy, w, h en píxeles del letterbox y una puntuación por clase
+    out = []
+    for p, (r, (pad_x, pad_y), (h, w)) in zip(pred, metas):
+        p = p.T
+        scores = p[:, 4:]
+        cls = scores.argmax(axis=1)
+        confs = scores[np.arange(len(cls)), cls]
+        m = confs >= conf
+        if not m.any():
+            out.append([])
+            continue
+        xywh, cls, confs = p[m, :4], cls[m], confs[m]
+
+        boxes = np.empty_like(xywh)
+        boxes[:, 0] = xywh[:, 0] - xywh[:, 2] / 2
+        boxes[:, 1] = xywh[:, 1] - xywh[:, 3] / 2
+        boxes[:, 2] = xywh[:, 0] + xywh[:, 2] / 2
+        boxes[:, 3] = xywh[:, 1] + xywh[:, 3] / 2
+        keep = nms(boxes + cls[:, None] * _MAX_WH, confs, iou_thres, max_det)
+        boxes, cls, confs = boxes[keep], cls[keep], confs[keep]
+
+        boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad_x) / r).clip(0, w)
+        boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad_y) / r).clip(0, h)
+        out.append([
+            {"class": names.get(int(c), f"class_{int(c)}"), "confidence": float(s), "bbox": b.tolist()}
+            for b, c, s in zip(boxes, cls, confs)
+        ])
+    return out
+
+
+def _parse_names(raw) -> dict | None:
+    if not raw:
+        return None
+    names = ast.literal_eval(raw) if isinstance(raw, str) else raw
+    return {int(k): str(v) for k, v in names.items()}
+
+
+def _sidecar_names(path: str) -> dict | None:
+    # Export de ultralytics a OpenVINO: metadata.yaml junto al .xml
+    meta = os.path.join(os.path.dirname(path), "metadata.yaml")
+    if not os.path.isfile(meta):
+        return None
+    import yaml
+    with open(meta, "r", encoding="utf-8") as f:
+        return _parse_names((yaml.safe_load(f) or {}).get("names"))
+
+
+def _onnx_names(path: str) -> dict | None:
+    import onnx
+    props = {p.key: p.value for p in onnx.load(path, load_external_data=False).metadata_props}
+    return _parse_names(props.get("names"))
+
+
+class _YoloExportEngine:
+    # Entrada (B, 3, S, S); si el batch del modelo es fijo se infiere de esa en esa
+    name = ""
+    imgsz = 640
+    batch = None
+    names = {}
+
+    def _infer(self, blob: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def predict(self, images: list, conf: float) -> list[list[dict]]:
+        step = self.batch or len(images) or 1
+        out = []
+        for i in range(0, len(images), step):
+            blob, metas = preprocess(images[i:i + step], self.imgsz)
+            out.extend(postprocess(self._infer(blob), metas, conf, self.names))
+        return out
+
+
+def _static_dim(d) -> int | None:
+    return d if isinstance(d, int) and d > 0 else None
+
+
+class OnnxRuntimeEngine(_YoloExportEngine):
+    name = "onnxruntime"
+
+    def __init__(self, path: str, imgsz: int, threads: int | None = None):
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = max(1, threads)
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        self.batch = _static_dim(inp.shape[0])
+        self.imgsz = _static_dim(inp.shape[2]) or imgsz
+        self.names = _parse_names(self.session.get_modelmeta().custom_metadata_map.get("names")) or {}
+
+    def _infer(self, blob: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVinoEngine(_YoloExportEngine):
+    name = "openvino"
+
+    def __init__(self, path: str, imgsz: int, threads: int | None = None):
+        import openvino as ov
+        core = ov.Core()
+        model = core.read_model(path)
+        shape = model.input(0).get_partial_shape()
+        if shape[2].is_dynamic or shape[3].is_dynamic:
+            # Tamaño fijo (mejor para CPU); el batch se deja dinámico si ya lo era
+            model.reshape([shape[0], 3, imgsz, imgsz])
+            shape = model.input(0).get_partial_shape()
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if threads:
+            config["INFERENCE_NUM_THREADS"] = max(1, threads)
+        self.compiled = core.compile_model(model, "CPU", config)
+        self.output = self.compiled.output(0)
+        self.batch = None if shape[0].is_dynamic else shape[0].get_length()
+        self.imgsz = shape[2].get_length()
+        self.names = {}
+        for read_names in ((_onnx_names,) if path.lower().endswith(".onnx") else ()) + (_sidecar_names,):
+            try:
+                self.names = read_names(path) or {}
+            except ImportError:
+                continue
+            if self.names:
+                break
+
+    def _infer(self, blob: np.ndarray) -> np.ndarray:
+        return self.compiled(blob)[self.output]
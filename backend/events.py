@@ -0,0 +1,51 @@
+# Eventos de jobs en proceso (progreso y resultados parciales) para los streams SSE.
+# Los publica quien actualiza el job (hilos worker) y los consume el event loop de la API.
+# Con workers en otros procesos no llegan por aquí: el stream lee la fila del job cada
+# JOB_EVENTS_POLL_SECONDS y solo envía lo que ha cambiado.
+import asyncio
+import threading
+
+
+class JobEventHub:
+    def __init__(self, max_pending: int = 256):
+        self.max_pending = max_pending
+        self._subs = {}  # job_id -> [(loop, asyncio.Queue)]
+        self._lock = threading.Lock()
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        # Desde el event loop que va a consumir la cola
+        q = asyncio.Queue(maxsize=self.max_pending)
+        with self._lock:
+            self._subs.setdefault(job_id, []).append((asyncio.get_running_loop(), q))
+        return q
+
+    def unsubscribe(self, job_id: str, q: asyncio.Queue):
+        with self._lock:
+            subs = [s for s in self._subs.get(job_id, []) if s[1] is not q]
+            if subs:
+                self._subs[job_id] = subs
+            else:
+                self._subs.pop(job_id, None)
+
+    def publish(self, job_id: str, event: dict):
+        # Desde cualquier hilo; nunca bloquea al worker
+        with self._lock:
+            subs = list(self._subs.get(job_id, []))
+        for loop, q in subs:
+            try:
+                loop.call_soon_threadsafe(self._deliver, q, event)
+            except RuntimeError:
+                pass  # loop cerrado
+
+    @staticmethod
+    def _deliver(q: asyncio.Queue, event: dict):
+        if q.full():
+            # Consumidor lento: se descarta el evento más antiguo (el estado se vuelve a leer de la DB)
+            try:
+                q.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        q.put_nowait(event)
+
+
+hub = JobEventHub()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+# Servidor de inferencia: uno o varios procesos dueños del modelo a los que los procesos de la API
+# (y worker.py) envían los frames ya decodificados. Así solo estos procesos cargan torch y los
+# pesos, y la API se puede escalar en workers sin multiplicar la RAM ni pelearse por los hilos.
+# Transporte: cada cliente crea un segmento de memoria compartida (INFER_SHM_MB) donde escribe
+# los frames del lote; por el socket Unix solo viajan offsets/formas y las detecciones.
+# Acceso: los sockets viven en un directorio privado (0700) y son 0600, y la conexión exige la
+# clave INFER_AUTHKEY; sin ella el servidor genera una aleatoria en <directorio>/authkey (0600),
+# que leen los clientes con el mismo usuario. Lo que llega por el socket se deserializa con
+# pickle: nadie sin la clave debe poder conectarse.
+# Uso: python infer_server.py   (INFER_SERVERS procesos, escuchando en INFER_SOCKET.<i>)
+#      API/worker con INFER_ENGINE=remote
+import os
+import stat
+import time
+import atexit
+import signal
+import secrets
+import logging
+import threading
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+from multiprocessing.connection import Listener, Client, AuthenticationError
+
+import numpy as np
+
+
+log = logging.getLogger("birds-backend")
+
+INFER_SOCKET = os.getenv("INFER_SOCKET", "/tmp/birds-infer/infer.sock")
+INFER_SERVERS = int(os.getenv("INFER_SERVERS", "1"))
+INFER_SHM_MB = int(os.getenv("INFER_SHM_MB", "64"))
+# Vacía => clave aleatoria en el fichero authkey junto a los sockets
+INFER_AUTHKEY = os.getenv("INFER_AUTHKEY", "").encode()
+INFER_CONNECT_TIMEOUT = float(os.getenv("INFER_CONNECT_TIMEOUT", "120"))
+# Motor que cargan los procesos servidor (vacío => según la extensión de MODEL_PATH)
+INFER_SERVER_ENGINE = os.getenv("INFER_SERVER_ENGINE", "").strip().lower() or None
+INFER_IMGSZ = 640  # el mismo que main.INFER_IMGSZ
+_ALIGN = 64
+
+
+def _address(index: int) -> str:
+    return f"{INFER_SOCKET}.{index}"
+
+
+def _socket_dir() -> str:
+    return os.path.dirname(os.path.abspath(INFER_SOCKET))
+
+
+def _key_path() -> str:
+    return os.path.join(_socket_dir(), "authkey")
+
+
+def _private_dir():
+    # Directorio de los sockets solo accesible para este usuario; si es de otro, no se arranca
+    path = _socket_dir()
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.stat(path)
+    if st.st_uid != os.getuid():
+        raise RuntimeError(f"{path} pertenece a otro usuario; usa un INFER_SOCKET en un directorio propio")
+    if stat.S_IMODE(st.st_mode) & 0o077:
+        os.chmod(path, 0o700)
+
+
+def _server_authkey() -> bytes:
+    # La clave configurada o, si no hay, la del fichero authkey (se crea la primera vez)
+    if INFER_AUTHKEY:
+        return INFER_AUTHKEY
+    path = _key_path()
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        pass
+    else:
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+    with open(path, "r") as f:
+        return f.read().strip().encode()
+
+
+def _client_authkey() -> bytes | None:
+    # None mientras el servidor no haya creado el fichero
+    if INFER_AUTHKEY:
+        return INFER_AUTHKEY
+    try:
+        with open(_key_path(), "r") as f:
+            return f.read().strip().encode() or None
+    except OSError:
+        return None
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    shm = shared_memory.SharedMemory(name=name)
+    # El segmento es del cliente: que el resource_tracker de este proceso no lo borre al salir
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+# ---------------- Servidor ----------------
+def _serve_connection(conn, predict, info: dict):
+    shm = None
+    try:
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                return
+            op = msg[0]
+            if op == "hello":
+                shm = _attach(msg[1])
+                conn.send(("ok", info))
+            elif op == "predict":
+                _, layout, conf = msg
+                images = [
+                    item if isinstance(item, np.ndarray)
+                    else np.ndarray(item[1], dtype=np.uint8, buffer=shm.buf, offset=item[0])
+                    for item in layout
+                ]
+                try:
+                    reply = ("ok", predict(images, conf))
+                except Exception as e:
+                    log.exception("infer: error en predict")
+                    reply = ("error", str(e))
+                del images
+                conn.send(reply)
+            else:
+                conn.send(("error", f"Operación desconocida: {op}"))
+    finally:
+        conn.close()
+        if shm is not None:
+            try:
+                shm.close()
+            except BufferError:
+                pass  # el motor aún referencia el último lote; se libera con el proceso
+
+
+def serve(index: int, threads: int | None = None):
+    from engines import load_engine
+    from batching import BatchPredictor
+    from registry import file_sha256
+
+    logging.basicConfig(level=logging.INFO)
+    model_path = os.getenv("MODEL_PATH", "best.pt")
+    engine = load_engine(model_path, INFER_IMGSZ, INFER_SERVER_ENGINE, threads)
+    # Los lotes de todos los clientes conectados a este proceso se vuelven a agrupar aquí
+    predictor = BatchPredictor(engine.predict, int(os.getenv("INFER_MAX_BATCH", "8")),
+                               float(os.getenv("INFER_MAX_WAIT_MS", "5")))
+    info = {"engine": engine.name, "names": engine.names, "imgsz": engine.imgsz,
+            "model_sha256": file_sha256(model_path)}
+
+    _private_dir()
+    authkey = _server_authkey()
+    address = _address(index)
+    if os.path.exists(address):
+        os.remove(address)
+    old_umask = os.umask(0o177)  # el socket nace 0600
+    try:
+        listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    finally:
+        os.umask(old_umask)
+    os.chmod(address, 0o600)
+    with listener:
+        log.info("infer: servidor %d (%s) escuchando en %s", index, engine.name, address)
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, AuthenticationError) as e:
+                log.warning("infer: conexión rechazada: %s", e)
+                continue
+            threading.Thread(target=_serve_connection, args=(conn, predictor.predict, info), daemon=True).start()
+
+
+# ---------------- Cliente ----------------
+class RemoteEngine:
+    # Mismo interfaz que los motores de engines.py; un cliente (conexión + segmento) por proceso
+    name = "remote"
+
+    def __init__(self, timeout: float = INFER_CONNECT_TIMEOUT):
+        self.timeout = timeout
+        self.names = {}
+        self.imgsz = INFER_IMGSZ
+        self.model_sha256 = None
+        self._conn = None
+        self._shm = None
+        self._lock = threading.Lock()
+        self._connect()
+        atexit.register(self.close)
+
+    def _connect(self):
+        # El proceso i empieza por el servidor pid % INFER_SERVERS y prueba los demás si no responde
+        first = os.getpid() % max(1, INFER_SERVERS)
+        order = [(first + k) % max(1, INFER_SERVERS) for k in range(max(1, INFER_SERVERS))]
+        deadline = time.monotonic() + self.timeout
+        while True:
+            authkey = _client_authkey()
+            for i in order if authkey else ():
+                try:
+                    conn = Client(_address(i), family="AF_UNIX", authkey=authkey)
+                except (OSError, EOFError, AuthenticationError):
+                    continue
+                shm = shared_memory.SharedMemory(create=True, size=INFER_SHM_MB * 1024 * 1024)
+                try:
+                    conn.send(("hello", shm.name))
+                    status, info = conn.recv()
+                except (OSError, EOFError):
+                    conn.close()
+                    shm.close()
+                    shm.unlink()
+                    continue
+                self._conn, self._shm = conn, shm
+                self.name = f"remote:{info['engine']}"
+                self.names = info["names"]
+                self.imgsz = info["imgsz"]
+                self.model_sha256 = info["model_sha256"]
+                log.info("infer: conectado a %s (%s)", _address(i), info["engine"])
+                return
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"No hay servidor de inferencia en {INFER_SOCKET}.* (python infer_server.py)")
+            time.sleep(0.5)
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except OSError:
+                pass
+            self._conn = None
+        if self._shm is not None:
+            self._shm.close()
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+            self._shm = None
+
+    def _request(self, images: list, conf: float) -> list[list[dict]]:
+        # Se copian en el segmento tantos frames como quepan; los que no, en otra petición.
+        # Un frame mayor que el segmento entero va serializado por el socket
+        out = []
+        start = 0
+        buf = self._shm.buf
+        while start < len(images):
+            layout, offset, end = [], 0, start
+            while end < len(images):
+                img = np.ascontiguousarray(images[end], dtype=np.uint8)
+                if offset + img.nbytes > self._shm.size:
+                    if not layout:
+                        layout.append(img)
+                        end += 1
+                    break
+                np.ndarray(img.shape, dtype=np.uint8, buffer=buf, offset=offset)[...] = img
+                layout.append((offset, img.shape))
+                offset += -(-img.nbytes // _ALIGN) * _ALIGN
+                end += 1
+            self._conn.send(("predict", layout, float(conf)))
+            status, payload = self._conn.recv()
+            if status != "ok":
+                raise RuntimeError(f"Servidor de inferencia: {payload}")
+            out.extend(payload)
+            start = end
+        return out
+
+    def predict(self, images: list, conf: float) -> list[list[dict]]:
+        with self._lock:
+            try:
+                return self._request(images, conf)
+            except (OSError, EOFError):
+                # Servidor reiniciado: nueva conexión (y segmento) y un reintento
+                log.warning("infer: conexión perdida, reconectando")
+                self.close()
+                self._connect()
+                return self._request(images, conf)
+
+
+def run():
+    threads = max(1, (os.cpu_count() or 1) // max(1, INFER_SERVERS))
+    # Directorio y clave antes de lanzar los procesos: todos comparten la misma
+    _private_dir()
+    _server_authkey()
+    if INFER_SERVERS <= 1:
+        serve(0)
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=serve, args=(i, threads), name=f"infer-server-{i}") for i in range(INFER_SERVERS)]
+    for p in procs:
+        p.start()
+
+    def _terminate(signum, frame):
+        for p in procs:
+            p.terminate()
+
+    signal.signal(signal.SIGTERM, _terminate)
+    signal.signal(signal.SIGINT, _terminate)
+    for p in procs:
+        p.join()
+
+
+if __name__ == "__main__":
+    run()
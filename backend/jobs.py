@@ -0,0 +1,541 @@
+# Cola de jobs en la base de datos: la API inserta, los workers (hilos del propio proceso
+# o procesos de worker.py) reclaman con SELECT ... FOR UPDATE SKIP LOCKED en PostgreSQL.
+# En SQLite (dev/tests) no hay bloqueo de filas: el UPDATE condicional (state='queued')
+# hace de reclamo atómico y quien lo pierde vuelve a intentarlo.
+# Orden de reclamo (reparto justo + trabajo más corto primero): primero el usuario que menos
+# coste ha consumido en la última ventana y, dentro de eso, el job de menor coste; la espera
+# en cola va rebajando la prioridad consumida para que nada se quede sin servir.
+import os
+import json
+import time
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.exc import IntegrityError
+
+from db import SessionLocal
+from models import Job, JobWatcher, JobPartial
+from events import hub
+
+
+log = logging.getLogger("birds-backend")
+
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1.0"))
+# Un job "running" sin latido en este tiempo se considera huérfano (worker caído). El worker
+# renueva updated_at cada JOB_HEARTBEAT_SECONDS mientras el job siga vivo, aunque no informe
+# de progreso (esperando turno, transcodificando, un trozo largo)
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "600"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+JOB_FAIR_WINDOW_SECONDS = float(os.getenv("JOB_FAIR_WINDOW_SECONDS", "3600"))
+# Cada JOB_AGING_SECONDS en cola, el consumo del usuario pesa la mitad, un tercio...
+JOB_AGING_SECONDS = float(os.getenv("JOB_AGING_SECONDS", "600"))
+# El coste de un job son las inferencias que se esperan (frames con stride o imágenes). Para la
+# ETA se mide cuánto tarda cada inferencia en cada tipo de job; este valor, mientras no haya
+# jobs terminados de ese tipo con los que medir
+JOB_DEFAULT_SECONDS_PER_INFERENCE = float(os.getenv("JOB_DEFAULT_SECONDS_PER_INFERENCE", "0.05"))
+# Posición y ETA de toda la cola se calculan de una vez y se reutilizan durante este tiempo
+JOB_QUEUE_INFO_SECONDS = float(os.getenv("JOB_QUEUE_INFO_SECONDS", "2.0"))
+_SCHEDULER_WINDOW = 500  # jobs en cola que se consideran por reclamo
+
+_RESTARTABLE = ("done", "error", "cancelled")
+
+_queue_snapshot = None  # ver _queue_info_snapshot
+_queue_snapshot_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _job_dict(j: Job, partial: list) -> dict:
+    return {
+        "job_id": j.id,
+        "user_id": j.user_id,
+        "kind": j.kind,
+        "state": j.state,
+        "progress": j.progress,
+        "message": j.message,
+        "result": json.loads(j.result_json) if j.result_json else None,
+        "partial": partial,
+        "error": j.error,
+        "created_at": j.created_at,
+        "updated_at": j.updated_at,
+    }
+
+
+def create_job(job_id: str, user_id: str, kind: str, params: dict | None = None, state: str = "queued",
+               progress: float = 0.0, message: str = "En cola", result=None):
+    # Mismo job_id (mismo contenido y parámetros) => se reinicia la fila
+    now = datetime.utcnow()
+    fields = {
+        "cost": 0.0,
+        "cancel_requested": False,
+        "user_id": user_id,
+        "kind": kind,
+        "state": state,
+        "progress": progress,
+        "message": message,
+        "error": None,
+        "params_json": json.dumps(params or {}),
+        "result_json": json.dumps(result, ensure_ascii=False) if result is not None else None,
+        "worker_id": None,
+        "created_at": now,
+        "started_at": None,
+        "updated_at": now,
+    }
+    for _ in range(2):
+        db = SessionLocal()
+        try:
+            j = db.get(Job, job_id)
+            if j is None:
+                db.add(Job(id=job_id, **fields))
+            else:
+                for k, v in fields.items():
+                    setattr(j, k, v)
+            db.execute(delete(JobPartial).where(JobPartial.job_id == job_id))
+            db.commit()
+            return
+        except IntegrityError:
+            # Otro proceso insertó el mismo id a la vez: se reintenta como actualización
+            db.rollback()
+        finally:
+            db.close()
+
+
+def submit_job(job_id: str, user_id: str, kind: str, params: dict, cost: float = 0.0) -> bool:
+    # Single-flight: True si hay que procesarlo (nuevo, o reintento de uno terminado/fallido/cancelado);
+    # False si ya hay un job activo con este id y el usuario se une a él como watcher
+    now = datetime.utcnow()
+    fields = {
+        "cost": float(cost),
+        "cancel_requested": False,
+        "user_id": user_id,
+        "kind": kind,
+        "state": "queued",
+        "progress": 0.0,
+        "message": "En cola",
+        "error": None,
+        "params_json": json.dumps(params),
+        "result_json": None,
+        "worker_id": None,
+        "created_at": now,
+        "started_at": None,
+        "updated_at": now,
+    }
+    while True:
+        db = SessionLocal()
+        try:
+            try:
+                db.add(Job(id=job_id, **fields))
+                db.commit()
+                _invalidate_queue_info()
+                return True
+            except IntegrityError:
+                db.rollback()
+
+            res = db.execute(
+                update(Job).where(Job.id == job_id, Job.state.in_(_RESTARTABLE)).values(**fields)
+            )
+            if res.rowcount == 1:
+                db.execute(delete(JobWatcher).where(JobWatcher.job_id == job_id))
+                db.execute(delete(JobPartial).where(JobPartial.job_id == job_id))
+                db.commit()
+                _invalidate_queue_info()
+                return True
+            db.commit()
+        finally:
+            db.close()
+
+        if add_job_user(job_id, user_id):
+            return False
+        # El job desapareció entre medias: se vuelve a intentar la inserción
+
+
+def add_job_user(job_id: str, user_id: str) -> bool:
+    # False si el job no existe
+    db = SessionLocal()
+    try:
+        j = db.get(Job, job_id)
+        if j is None:
+            return False
+        if j.user_id != user_id and db.get(JobWatcher, (job_id, user_id)) is None:
+            db.add(JobWatcher(job_id=job_id, user_id=user_id))
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+        return True
+    finally:
+        db.close()
+
+
+def job_users(job_id: str) -> list[str]:
+    # Propietario + watchers
+    db = SessionLocal()
+    try:
+        j = db.get(Job, job_id)
+        if j is None:
+            return []
+        watchers = db.execute(select(JobWatcher.user_id).where(JobWatcher.job_id == job_id)).scalars().all()
+        return [j.user_id] + [u for u in watchers if u != j.user_id]
+    finally:
+        db.close()
+
+
+def update_job(job_id: str, **kwargs):
+    # En las actualizaciones de progreso se comprueba la cancelación: lanza JobCancelled
+    values = {k: v for k, v in kwargs.items() if k in ("state", "progress", "message", "error")}
+    if "result" in kwargs:
+        result = kwargs["result"]
+        values["result_json"] = json.dumps(result, ensure_ascii=False) if result is not None else None
+    values["updated_at"] = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        db.execute(update(Job).where(Job.id == job_id).values(**values))
+        db.commit()
+        event = {k: kwargs[k] for k in ("state", "progress", "message", "error", "result") if k in kwargs}
+        hub.publish(job_id, {"type": "status", **event})
+        if values.get("state") not in _RESTARTABLE:
+            if db.execute(select(Job.cancel_requested).where(Job.id == job_id)).scalar():
+                raise JobCancelled(job_id)
+    finally:
+        db.close()
+
+
+def add_partial(job_id: str, item: dict):
+    # Un resultado parcial más (p. ej. un segmento que acaba de cerrarse): una fila nueva con el
+    # siguiente índice; si otro escritor se adelanta con el mismo índice, se reintenta
+    while True:
+        db = SessionLocal()
+        try:
+            if db.get(Job, job_id) is None:
+                return
+            index = db.execute(
+                select(func.coalesce(func.max(JobPartial.index) + 1, 0)).where(JobPartial.job_id == job_id)
+            ).scalar()
+            db.add(JobPartial(job_id=job_id, index=index, item_json=json.dumps(item, ensure_ascii=False)))
+            db.commit()
+            break
+        except IntegrityError:
+            db.rollback()
+        finally:
+            db.close()
+    hub.publish(job_id, {"type": "partial", "index": index, "item": item})
+
+
+def _partials(db, job_id: str) -> list:
+    rows = db.execute(
+        select(JobPartial.item_json).where(JobPartial.job_id == job_id).order_by(JobPartial.index)
+    ).scalars().all()
+    return [json.loads(r) for r in rows]
+
+
+def get_job(job_id: str) -> dict | None:
+    db = SessionLocal()
+    try:
+        j = db.get(Job, job_id)
+        return _job_dict(j, _partials(db, job_id)) if j is not None else None
+    finally:
+        db.close()
+
+
+def _user_service(db, now: datetime) -> dict:
+    # Coste consumido por usuario en la ventana (jobs arrancados, terminen o no)
+    since = now - timedelta(seconds=JOB_FAIR_WINDOW_SECONDS)
+    rows = db.execute(
+        select(Job.user_id, Job.cost).where(Job.started_at.is_not(None), Job.started_at >= since)
+    ).all()
+    service = {}
+    for user_id, cost in rows:
+        service[user_id] = service.get(user_id, 0.0) + (cost or 0.0)
+    return service
+
+
+def _priority(row, service: dict, now: datetime) -> tuple:
+    wait = max(0.0, (now - row.created_at).total_seconds())
+    return (service.get(row.user_id, 0.0) / (1.0 + wait / JOB_AGING_SECONDS), row.cost, row.created_at)
+
+
+def _queue_order(rows: list, service: dict, now: datetime) -> list:
+    # Orden en que se reclamarían los jobs en cola si no llegara nada nuevo
+    service = dict(service)
+    pending = list(rows)
+    order = []
+    while pending:
+        best = min(pending, key=lambda r: _priority(r, service, now))
+        pending.remove(best)
+        order.append(best)
+        service[best.user_id] = service.get(best.user_id, 0.0) + (best.cost or 0.0)
+    return order
+
+
+def _queued_rows(db, kinds: list[str] | None = None, lock: bool = False) -> list:
+    q = select(Job.id, Job.user_id, Job.kind, Job.params_json, Job.cost, Job.created_at).where(Job.state == "queued")
+    if kinds is not None:
+        q = q.where(Job.kind.in_(kinds))
+    q = q.order_by(Job.created_at).limit(_SCHEDULER_WINDOW)
+    if lock and db.get_bind().dialect.name == "postgresql":
+        q = q.with_for_update(skip_locked=True)
+    return db.execute(q).all()
+
+
+def claim_job(worker_id: str, kinds: list[str]) -> tuple[str, str, dict] | None:
+    db = SessionLocal()
+    try:
+        rows = _queued_rows(db, kinds, lock=True)
+        if not rows:
+            db.rollback()
+            return None
+        now = datetime.utcnow()
+        service = _user_service(db, now)
+        row = min(rows, key=lambda r: _priority(r, service, now))
+        res = db.execute(
+            update(Job)
+            .where(Job.id == row.id, Job.state == "queued")
+            .values(state="running", worker_id=worker_id, started_at=now, updated_at=now)
+        )
+        if res.rowcount == 1:
+            db.execute(delete(JobPartial).where(JobPartial.job_id == row.id))
+        db.commit()
+        if res.rowcount != 1:
+            return None
+        _invalidate_queue_info()
+        return row.id, row.kind, json.loads(row.params_json or "{}")
+    finally:
+        db.close()
+
+
+def _seconds_per_inference(db) -> dict:
+    # kind -> segundos por unidad de coste, media de los últimos jobs terminados (duración / coste).
+    # Por tipo: un frame de vídeo anotado (decodificar, dibujar, codificar) no cuesta lo mismo
+    # que una imagen de un lote
+    rows = db.execute(
+        select(Job.kind, Job.started_at, Job.updated_at, Job.cost)
+        .where(Job.state == "done", Job.started_at.is_not(None), Job.cost > 0)
+        .order_by(Job.updated_at.desc())
+        .limit(100)
+    ).all()
+    samples = {}
+    for kind, s, u, c in rows:
+        if u > s and len(samples.setdefault(kind, [])) < 20:
+            samples[kind].append((u - s).total_seconds() / c)
+    return {kind: sum(v) / len(v) for kind, v in samples.items()}
+
+
+def _seconds(spi: dict, kind: str, cost: float) -> float:
+    return (cost or 0.0) * spi.get(kind, JOB_DEFAULT_SECONDS_PER_INFERENCE)
+
+
+def _invalidate_queue_info():
+    # La cola cambió en este proceso (alta, reclamo, cancelación): la próxima consulta recalcula
+    global _queue_snapshot
+    _queue_snapshot = None
+
+
+def _queue_info_snapshot(db, workers: int) -> dict:
+    # Posición y ETA de todos los jobs en cola con una sola pasada del planificador. Los
+    # sondeos de /status y los streams SSE la comparten durante JOB_QUEUE_INFO_SECONDS (los
+    # cambios de otros procesos se ven como mucho con ese retraso)
+    global _queue_snapshot
+    with _queue_snapshot_lock:
+        snap = _queue_snapshot
+        if (snap is not None and snap["workers"] == workers
+                and time.monotonic() - snap["at"] < JOB_QUEUE_INFO_SECONDS):
+            return snap
+
+        now = datetime.utcnow()
+        spi = _seconds_per_inference(db)
+        order = _queue_order(_queued_rows(db), _user_service(db, now), now)
+        running = db.execute(select(Job.kind, Job.cost, Job.progress).where(Job.state == "running")).all()
+        backlog = sum(_seconds(spi, k, c) * (1.0 - p) for k, c, p in running)
+        queued = {}
+        for pos, r in enumerate(order):
+            own = _seconds(spi, r.kind, r.cost)
+            queued[r.id] = {"queue_position": pos + 1, "eta_seconds": round(backlog / max(1, workers) + own, 1)}
+            backlog += own
+        snap = _queue_snapshot = {"at": time.monotonic(), "now": now, "workers": workers, "spi": spi,
+                                  "queued": queued}
+        return snap
+
+
+def queue_info(job_id: str, workers: int) -> dict:
+    # Posición en cola (1 = el siguiente) y ETA en segundos hasta terminar
+    db = SessionLocal()
+    try:
+        j = db.get(Job, job_id)
+        if j is None or j.state not in ("queued", "running"):
+            return {"queue_position": None, "eta_seconds": None}
+        snap = _queue_info_snapshot(db, workers)
+        if j.state == "running":
+            return {"queue_position": 0, "eta_seconds": round(_seconds(snap["spi"], j.kind, j.cost) * (1.0 - j.progress), 1)}
+
+        info = snap["queued"].get(job_id)
+        if info is None and j.created_at > snap["now"]:
+            # Encolado después de la foto (p. ej. por otro proceso de la API)
+            _invalidate_queue_info()
+            info = _queue_info_snapshot(db, workers)["queued"].get(job_id)
+        return dict(info) if info is not None else {"queue_position": None, "eta_seconds": None}
+    finally:
+        db.close()
+
+
+def cancel_job(job_id: str, user_id: str) -> tuple[str, dict]:
+    # Un usuario unido al job solo se desvincula; si el propietario cancela y hay otros
+    # usuarios esperando, el job pasa al más antiguo. Devuelve (resultado, params del job)
+    db = SessionLocal()
+    try:
+        j = db.get(Job, job_id)
+        if j is None:
+            return "not_found", {}
+        params = json.loads(j.params_json or "{}")
+        if j.state not in ("queued", "running"):
+            return j.state, params
+
+        if j.user_id != user_id:
+            db.execute(delete(JobWatcher).where(JobWatcher.job_id == job_id, JobWatcher.user_id == user_id))
+            db.commit()
+            return "detached", params
+
+        heir = db.execute(
+            select(JobWatcher).where(JobWatcher.job_id == job_id).order_by(JobWatcher.created_at).limit(1)
+        ).scalar_one_or_none()
+        if heir is not None:
+            j.user_id = heir.user_id
+            db.delete(heir)
+            db.commit()
+            return "detached", params
+
+        now = datetime.utcnow()
+        res = db.execute(
+            update(Job).where(Job.id == job_id, Job.state == "queued")
+            .values(state="cancelled", message="Cancelado", updated_at=now)
+        )
+        if res.rowcount == 1:
+            db.commit()
+            _invalidate_queue_info()
+            return "cancelled", params
+        db.execute(
+            update(Job).where(Job.id == job_id, Job.state == "running")
+            .values(cancel_requested=True, message="Cancelando...", updated_at=now)
+        )
+        db.commit()
+        return "cancelling", params
+    finally:
+        db.close()
+
+
+def heartbeat(job_id: str, worker_id: str) -> bool:
+    # Renueva la concesión del job; False si ya no es de este worker (reencolado y reclamado por otro)
+    db = SessionLocal()
+    try:
+        res = db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.state == "running", Job.worker_id == worker_id)
+            .values(updated_at=datetime.utcnow())
+        )
+        db.commit()
+        return res.rowcount == 1
+    finally:
+        db.close()
+
+
+def _heartbeat_loop(job_id: str, worker_id: str, done: threading.Event, interval: float):
+    while not done.wait(interval):
+        try:
+            if not heartbeat(job_id, worker_id):
+                log.warning("jobs: el job %s ya no pertenece a %s", job_id, worker_id)
+                return
+        except Exception as e:
+            log.warning("jobs: error renovando el job %s: %s", job_id, e)
+
+
+def requeue_stale(stale_seconds: float = JOB_STALE_SECONDS) -> int:
+    # Jobs cuyo worker dejó de latir (reinicio, OOM, máquina caída): vuelven a la cola.
+    # Un worker vivo renueva updated_at cada JOB_HEARTBEAT_SECONDS, así que no se reencola
+    cutoff = datetime.utcnow() - timedelta(seconds=stale_seconds)
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(Job)
+            .where(Job.state == "running", Job.updated_at < cutoff, Job.cancel_requested.is_(True))
+            .values(state="cancelled", message="Cancelado", updated_at=datetime.utcnow())
+        )
+        res = db.execute(
+            update(Job)
+            .where(Job.state == "running", Job.updated_at < cutoff)
+            .values(state="queued", worker_id=None, message="Reencolado (worker caído)", updated_at=datetime.utcnow())
+        )
+        db.commit()
+        if res.rowcount:
+            _invalidate_queue_info()
+            log.warning("jobs: %d jobs huérfanos reencolados", res.rowcount)
+        return res.rowcount
+    finally:
+        db.close()
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+
+
+def _run_claimed(handlers: dict, wid: str, job_id: str, kind: str, params: dict):
+    done = threading.Event()
+    threading.Thread(target=_heartbeat_loop, args=(job_id, wid, done, JOB_HEARTBEAT_SECONDS),
+                     name=f"job-heartbeat-{job_id[:8]}", daemon=True).start()
+    try:
+        handlers[kind](job_id, **params)
+    except JobCancelled:
+        update_job(job_id, state="cancelled", message="Cancelado")
+    except Exception as e:
+        log.exception("jobs: job %s falló", job_id)
+        try:
+            update_job(job_id, state="error", progress=1.0, error=str(e))
+        except Exception:
+            pass
+    finally:
+        done.set()
+
+
+def run_worker(handlers: dict, stop: threading.Event | None = None, poll_seconds: float = JOB_POLL_SECONDS,
+               slots: threading.Semaphore | None = None):
+    # handlers: kind -> fn(job_id, **params); la función informa del progreso y del estado final.
+    # slots: semáforo de jobs pesados del proceso; solo se reclama un job con un hueco libre,
+    # así un job reclamado nunca espera turno con el estado "running"
+    wid = worker_id()
+    kinds = list(handlers)
+    last_requeue = 0.0
+    log.info("jobs: worker %s escuchando %s", wid, kinds)
+    while stop is None or not stop.is_set():
+        if slots is not None and not slots.acquire(timeout=poll_seconds):
+            continue
+        try:
+            try:
+                if time.time() - last_requeue > 60:
+                    requeue_stale()
+                    last_requeue = time.time()
+                claimed = claim_job(wid, kinds)
+            except Exception as e:
+                log.warning("jobs: error reclamando job: %s", e)
+                claimed = None
+            if claimed is not None:
+                _run_claimed(handlers, wid, *claimed)
+        finally:
+            if slots is not None:
+                slots.release()
+
+        if claimed is None:
+            if stop is not None:
+                stop.wait(poll_seconds)
+            else:
+                time.sleep(poll_seconds)
+
+
+def start_worker_threads(handlers: dict, n: int, slots: threading.Semaphore | None = None) -> threading.Event:
+    stop = threading.Event()
+    for i in range(n):
+        threading.Thread(target=run_worker, args=(handlers, stop, JOB_POLL_SECONDS, slots),
+                         name=f"job-worker-{i}", daemon=True).start()
+    return stop
@@ -0,0 +1,44 @@
+# Carga de las conexiones de directo (/ws/frames): cuántas hay abiertas y cuánto tarda la
+# inferencia de un frame (media móvil). Con eso se sugiere a cada cliente cada cuánto enviar
+# para que entre todas no pidan más frames de los que el modelo puede servir.
+import os
+import threading
+
+
+LIVE_MIN_INTERVAL_MS = int(os.getenv("LIVE_MIN_INTERVAL_MS", "150"))
+LIVE_MAX_INTERVAL_MS = int(os.getenv("LIVE_MAX_INTERVAL_MS", "2000"))
+LIVE_MAX_FRAME_MB = float(os.getenv("LIVE_MAX_FRAME_MB", "2"))
+LIVE_MAX_FRAME_BYTES = int(LIVE_MAX_FRAME_MB * 1024 * 1024)
+_EWMA_ALPHA = 0.2
+_HEADROOM = 1.2  # margen para no ir justo al límite del modelo
+
+
+class LiveLoad:
+    def __init__(self, infer_slots: int = 1):
+        self.infer_slots = max(1, infer_slots)  # inferencias que pueden ir en paralelo
+        self.connections = 0
+        self.infer_ms = None
+        self._lock = threading.Lock()
+
+    def connect(self):
+        with self._lock:
+            self.connections += 1
+
+    def disconnect(self):
+        with self._lock:
+            self.connections = max(0, self.connections - 1)
+
+    def observe(self, infer_ms: float):
+        with self._lock:
+            if self.infer_ms is None:
+                self.infer_ms = infer_ms
+            else:
+                self.infer_ms += _EWMA_ALPHA * (infer_ms - self.infer_ms)
+
+    def suggested_interval_ms(self) -> int:
+        with self._lock:
+            if self.infer_ms is None:
+                return LIVE_MIN_INTERVAL_MS
+            ms = self.infer_ms * max(1, self.connections) / self.infer_slots * _HEADROOM
+        return int(min(LIVE_MAX_INTERVAL_MS, max(LIVE_MIN_INTERVAL_MS, ms)))
+
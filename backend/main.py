@@ -1,27 +1,60 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, Body
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, Body, Request, Query, WebSocket, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import conint, confloat
 from sqlalchemy.orm import Session
 import numpy as np
 
 import os
+import math
 import time
+import asyncio
+import copy
 import json
 import hashlib
+import uuid
 import tempfile
+import shutil
 import threading
 import subprocess
 import logging
+import zipfile
+import multiprocessing
+from collections import deque
+from functools import partial
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 
 import cv2
-from ultralytics import YOLO
 from dotenv import load_dotenv
 load_dotenv()
 
 from db import Base, engine, get_db, SessionLocal
 from models import User, Analysis, Post
-from auth import hash_password, verify_password, create_access_token, get_current_user
+from auth import (
+    hash_password, verify_password, create_access_token, get_current_user, get_current_user_stream, user_from_token,
+)
+from tracker import IouTracker
+from detstore import DetectionWriter, DetectionStore, store_paths
+from uploads import UPLOAD_DIR, create_upload, upload_info, append_upload, finish_upload
+from jobs import (
+    JobCancelled, create_job, submit_job, add_job_user, job_users, update_job, add_partial, get_job, queue_info,
+    cancel_job, start_worker_threads,
+)
+from events import hub
+from live import LIVE_MAX_FRAME_BYTES, LiveLoad
+from admission import BoundedExecutor, Saturated
+from registry import ModelRegistry
+from stats import StatsAccumulator, video_stats
+from decoding import ImageTooLarge, decode_image
+from resultcache import ResultCache, result_key
+from sampling import make_sampler
+from video import (
+    run_pipeline, run_detections, filter_dets, compact_detections,
+    open_writer, discard_writer, transcode_h264, concat_mp4,
+    plan_chunks, init_chunk_worker, detect_chunk, render_chunk,
+)
 
 
 # ---------------- Logging ----------------
@@ -37,6 +70,14 @@ FRONTEND_ORIGINS = [o.strip() for o in FRONTEND_ORIGINS.split(",") if o.strip()]
 
 MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "1"))
 job_sema = threading.Semaphore(MAX_CONCURRENT_JOBS)
+# thread: la API ejecuta MAX_CONCURRENT_JOBS workers en hilos propios;
+# external: la API solo encola y los jobs los procesa worker.py (otros procesos/máquinas)
+JOB_RUNNER = os.getenv("JOB_RUNNER", "thread").strip().lower()
+# Workers que consumen la cola en total (API + worker.py); solo se usa para la ETA
+JOB_CAPACITY = int(os.getenv("JOB_CAPACITY", str(MAX_CONCURRENT_JOBS)))
+# Streams de estado (/status/{id}/events): relectura de la DB (jobs de worker.py) y keepalive
+JOB_EVENTS_POLL_SECONDS = float(os.getenv("JOB_EVENTS_POLL_SECONDS", "2.0"))
+JOB_EVENTS_KEEPALIVE_SECONDS = 15.0
 
 
 # ---------------- FastAPI + CORS ----------------
@@ -67,9 +108,44 @@ app.add_middleware(
 
 # ---------------- YOLO model ----------------
 MODEL_PATH = os.getenv("MODEL_PATH", "best.pt")
-log.info("Cargando modelo YOLO...")
-model = YOLO(MODEL_PATH)
-log.info("Modelo YOLO cargado: %s", MODEL_PATH)
+# ultralytics | onnxruntime | openvino | remote (ver engines.py); vacío => según la extensión de MODEL_PATH.
+# Con remote el modelo lo sirve infer_server.py y este proceso no carga torch ni los pesos
+INFER_ENGINE = os.getenv("INFER_ENGINE", "").strip().lower() or None
+INFER_IMGSZ = 640
+# El modelo se carga en segundo plano al arrancar (0 => en la primera inferencia) y con
+# MODEL_WARMUP_RUNS inferencias de prueba por tamaño de lote antes de servir
+MODEL_PRELOAD = os.getenv("MODEL_PRELOAD", "1").strip().lower() in ("1", "true", "yes")
+MODEL_WARMUP_RUNS = int(os.getenv("MODEL_WARMUP_RUNS", "2"))
+MODEL_LOADING_RETRY_SECONDS = 5  # Retry-After de los envíos de vídeo que llegan durante la carga inicial
+# POST /model/swap exige este token en X-Admin-Token (vacío => desactivado)
+MODEL_ADMIN_TOKEN = os.getenv("MODEL_ADMIN_TOKEN", "")
+MODEL_POINTER_CHECK_SECONDS = float(os.getenv("MODEL_POINTER_CHECK_SECONDS", "5"))
+# Micro-batching entre peticiones: tamaño máximo del lote y espera máxima para completarlo
+INFER_MAX_BATCH = int(os.getenv("INFER_MAX_BATCH", "8"))
+INFER_MAX_WAIT_MS = float(os.getenv("INFER_MAX_WAIT_MS", "5"))
+# Decodificación + inferencia de /predict_image, /predict_frame_fast y /ws/frames: hilos propios y
+# tope de peticiones esperando; por encima se responde 503 con Retry-After
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(INFER_MAX_BATCH)))
+IMAGE_QUEUE_LIMIT = int(os.getenv("IMAGE_QUEUE_LIMIT", "16"))
+# Imágenes con más píxeles (según la cabecera) se rechazan con 413 antes de decodificarlas
+IMAGE_MAX_PIXELS = int(float(os.getenv("IMAGE_MAX_MEGAPIXELS", "100")) * 1_000_000)
+# /predict_images: imágenes por petición, a partir de cuántas va como job (solo un ZIP), tamaño
+# máximo por imagen y del ZIP guardado para el job, e imágenes de un lote a la vez en image_executor
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "5000"))
+BATCH_SYNC_MAX_IMAGES = int(os.getenv("BATCH_SYNC_MAX_IMAGES", "200"))
+BATCH_MAX_IMAGE_BYTES = int(os.getenv("BATCH_MAX_IMAGE_MB", "50")) * 1024 * 1024
+BATCH_MAX_ARCHIVE_BYTES = int(os.getenv("BATCH_MAX_ARCHIVE_MB", "2048")) * 1024 * 1024
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", str(INFER_MAX_BATCH)))
+# Sin hueco en image_executor ni imágenes propias en vuelo, un lote espera como mucho esto por
+# cada imagen; después esa imagen sale con error 503 y el lote sigue
+BATCH_SLOT_WAIT_SECONDS = float(os.getenv("BATCH_SLOT_WAIT_SECONDS", "30"))
+BATCH_IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff")
+# Cache de resultados por contenido (imágenes y frames): LRU en memoria (entradas y MB) y,
+# si se indica directorio, también en disco con su propio tope
+RESULT_CACHE_ENTRIES = int(os.getenv("RESULT_CACHE_ENTRIES", "2048"))
+RESULT_CACHE_MB = int(os.getenv("RESULT_CACHE_MB", "64"))
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "").strip()
+RESULT_CACHE_DISK_MB = int(os.getenv("RESULT_CACHE_DISK_MB", "512"))
 
 DEFAULT_MIN_CONF = 0.25
 DEFAULT_FRAME_STRIDE = 5
@@ -84,13 +160,36 @@ MAX_OUTPUT_HEIGHT = 720
 SEGMENT_GAP_SECONDS = 1.0
 TTL_MULT = 2  
 
+# Inferencia por lotes (frames con stride) + techo de memoria para frames en espera
+VIDEO_BATCH_SIZE = int(os.getenv("VIDEO_BATCH_SIZE", "8"))
+VIDEO_BATCH_MAX_MB = int(os.getenv("VIDEO_BATCH_MAX_MB", "512"))
+# Tamaño de las colas entre etapas (decoder -> inferencia -> anotación -> writer)
+VIDEO_QUEUE_SIZE = int(os.getenv("VIDEO_QUEUE_SIZE", "32"))
+# Encoder: "pipe" (frames por stdin a ffmpeg/libx264) o "opencv" (mp4v + transcode)
+VIDEO_ENCODER = os.getenv("VIDEO_ENCODER", "pipe").strip().lower()
+# Vídeos largos en trozos paralelos (process pool); <=1 desactiva
+VIDEO_CHUNK_WORKERS = int(os.getenv("VIDEO_CHUNK_WORKERS", "0"))
+VIDEO_CHUNK_MIN_SECONDS = float(os.getenv("VIDEO_CHUNK_MIN_SECONDS", "60"))
+# Tracker IoU/centroide: cajas extrapoladas entre inferencias + conteo por individuo
+VIDEO_TRACKING = os.getenv("VIDEO_TRACKING", "1").strip().lower() in ("1", "true", "yes")
+# Stride adaptativo con detección de movimiento: relaja el stride (hasta stride*MULT)
+# en escenas vacías y solo infiere antes si cambia más de THRESHOLD (fracción de píxeles)
+VIDEO_ADAPTIVE_STRIDE = os.getenv("VIDEO_ADAPTIVE_STRIDE", "0").strip().lower() in ("1", "true", "yes")
+VIDEO_MAX_STRIDE_MULT = int(os.getenv("VIDEO_MAX_STRIDE_MULT", "6"))
+VIDEO_MOTION_THRESHOLD = float(os.getenv("VIDEO_MOTION_THRESHOLD", "0.002"))
+# Las detecciones crudas se guardan con este umbral: cualquier conf >= se sirve filtrando
+VIDEO_RAW_MIN_CONF = float(os.getenv("VIDEO_RAW_MIN_CONF", "0.05"))
+
 # Outputs
 OUTPUT_DIR = os.path.abspath("./outputs")
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 OUTPUT_TTL_SECONDS = 24 * 60 * 60  # 24h
+# Modelo activo tras un /model/swap, para el resto de procesos (fuera del alcance del cleanup)
+MODEL_POINTER_FILE = os.getenv("MODEL_POINTER_FILE", os.path.join(OUTPUT_DIR, "model", "active.json"))
+os.makedirs(os.path.dirname(MODEL_POINTER_FILE), exist_ok=True)
 
-jobs = {}
-jobs_lock = threading.Lock()
+_chunk_pools = {}  # versión del modelo -> ProcessPoolExecutor
+_chunk_pool_lock = threading.Lock()
 
 
 # ---------------- Helpers ----------------
@@ -124,7 +223,7 @@ async def _stream_upload_to_tempfile_and_hash(file: UploadFile) -> tuple[str, st
     h = hashlib.sha256()
     total = 0
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=UPLOAD_DIR) as tmp:
         while True:
             chunk = await file.read(1024 * 1024)
             if not chunk:
@@ -141,38 +240,219 @@ async def _stream_upload_to_tempfile_and_hash(file: UploadFile) -> tuple[str, st
         return tmp.name, h.hexdigest(), total
 
 
-def _species_color(species: str) -> tuple[int, int, int]:
-    digest = hashlib.md5(species.encode("utf-8")).digest()
-    b = 80 + digest[0] % 176
-    g = 80 + digest[1] % 176
-    r = 80 + digest[2] % 176
-    return int(b), int(g), int(r)
+def _close_chunk_pool(mv):
+    # Versión de modelo retirada y sin jobs: sus procesos de trozos ya no hacen falta
+    with _chunk_pool_lock:
+        pool = _chunk_pools.pop(mv.version, None)
+    if pool is not None:
+        pool.shutdown(wait=False)
+
+
+# Todas las inferencias del proceso (imágenes, directo, vídeo) pasan por el BatchPredictor de la
+# versión activa y se agrupan en lotes; cada lote es una sola llamada al motor
+models = ModelRegistry(
+    MODEL_PATH, INFER_IMGSZ, INFER_ENGINE,
+    max_batch=INFER_MAX_BATCH,
+    max_wait_ms=INFER_MAX_WAIT_MS,
+    warmup_runs=MODEL_WARMUP_RUNS,
+    pointer_path=None if INFER_ENGINE == "remote" else MODEL_POINTER_FILE,
+    pointer_check_seconds=MODEL_POINTER_CHECK_SECONDS,
+    on_retire=_close_chunk_pool,
+)
+image_executor = BoundedExecutor(IMAGE_WORKERS, IMAGE_QUEUE_LIMIT, "image")
+result_cache = ResultCache(RESULT_CACHE_ENTRIES, RESULT_CACHE_MB * 1024 * 1024,
+                           RESULT_CACHE_DIR or None, RESULT_CACHE_DISK_MB * 1024 * 1024)
+
+
+@app.on_event("startup")
+def _start_model_load():
+    if MODEL_PRELOAD:
+        models.start()
 
 
-def _segments_from_times(times: list[float], gap_s: float) -> list[dict]:
-    if not times:
+def _predict_frames(frames: list, conf: float, mv=None) -> list[list[dict]]:
+    if not frames:
         return []
-    times = sorted(times)
-    segs = []
-    start = times[0]
-    last = times[0]
-    for t in times[1:]:
-        if (t - last) <= gap_s:
-            last = t
-        else:
-            segs.append({"start_time": start, "end_time": last})
-            start = last = t
-    segs.append({"start_time": start, "end_time": last})
-    return segs
+    return (mv or models.current()).predictor.predict(frames, conf)
+
+
+def _video_frame_budget(frame_w: int, frame_h: int) -> int:
+    # Máximo de frames retenidos en memoria mientras se llena un lote
+    frame_bytes = max(1, frame_w * frame_h * 3)
+    return max(1, (VIDEO_BATCH_MAX_MB * 1024 * 1024) // frame_bytes)
+
+
+def _video_batch_size(frame_w: int, frame_h: int) -> int:
+    return max(1, min(VIDEO_BATCH_SIZE, _video_frame_budget(frame_w, frame_h)))
+
+
+def _new_sampler(stride: int):
+    return make_sampler(stride, VIDEO_ADAPTIVE_STRIDE, VIDEO_MAX_STRIDE_MULT, VIDEO_MOTION_THRESHOLD)
+
+
+def _inference_info(frame_dets: list, frame_count: int, stride: int, reused: bool) -> dict:
+    # Inferencias hechas frente a las que haría el stride fijo
+    fixed = -(-frame_count // stride) if frame_count > 0 else len(frame_dets)
+    return {
+        "adaptive": VIDEO_ADAPTIVE_STRIDE,
+        "inferred_frames": len(frame_dets),
+        "fixed_stride_frames": fixed,
+        "skipped": max(0, fixed - len(frame_dets)),
+        "reused_detections": reused,
+    }
+
+
+def _ttl_frames(stride: int) -> int:
+    # Frames que se mantiene una caja/track sin volver a verse: TTL_MULT veces el hueco máximo
+    # entre inferencias (con stride adaptativo, el max_stride del sampler, no el stride pedido)
+    return TTL_MULT * _new_sampler(stride).max_stride
+
+
+def _new_tracker(stride: int):
+    return IouTracker(max_age=_ttl_frames(stride)) if VIDEO_TRACKING else None
+
+
+def _open_video(path: str):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError("No se pudo abrir el vídeo.")
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0)
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0)
+
+    duration = (frame_count / fps) if fps > 0 else 0.0
+    if duration > MAX_DURATION_SECONDS:
+        cap.release()
+        raise RuntimeError(f"Vídeo demasiado largo ({duration:.1f}s). Máximo {MAX_DURATION_SECONDS}s.")
+    return cap, fps, frame_count, width, height, duration
+
+
+def _output_size(width: int, height: int) -> tuple[int, int, float]:
+    scale = min(MAX_OUTPUT_WIDTH / width, MAX_OUTPUT_HEIGHT / height, 1.0)
+    out_w = int(width * scale)
+    out_h = int(height * scale)
+    out_w -= out_w % 2
+    out_h -= out_h % 2
+    if out_w <= 0 or out_h <= 0:
+        out_w, out_h = width, height
+    return out_w, out_h, scale
+
+
+# ---------------- Cache de vídeo ----------------
+# raw_key: (contenido, modelo, stride, imgsz, sampler) -> detecciones crudas a VIDEO_RAW_MIN_CONF.
+# artifact id: raw_key + conf + modo (+ tracking) -> JSON/mp4 finales (= video_id / job_id).
+def _active_model():
+    # Versión activa sin esperar a la carga: durante un cambio sigue la anterior y, mientras
+    # carga la primera, se responde 503 en vez de bloquear la petición
+    mv = models.peek()
+    if mv is None:
+        models.start()
+        raise HTTPException(status_code=503, detail="El modelo se está cargando. Reintenta en unos segundos.",
+                            headers={"Retry-After": str(MODEL_LOADING_RETRY_SECONDS)})
+    return mv
+
+
+def _raw_key(sha256_hex: str, stride: int) -> str:
+    # El sha de los pesos activos forma parte de la clave: pesos nuevos => detecciones nuevas
+    parts = [sha256_hex, _active_model().sha256[:16], f"s{stride}", f"i{INFER_IMGSZ}"]
+    if VIDEO_ADAPTIVE_STRIDE:
+        parts.append(f"a{VIDEO_MAX_STRIDE_MULT}-{VIDEO_MOTION_THRESHOLD:g}")
+    return "-".join(parts)
+
+
+def _pinned_raw_key(raw_key: str, mv) -> str:
+    # Si el modelo cambió entre el envío y el inicio del job, las detecciones crudas se guardan
+    # con la clave del modelo que realmente las calcula
+    sha256_hex, _, rest = raw_key.split("-", 2)
+    return "-".join([sha256_hex, mv.sha256[:16], rest])
+
+
+def _artifact_id(raw_key: str, conf: float, mode: str) -> str:
+    payload = json.dumps([raw_key, round(float(conf), 4), mode, VIDEO_TRACKING])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _raw_base(raw_key: str) -> str:
+    return os.path.join(OUTPUT_DIR, f"raw-{raw_key}")
+
+
+def _load_raw(raw_key: str, conf: float) -> DetectionStore | None:
+    # Solo sirve si se guardó con un umbral <= conf pedida
+    store = DetectionStore.open(_raw_base(raw_key))
+    if store is None or store.min_conf > conf:
+        return None
+    return store
+
+
+def _touch_raw(raw_key: str):
+    # Un job encolado sin vídeo depende de este almacén: se renueva su mtime para que
+    # _cleanup_old_outputs no lo borre mientras espera
+    for path in store_paths(_raw_base(raw_key)):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+
+def _filtered_tracked(store: DetectionStore, conf: float, stride: int) -> tuple[list, dict | None]:
+    # Detecciones a la conf pedida + track_id (el tracker solo depende de las detecciones)
+    # y los individuos por especie que cuenta el tracker (None sin tracking)
+    frame_dets = store.frame_dets(min_conf=conf)
+    tracker = _new_tracker(stride)
+    if tracker is None:
+        return frame_dets, None
+    for idx, dets in frame_dets:
+        tracker.update(idx, dets)
+    return frame_dets, tracker.species_individuals()
+
+
+def _job_create(job_id: str, user_id: str, kind: str, params: dict | None = None, state: str = "queued",
+                progress: float = 0.0, message: str = "En cola", result=None):
+    # Estado en la tabla jobs: visible desde cualquier proceso de la API y de los workers
+    create_job(job_id, user_id, kind, params, state=state, progress=progress, message=message, result=result)
 
 
 def _job_update(job_id: str, **kwargs):
-    with jobs_lock:
-        j = jobs.get(job_id)
-        if not j:
-            return
-        j.update(kwargs)
-        j["updated_at"] = time.time()
+    update_job(job_id, **kwargs)
+
+
+def _live_segments(job_id: str, conf: float, fps: float, raw_writer: DetectionWriter | None = None):
+    # on_detections que, además de guardar las crudas, publica cada segmento en cuanto se cierra
+    # (sin tracking; el resultado final se recalcula completo al terminar)
+    live = StatsAccumulator(fps, SEGMENT_GAP_SECONDS,
+                            on_segment=lambda seg: add_partial(job_id, {"type": "segment", **seg}))
+
+    def record(frame_idx, dets):
+        if raw_writer is not None:
+            raw_writer.add(frame_idx, dets)
+        live.add(frame_idx, filter_dets(dets, conf))
+
+    return record
+
+
+def _save_analysis(db: Session, user_id: str, video_id: str, mp4_path: str, result_json: str,
+                   conf: float, stride: int):
+    existing = db.query(Analysis).filter(Analysis.user_id == user_id, Analysis.video_id == video_id).first()
+    if not existing:
+        a = Analysis(
+            user_id=user_id,
+            video_id=video_id,
+            mp4_path=mp4_path,
+            result_json=result_json,
+            conf_used=float(conf),
+            stride_used=int(stride),
+        )
+        db.add(a)
+        db.commit()
+
+
+def _remove_upload(tmp_path: str):
+    try:
+        os.remove(tmp_path)
+    except Exception:
+        pass
 
 
 def _to_bbox_norm_xyxy(x1, y1, x2, y2, w, h):
@@ -237,20 +517,180 @@ def get_video(video_id: str, db: Session = Depends(get_db), current: User = Depe
 
 @app.get("/status/{job_id}")
 def get_status(job_id: str, current: User = Depends(get_current_user)):
-    with jobs_lock:
-        j = jobs.get(job_id)
-        if not j:
-            raise HTTPException(status_code=404, detail="Job no encontrado.")
-        if j.get("user_id") != current.id:
-            raise HTTPException(status_code=403, detail="No autorizado.")
-        return {
-            "job_id": job_id,
-            "state": j["state"],
-            "progress": j.get("progress", 0.0),
-            "message": j.get("message", ""),
-            "result": j.get("result"),
-            "error": j.get("error"),
-        }
+    j = get_job(job_id)
+    if not j:
+        raise HTTPException(status_code=404, detail="Job no encontrado.")
+    if current.id not in job_users(job_id):
+        raise HTTPException(status_code=403, detail="No autorizado.")
+    return {
+        "job_id": job_id,
+        "state": j["state"],
+        "progress": j.get("progress", 0.0),
+        "message": j.get("message", ""),
+        "result": j.get("result"),
+        "error": j.get("error"),
+        **queue_info(job_id, JOB_CAPACITY),
+    }
+
+
+_FINAL_STATES = ("done", "error", "cancelled")
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def _status_view(job: dict) -> dict:
+    view = {k: job.get(k) for k in ("state", "progress", "message", "error")}
+    if job["state"] == "queued":
+        view["queue_position"] = job.get("queue_position")
+        view["eta_seconds"] = job.get("eta_seconds")
+    return view
+
+
+def _read_job(job_id: str) -> dict | None:
+    job = get_job(job_id)
+    if job is not None and job["state"] == "queued":
+        job.update(queue_info(job_id, JOB_CAPACITY))
+    return job
+
+
+async def _job_event_stream(job_id: str):
+    # Eventos de este proceso al momento; la fila se relee cada JOB_EVENTS_POLL_SECONDS para
+    # lo que haga un worker externo (o si se perdió algún evento)
+    events = hub.subscribe(job_id)
+    try:
+        job = await run_in_threadpool(_read_job, job_id)
+        sent_status = None
+        sent_partial = 0
+        last_write = time.monotonic()
+        next_poll = time.monotonic() + JOB_EVENTS_POLL_SECONDS
+        while job is not None:
+            for i, item in enumerate(job["partial"][sent_partial:], start=sent_partial):
+                yield _sse("partial", {"job_id": job_id, "index": i, "item": item})
+                last_write = time.monotonic()
+            sent_partial = max(sent_partial, len(job["partial"]))
+
+            status = _status_view(job)
+            if status != sent_status:
+                data = {"job_id": job_id, **status}
+                if job["state"] in _FINAL_STATES:
+                    data["result"] = job.get("result")
+                yield _sse("status", data)
+                sent_status = status
+                last_write = time.monotonic()
+            if job["state"] in _FINAL_STATES:
+                return
+
+            now = time.monotonic()
+            if now - last_write >= JOB_EVENTS_KEEPALIVE_SECONDS:
+                yield ": keepalive\n\n"
+                last_write = now
+            try:
+                ev = await asyncio.wait_for(events.get(), max(0.0, next_poll - now))
+            except asyncio.TimeoutError:
+                ev = None
+
+            if ev is None:
+                job = await run_in_threadpool(_read_job, job_id)
+                next_poll = time.monotonic() + JOB_EVENTS_POLL_SECONDS
+            elif ev["type"] == "partial":
+                if ev["index"] == len(job["partial"]):
+                    job["partial"].append(ev["item"])
+                elif ev["index"] > len(job["partial"]):
+                    job = await run_in_threadpool(_read_job, job_id)
+            else:
+                job.update({k: v for k, v in ev.items() if k != "type"})
+    finally:
+        hub.unsubscribe(job_id, events)
+
+
+@app.get("/status/{job_id}/events")
+def status_events(job_id: str, current: User = Depends(get_current_user_stream)):
+    # Server-Sent Events en lugar de sondear /status: "status" cuando cambia el estado (con el
+    # resultado al final), "partial" con cada segmento cerrado; se cierra al terminar el job.
+    # Token en la cabecera Authorization o en ?access_token= (EventSource)
+    if current.id not in job_users(job_id):
+        raise HTTPException(status_code=404, detail="Job no encontrado.")
+    return StreamingResponse(
+        _job_event_stream(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/status/{job_id}/cancel")
+def cancel_status(job_id: str, current: User = Depends(get_current_user)):
+    # En cola: se cancela ya. En curso: el worker para en la siguiente actualización de progreso.
+    # Si otros usuarios se unieron al job, solo se desvincula a quien cancela
+    if current.id not in job_users(job_id):
+        raise HTTPException(status_code=404, detail="Job no encontrado.")
+    outcome, params = cancel_job(job_id, current.id)
+    if outcome == "cancelled" and params.get("tmp_path"):
+        _remove_upload(params["tmp_path"])
+    return {"job_id": job_id, "result": outcome}
+
+
+def _expected_cost(tmp_path: str | None, stride: int) -> float:
+    # Coste para el planificador en inferencias esperadas (frame_count/stride, como las
+    # imágenes de un lote); sin vídeo no hay inferencia.
+    # Abre el vídeo: desde los endpoints async se llama en el threadpool
+    if not tmp_path:
+        return 0.0
+    cap = cv2.VideoCapture(tmp_path)
+    try:
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0) if cap.isOpened() else 0
+    finally:
+        cap.release()
+    return float(-(-frame_count // max(1, stride)))
+
+
+def _video_cached(db: Session, user_id: str, job_id: str, mode: str, conf: float, stride: int) -> bool:
+    # Resultado ya en outputs: se registra para el usuario sin procesar nada
+    cached_json_path = os.path.join(OUTPUT_DIR, f"{job_id}.json")
+    cached_mp4_path = os.path.join(OUTPUT_DIR, f"{job_id}.mp4")
+    if not os.path.exists(cached_json_path) or (mode == "annotated" and not os.path.exists(cached_mp4_path)):
+        return False
+
+    with open(cached_json_path, "r", encoding="utf-8") as f:
+        result = f.read()
+    if mode == "annotated":
+        _save_analysis(db, user_id, job_id, cached_mp4_path, result, conf, stride)
+
+    if not add_job_user(job_id, user_id):
+        _job_create(job_id, user_id, f"video_{mode}", state="done", progress=1.0, message="Listo (cache)",
+                    result=json.loads(result))
+    return True
+
+
+def _submit_video(db: Session, user_id: str, tmp_path: str | None, sha256_hex: str, size_bytes: int,
+                  conf: float, stride: int, mode: str) -> dict:
+    # mode: "annotated" (mp4 + Analysis) o "detections" (solo JSON)
+    raw_key = _raw_key(sha256_hex, int(stride))
+    job_id = _artifact_id(raw_key, float(conf), mode)  # cache key (contenido + parámetros)
+
+    if _video_cached(db, user_id, job_id, mode, conf, stride):
+        if tmp_path:
+            _remove_upload(tmp_path)
+        return {"job_id": job_id, "cached": True}
+
+    params = {
+        "tmp_path": tmp_path,
+        "conf": float(conf),
+        "stride": int(stride),
+        "size_bytes": size_bytes,
+        "raw_key": raw_key,
+    }
+    if mode == "annotated":
+        params["user_id"] = user_id
+
+    # Encolar: lo recoge un worker (hilo de este proceso o worker.py). Si el mismo vídeo con
+    # los mismos parámetros ya está en curso, el usuario se une a ese job (single-flight)
+    started = submit_job(job_id, user_id, f"video_{mode}", params, cost=_expected_cost(tmp_path, stride))
+    if not started and tmp_path:
+        _remove_upload(tmp_path)
+
+    return {"job_id": job_id, "cached": False, "joined": not started}
 
 
 @app.post("/predict_video_annotated")
@@ -262,249 +702,276 @@ async def predict_video_annotated(
     current: User = Depends(get_current_user),
 ):
     _cleanup_old_outputs()
+    _active_model()  # 503 antes de copiar el vídeo si aún no hay modelo cargado
 
     tmp_path, sha256_hex, size_bytes = await _stream_upload_to_tempfile_and_hash(file)
-    job_id = sha256_hex  # cache key global
+    # Fuera del event loop: el coste se mide abriendo el vídeo con OpenCV
+    return await run_in_threadpool(_submit_video, db, current.id, tmp_path, sha256_hex, size_bytes, float(conf),
+                                   int(stride), "annotated")
 
-    cached_json_path = os.path.join(OUTPUT_DIR, f"{job_id}.json")
-    cached_mp4_path = os.path.join(OUTPUT_DIR, f"{job_id}.mp4")
 
-    if os.path.exists(cached_json_path) and os.path.exists(cached_mp4_path):
-        existing = db.query(Analysis).filter(Analysis.user_id == current.id, Analysis.video_id == job_id).first()
-        if not existing:
-            with open(cached_json_path, "r", encoding="utf-8") as f:
-                result = f.read()
-            a = Analysis(
-                user_id=current.id,
-                video_id=job_id,
-                mp4_path=cached_mp4_path,
-                result_json=result,
-                conf_used=float(conf),
-                stride_used=int(stride),
-            )
-            db.add(a)
-            db.commit()
+@app.post("/videos/probe")
+def probe_video(
+    sha256: str = Form(..., min_length=64, max_length=64),
+    conf: confloat(ge=0.0, le=1.0) = Form(DEFAULT_MIN_CONF),
+    stride: conint(ge=1, le=60) = Form(DEFAULT_FRAME_STRIDE),
+    mode: str = Form("annotated"),
+    size_bytes: conint(ge=0) = Form(0),
+    db: Session = Depends(get_db),
+    current: User = Depends(get_current_user),
+):
+    # Antes de subir nada: ¿hay resultado (o job en curso) para este contenido y parámetros?
+    if mode not in ("annotated", "detections"):
+        raise HTTPException(status_code=400, detail="mode debe ser 'annotated' o 'detections'.")
+    _cleanup_old_outputs()
 
-        try:
-            os.remove(tmp_path)
-        except Exception:
-            pass
+    sha256_hex = sha256.lower()
+    raw_key = _raw_key(sha256_hex, int(stride))
+    job_id = _artifact_id(raw_key, float(conf), mode)
 
-        with jobs_lock:
-            jobs[job_id] = {
-                "state": "done",
-                "progress": 1.0,
-                "message": "Listo (cache)",
-                "user_id": current.id,
-                "result": json.loads(open(cached_json_path, "r", encoding="utf-8").read()),
-                "error": None,
-                "created_at": time.time(),
-                "updated_at": time.time(),
-            }
+    if _video_cached(db, current.id, job_id, mode, conf, stride):
+        return {"job_id": job_id, "cached": True, "upload_required": False}
 
-        return {"job_id": job_id, "cached": True}
+    j = get_job(job_id)
+    if j and j["state"] in ("queued", "running") and add_job_user(job_id, current.id):
+        # Pudo terminar entre medias: entonces ya es un acierto de cache
+        cached = _video_cached(db, current.id, job_id, mode, conf, stride)
+        return {"job_id": job_id, "cached": cached, "joined": not cached, "upload_required": False}
 
-    # Crear job
-    with jobs_lock:
-        jobs[job_id] = {
-            "state": "queued",
-            "progress": 0.0,
-            "message": "En cola",
-            "user_id": current.id,
-            "result": None,
-            "error": None,
-            "created_at": time.time(),
-            "updated_at": time.time(),
-        }
+    # Solo detecciones con las detecciones crudas guardadas: no hace falta el vídeo
+    if mode == "detections" and _load_raw(raw_key, float(conf)) is not None:
+        _touch_raw(raw_key)
+        out = _submit_video(db, current.id, None, sha256_hex, int(size_bytes), float(conf), int(stride), mode)
+        return {**out, "upload_required": False}
 
-    # Lanzar thread
-    t = threading.Thread(
-        target=_process_video_job,
-        args=(job_id, tmp_path, float(conf), int(stride), size_bytes, current.id),
-        daemon=True
-    )
-    t.start()
+    return {"job_id": None, "cached": False, "upload_required": True}
 
-    return {"job_id": job_id, "cached": False}
 
+# ---------------- Subida reanudable por trozos ----------------
+@app.post("/uploads")
+def upload_create(
+    size_bytes: conint(ge=1) = Form(...),
+    filename: str = Form(""),
+    sha256: str = Form(""),
+    current: User = Depends(get_current_user),
+):
+    if size_bytes > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Archivo demasiado grande. Máximo {MAX_UPLOAD_MB}MB.")
+    return create_upload(current.id, int(size_bytes), _safe_suffix(filename), sha256.lower() or None)
 
-def _process_video_job(job_id: str, tmp_path: str, conf: float, stride: int, size_bytes: int, user_id: str):
-    raw_path = None
-    cap = None
-    writer = None
 
-    # Limitar concurrencia de jobs pesados
-    with job_sema:
-        try:
-            _job_update(job_id, state="running", progress=0.01, message="Abriendo vídeo")
+@app.get("/uploads/{upload_id}")
+def upload_status(upload_id: str, current: User = Depends(get_current_user)):
+    # Para reanudar: el cliente continúa desde "offset"
+    return upload_info(upload_id, current.id)
 
-            cap = cv2.VideoCapture(tmp_path)
-            if not cap.isOpened():
-                raise RuntimeError("No se pudo abrir el vídeo.")
 
-            fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
-            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0)
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0)
+@app.put("/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, request: Request, offset: conint(ge=0) = Query(...),
+                       current: User = Depends(get_current_user)):
+    return await append_upload(upload_id, current.id, int(offset), request.stream())
 
-            duration = (frame_count / fps) if fps > 0 else 0.0
-            if duration > MAX_DURATION_SECONDS:
-                raise RuntimeError(f"Vídeo demasiado largo ({duration:.1f}s). Máximo {MAX_DURATION_SECONDS}s.")
 
-            scale = min(MAX_OUTPUT_WIDTH / width, MAX_OUTPUT_HEIGHT / height, 1.0)
-            out_w = int(width * scale)
-            out_h = int(height * scale)
-            out_w -= out_w % 2
-            out_h -= out_h % 2
-            if out_w <= 0 or out_h <= 0:
-                out_w, out_h = width, height
+@app.post("/uploads/{upload_id}/complete")
+def upload_complete(
+    upload_id: str,
+    conf: confloat(ge=0.0, le=1.0) = Form(DEFAULT_MIN_CONF),
+    stride: conint(ge=1, le=60) = Form(DEFAULT_FRAME_STRIDE),
+    mode: str = Form("annotated"),
+    db: Session = Depends(get_db),
+    current: User = Depends(get_current_user),
+):
+    if mode not in ("annotated", "detections"):
+        raise HTTPException(status_code=400, detail="mode debe ser 'annotated' o 'detections'.")
+    _cleanup_old_outputs()
+    _active_model()  # 503 sin consumir la subida: se puede volver a completar luego
+
+    tmp_path, sha256_hex, size_bytes = finish_upload(upload_id, current.id)
+    return _submit_video(db, current.id, tmp_path, sha256_hex, size_bytes, float(conf), int(stride), mode)
+
+
+def _chunk_executor(mv) -> ProcessPoolExecutor:
+    # Pool persistente por versión del modelo: cada proceso carga esos pesos una vez
+    # (spawn: sin fork de torch). Se cierra cuando la versión se retira y deja de usarse
+    with _chunk_pool_lock:
+        pool = _chunk_pools.get(mv.version)
+        if pool is None:
+            threads = max(1, (os.cpu_count() or 1) // VIDEO_CHUNK_WORKERS)
+            pool = _chunk_pools[mv.version] = ProcessPoolExecutor(
+                max_workers=VIDEO_CHUNK_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_chunk_worker,
+                initargs=(mv.path, threads, INFER_IMGSZ, mv.engine_name),
+            )
+        return pool
+
 
-            _job_update(job_id, progress=0.03, message="Preparando writer")
+def _run_chunk_tasks(job_id: str, mv, fn, args_list: list, p0: float, p1: float, message: str) -> list:
+    pool = _chunk_executor(mv)
+    futures = [pool.submit(fn, *args) for args in args_list]
+    try:
+        done = 0
+        for _ in as_completed(futures):
+            done += 1
+            _job_update(job_id, progress=p0 + (p1 - p0) * done / len(futures),
+                        message=f"{message}... {done}/{len(futures)} trozos")
+        return [f.result() for f in futures]
+    except BrokenProcessPool:
+        with _chunk_pool_lock:
+            if _chunk_pools.get(mv.version) is pool:
+                del _chunk_pools[mv.version]
+        raise RuntimeError("Un proceso de trozos de vídeo terminó inesperadamente.")
+    finally:
+        for f in futures:
+            f.cancel()
+
+
+def _detect_chunked(job_id: str, mv, path: str, chunks: list, frame_count: int, infer_conf: float, conf: float,
+                    stride: int, resize_to, batch_size: int, p0: float, p1: float) -> list:
+    return _run_chunk_tasks(
+        job_id, mv, detect_chunk,
+        [
+            (path, s, e, frame_count, infer_conf, _new_sampler(stride), resize_to, batch_size, conf)
+            for s, e in chunks
+        ],
+        p0, p1, "Detectando",
+    )
 
-            fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-            raw_path = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4").name
-            writer = cv2.VideoWriter(raw_path, fourcc, fps, (out_w, out_h))
-            if not writer.isOpened():
-                raise RuntimeError("No se pudo inicializar VideoWriter (mp4v).")
 
-            last_dets = []
-            last_det_frame = -10**9
+def _render_chunked(job_id: str, mv, path: str, chunks: list, parts: list, conf: float, frame_count: int,
+                    fps: float, stride: int, size: tuple[int, int], resize_to, final_mp4_path: str):
+    # Conteos acumulados y estado del tracker al inicio de cada trozo para que el HUD
+    # y los track_id sean continuos (el tracker solo depende de las detecciones)
+    counters = []
+    trackers = []
+    running = {}
+    tracker = _new_tracker(stride)
+    for part in parts:
+        counters.append(dict(running))
+        trackers.append(copy.deepcopy(tracker))
+        for frame_idx, raw_dets in part:
+            dets = filter_dets(raw_dets, conf)
+            for det in dets:
+                running[det["class"]] = running.get(det["class"], 0) + 1
+            if tracker is not None:
+                tracker.update(frame_idx, dets)
+
+    chunk_dir = tempfile.mkdtemp(prefix=f"{job_id[:16]}-chunks-")
+    try:
+        paths = [os.path.join(chunk_dir, f"{i:04d}.mp4") for i in range(len(chunks))]
+        _run_chunk_tasks(
+            job_id, mv, render_chunk,
+            [
+                (path, s, e, frame_count, paths[i], fps, size, resize_to, _ttl_frames(stride),
+                 dict(parts[i]), counters[i], VIDEO_ENCODER, trackers[i], conf)
+                for i, (s, e) in enumerate(chunks)
+            ],
+            0.60, 0.88, "Renderizando",
+        )
+        _job_update(job_id, progress=0.88, message="Uniendo trozos")
+        concat_mp4(paths, final_mp4_path)
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+
+
+def _process_video_job(job_id: str, tmp_path: str, conf: float, stride: int, size_bytes: int, user_id: str,
+                       raw_key: str):
+    raw_path = None
+    cap = None
+    writer = None
+    raw_writer = None
 
-            detect_times = []
-            species_counter = {}
-            species_times = {}
+    # La concurrencia de jobs pesados la limita el worker (solo reclama con hueco en job_sema);
+    # el job entero usa la misma versión del modelo
+    with models.use() as mv:
+        raw_key = _pinned_raw_key(raw_key, mv)
+        try:
+            _job_update(job_id, state="running", progress=0.01, message="Abriendo vídeo")
 
-            _job_update(job_id, progress=0.05, message="Procesando frames")
+            cap, fps, frame_count, width, height, duration = _open_video(tmp_path)
+            out_w, out_h, scale = _output_size(width, height)
+            resize_to = (out_w, out_h) if scale < 1.0 else None
 
-            for frame_idx in range(frame_count if frame_count > 0 else 10**9):
-                ret, frame = cap.read()
-                if not ret:
-                    break
-
-                if frame_count > 0 and frame_idx % max(1, frame_count // 100) == 0:
-                    p = 0.05 + 0.70 * (frame_idx / frame_count)
-                    _job_update(job_id, progress=min(0.75, p), message=f"Procesando... {int((frame_idx/frame_count)*100)}%")
-
-                if scale < 1.0:
-                    frame = cv2.resize(frame, (out_w, out_h), interpolation=cv2.INTER_AREA)
-
-                if frame_idx % stride == 0:
-                    results = model.predict(source=frame, conf=conf, imgsz=640, verbose=False)
-                    r = results[0]
-                    boxes = r.boxes
-                    names = r.names
-
-                    dets = []
-                    if boxes is not None and len(boxes) > 0:
-                        for box in boxes:
-                            x1, y1, x2, y2 = box.xyxy[0].tolist()
-                            cls_id = int(box.cls[0])
-                            c = float(box.conf[0])
-                            cls_name = names.get(cls_id, f"class_{cls_id}")
-
-                            dets.append({"class": cls_name, "confidence": float(c), "bbox": [x1, y1, x2, y2]})
-                            species_counter[cls_name] = species_counter.get(cls_name, 0) + 1
-                            tsec = frame_idx / fps if fps > 0 else None
-                            if tsec is not None:
-                                species_times.setdefault(cls_name, []).append(tsec)
-
-                        last_det_frame = frame_idx
-                        tsec = frame_idx / fps if fps > 0 else None
-                        if tsec is not None:
-                            detect_times.append(tsec)
-
-                    last_dets = dets
-
-                if frame_idx - last_det_frame > (TTL_MULT * stride):
-                    last_dets = []
-
-                annotated = frame.copy()
-
-                top_now = sorted(species_counter.items(), key=lambda x: x[1], reverse=True)[:3]
-                y0 = 30
-                cv2.putText(annotated, f"Aves: {len(last_dets)}", (10, y0),
-                            cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2, cv2.LINE_AA)
-                y = y0 + 28
-                if top_now:
-                    cv2.putText(annotated, "Top:", (10, y),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255,255,255), 2, cv2.LINE_AA)
-                    y += 24
-                    for sp, cnt in top_now:
-                        col = _species_color(sp)
-                        cv2.rectangle(annotated, (10, y-16), (28, y+2), col, -1)
-                        cv2.putText(annotated, f"{sp} ({cnt})", (36, y),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.65, (255,255,255), 2, cv2.LINE_AA)
-                        y += 22
-
-                for det in last_dets:
-                    x1, y1, x2, y2 = map(int, det["bbox"])
-                    sp = det["class"]
-                    col = _species_color(sp)
-                    label = f'{sp} {det["confidence"]*100:.1f}%'
-                    cv2.rectangle(annotated, (x1, y1), (x2, y2), col, 2)
-                    cv2.putText(annotated, label, (x1, max(20, y1 - 8)),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, col, 2, cv2.LINE_AA)
-
-                writer.write(annotated)
-
-            writer.release()
-            cap.release()
-            writer = None
-            cap = None
-
-            _job_update(job_id, progress=0.80, message="Transcodificando (H.264)")
+            # Detecciones crudas ya calculadas (otra conf): solo se re-renderiza, sin modelo
+            store = _load_raw(raw_key, conf)
+            reused = store is not None
+            infer_conf = min(conf, VIDEO_RAW_MIN_CONF)
+            video_meta = {"fps": fps, "frame_count": frame_count, "width": width, "height": height}
+            if not reused:
+                raw_writer = DetectionWriter(_raw_base(raw_key))
 
             final_mp4_path = os.path.join(OUTPUT_DIR, f"{job_id}.mp4")
-            gop = max(24, int(fps * 2))
-
-            subprocess.run(
-                [
-                    "ffmpeg", "-y",
-                    "-i", raw_path,
-                    "-c:v", "libx264",
-                    "-profile:v", "baseline",
-                    "-level", "3.0",
-                    "-preset", "veryfast",
-                    "-tune", "fastdecode",
-                    "-crf", "23",
-                    "-pix_fmt", "yuv420p",
-                    "-movflags", "+faststart",
-                    "-g", str(gop),
-                    "-keyint_min", str(gop),
-                    final_mp4_path
-                ],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-                check=True
-            )
+            chunks = plan_chunks(frame_count, fps, stride, VIDEO_CHUNK_WORKERS, VIDEO_CHUNK_MIN_SECONDS)
+
+            if len(chunks) > 1:
+                # Vídeo largo: trozos en paralelo (detección y luego render), unidos con concat
+                cap.release()
+                cap = None
+                _job_update(job_id, progress=0.05, message=f"Procesando en {len(chunks)} trozos")
+                if not reused:
+                    parts = _detect_chunked(job_id, mv, tmp_path, chunks, frame_count, infer_conf, conf, stride,
+                                            resize_to, _video_batch_size(out_w, out_h), 0.05, 0.60)
+                    for part in parts:
+                        for frame_idx, dets in part:
+                            raw_writer.add(frame_idx, dets)
+                    store = raw_writer.close(infer_conf, video_meta)
+                    raw_writer = None
+                # Cada trozo recibe solo su rango del almacén
+                parts = [store.frame_dets(s, e) for s, e in chunks]
+                live = _live_segments(job_id, conf, fps)
+                for part in parts:
+                    for frame_idx, dets in part:
+                        live(frame_idx, dets)
+                _render_chunked(job_id, mv, tmp_path, chunks, parts, conf, frame_count, fps, stride,
+                                (out_w, out_h), resize_to, final_mp4_path)
+            else:
+                _job_update(job_id, progress=0.03, message="Preparando writer")
+
+                # Encoder de una pasada (pipe a ffmpeg); si no arranca, mp4v + transcode
+                writer, raw_path = open_writer(final_mp4_path, fps, (out_w, out_h), VIDEO_ENCODER)
+
+                # Sin transcode posterior el procesado de frames ocupa también la ventana 0.75-0.92
+                progress_end = 0.75 if raw_path else 0.90
+
+                def on_progress(frame_idx):
+                    p = 0.05 + (progress_end - 0.05) * (frame_idx / frame_count)
+                    _job_update(job_id, progress=min(progress_end, p), message=f"Procesando... {int((frame_idx/frame_count)*100)}%")
+
+                _job_update(job_id, progress=0.05, message="Reutilizando detecciones" if reused else "Procesando frames")
+
+                run_pipeline(
+                    cap,
+                    writer,
+                    lambda frames: _predict_frames(frames, infer_conf, mv),
+                    frame_count=frame_count,
+                    sampler=_new_sampler(stride),
+                    resize_to=resize_to,
+                    batch_size=_video_batch_size(out_w, out_h),
+                    max_pending=_video_frame_budget(out_w, out_h),
+                    ttl_frames=_ttl_frames(stride),
+                    queue_size=VIDEO_QUEUE_SIZE,
+                    on_progress=on_progress,
+                    precomputed=dict(store.frame_dets()) if reused else None,
+                    tracker=_new_tracker(stride),
+                    min_conf=conf,
+                    on_detections=_live_segments(job_id, conf, fps, raw_writer),
+                )
+                if raw_writer is not None:
+                    store = raw_writer.close(infer_conf, video_meta)
+                    raw_writer = None
+
+                writer.release()
+                cap.release()
+                writer = None
+                cap = None
+
+                if raw_path:
+                    _job_update(job_id, progress=0.80, message="Transcodificando (H.264)")
+                    transcode_h264(raw_path, final_mp4_path, fps)
 
             _job_update(job_id, progress=0.92, message="Generando estadísticas")
 
-            segments = _segments_from_times(detect_times, SEGMENT_GAP_SECONDS)
-            species_segments = {sp: _segments_from_times(ts, SEGMENT_GAP_SECONDS) for sp, ts in species_times.items()}
-            species_ranking = sorted(
-                [{"species": sp, "count": c} for sp, c in species_counter.items()],
-                key=lambda x: x["count"],
-                reverse=True
-            )
-            top_species = species_ranking[0]["species"] if species_ranking else None
-
-            def top_for_segment(seg):
-                s, e = seg["start_time"], seg["end_time"]
-                best_sp, best_cnt = None, 0
-                for sp, ts in species_times.items():
-                    cnt = sum(1 for t in ts if s <= t <= e)
-                    if cnt > best_cnt:
-                        best_cnt = cnt
-                        best_sp = sp
-                return {"species": best_sp, "count": best_cnt}
-
-            segments_enriched = []
-            for seg in segments:
-                enriched = dict(seg)
-                enriched["top_species"] = top_for_segment(seg)
-                segments_enriched.append(enriched)
-
+            frame_dets, individuals = _filtered_tracked(store, conf, stride)
             video_url = f"/videos/{job_id}.mp4"
             result = {
                 "video_id": job_id,
@@ -520,46 +987,37 @@ def _process_video_job(job_id: str, tmp_path: str, conf: float, stride: int, siz
                     "upload_bytes": int(size_bytes),
                     "scaled_from": {"width": int(width), "height": int(height)} if scale < 1.0 else None,
                 },
-                "num_inference_points_with_detections": len(detect_times),
-                "top_species_overall": top_species,
-                "segments": segments_enriched,
-                "species_ranking": species_ranking,
-                "species_segments": species_segments,
+                "inference": _inference_info(frame_dets, frame_count, stride, reused),
+                **video_stats(frame_dets, fps, SEGMENT_GAP_SECONDS, individuals),
             }
 
             json_path = os.path.join(OUTPUT_DIR, f"{job_id}.json")
             with open(json_path, "w", encoding="utf-8") as f:
                 json.dump(result, f, ensure_ascii=False, indent=2)
 
+            # Análisis para el propietario y los usuarios que se unieron al job; se repite tras
+            # marcarlo como hecho por si alguien se unió justo entremedias
+            result_json = json.dumps(result, ensure_ascii=False)
             db = SessionLocal()
             try:
-                existing = db.query(Analysis).filter(Analysis.user_id == user_id, Analysis.video_id == job_id).first()
-                if not existing:
-                    a = Analysis(
-                        user_id=user_id,
-                        video_id=job_id,
-                        mp4_path=final_mp4_path,
-                        result_json=json.dumps(result, ensure_ascii=False),
-                        conf_used=float(conf),
-                        stride_used=int(stride),
-                    )
-                    db.add(a)
-                    db.commit()
+                for uid in job_users(job_id) or [user_id]:
+                    _save_analysis(db, uid, job_id, final_mp4_path, result_json, conf, stride)
+                _job_update(job_id, state="done", progress=1.0, message="Listo", result=result)
+                for uid in job_users(job_id):
+                    _save_analysis(db, uid, job_id, final_mp4_path, result_json, conf, stride)
             finally:
                 db.close()
 
-            _job_update(job_id, state="done", progress=1.0, message="Listo", result=result)
-
+        except JobCancelled:
+            _job_update(job_id, state="cancelled", message="Cancelado")
         except subprocess.CalledProcessError:
             _job_update(job_id, state="error", progress=1.0, error="FFmpeg falló (¿ffmpeg + libx264 instalados?)")
         except Exception as e:
             _job_update(job_id, state="error", progress=1.0, error=str(e))
         finally:
-            try:
-                if writer is not None:
-                    writer.release()
-            except Exception:
-                pass
+            discard_writer(writer, raw_path)
+            if raw_writer is not None:
+                raw_writer.abort()
             try:
                 if cap is not None:
                     cap.release()
@@ -570,13 +1028,153 @@ def _process_video_job(job_id: str, tmp_path: str, conf: float, stride: int, siz
                     os.remove(tmp_path)
                 except Exception:
                     pass
-            if raw_path and os.path.exists(raw_path):
+
+
+@app.post("/predict_video_detections")
+async def predict_video_detections(
+    file: UploadFile = File(...),
+    conf: confloat(ge=0.0, le=1.0) = Form(DEFAULT_MIN_CONF),
+    stride: conint(ge=1, le=60) = Form(DEFAULT_FRAME_STRIDE),
+    db: Session = Depends(get_db),
+    current: User = Depends(get_current_user),
+):
+    # Solo JSON (detecciones por frame + estadísticas): sin anotar, sin writer, sin transcode
+    _cleanup_old_outputs()
+    _active_model()  # 503 antes de copiar el vídeo si aún no hay modelo cargado
+
+    tmp_path, sha256_hex, size_bytes = await _stream_upload_to_tempfile_and_hash(file)
+    # Fuera del event loop: el coste se mide abriendo el vídeo con OpenCV
+    return await run_in_threadpool(_submit_video, db, current.id, tmp_path, sha256_hex, size_bytes, float(conf),
+                                   int(stride), "detections")
+
+
+def _process_video_detections_job(job_id: str, tmp_path: str, conf: float, stride: int, size_bytes: int,
+                                  raw_key: str):
+    with models.use() as mv:
+        raw_key = _pinned_raw_key(raw_key, mv)
+        try:
+            # Con detecciones crudas en cache no hace falta ni abrir el vídeo
+            store = _load_raw(raw_key, conf)
+            reused = store is not None
+            if reused:
+                _job_update(job_id, state="running", progress=0.50, message="Reutilizando detecciones")
+            elif not tmp_path:
+                # Encolado desde /videos/probe sin subir el vídeo y las detecciones ya no sirven
+                # (borradas o de otro modelo): hay que volver a enviarlo
+                raise RuntimeError("Las detecciones guardadas ya no están disponibles: sube el vídeo de nuevo.")
+            else:
+                _job_update(job_id, state="running", progress=0.01, message="Abriendo vídeo")
+                store = _detect_video(job_id, mv, tmp_path, conf, stride, raw_key)
+
+            fps = store.video["fps"]
+            frame_count = store.video["frame_count"]
+            width = store.video["width"]
+            height = store.video["height"]
+            duration = (frame_count / fps) if fps > 0 else 0.0
+            out_w, out_h, _ = _output_size(width, height)
+
+            _job_update(job_id, progress=0.92, message="Generando estadísticas")
+
+            frame_dets, individuals = _filtered_tracked(store, conf, stride)
+            result = {
+                "video_id": job_id,
+                "video_url": None,
+                "video_info": {
+                    "fps": float(fps),
+                    "frame_count": int(frame_count),
+                    "width": int(width),
+                    "height": int(height),
+                    "frame_stride": int(stride),
+                    "conf_used": float(conf),
+                    "duration_seconds": float(duration),
+                    "upload_bytes": int(size_bytes),
+                    "scaled_from": None,
+                },
+                "inference": _inference_info(frame_dets, frame_count, stride, reused),
+                "num_inference_points": len(frame_dets),
+                **video_stats(frame_dets, fps, SEGMENT_GAP_SECONDS, individuals),
+                # bbox normalizadas: independientes de la resolución a la que se infirió
+                "detections": compact_detections(frame_dets, fps, out_w, out_h),
+            }
+
+            json_path = os.path.join(OUTPUT_DIR, f"{job_id}.json")
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, separators=(",", ":"))
+
+            _job_update(job_id, state="done", progress=1.0, message="Listo", result=result)
+
+        except JobCancelled:
+            _job_update(job_id, state="cancelled", message="Cancelado")
+        except Exception as e:
+            _job_update(job_id, state="error", progress=1.0, error=str(e))
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
                 try:
-                    os.remove(raw_path)
+                    os.remove(tmp_path)
                 except Exception:
                     pass
 
 
+def _detect_video(job_id: str, mv, path: str, conf: float, stride: int, raw_key: str) -> DetectionStore:
+    # Inferencia sin render a la resolución de salida (mismas detecciones crudas que el modo anotado)
+    cap, fps, frame_count, width, height, duration = _open_video(path)
+    raw_writer = DetectionWriter(_raw_base(raw_key))
+    try:
+        out_w, out_h, scale = _output_size(width, height)
+        resize_to = (out_w, out_h) if scale < 1.0 else None
+        infer_conf = min(conf, VIDEO_RAW_MIN_CONF)
+        chunks = plan_chunks(frame_count, fps, stride, VIDEO_CHUNK_WORKERS, VIDEO_CHUNK_MIN_SECONDS)
+        batch_size = _video_batch_size(out_w, out_h)
+
+        if len(chunks) > 1:
+            _job_update(job_id, progress=0.05, message=f"Procesando en {len(chunks)} trozos")
+            parts = _detect_chunked(job_id, mv, path, chunks, frame_count, infer_conf, conf, stride, resize_to,
+                                    batch_size, 0.05, 0.90)
+            live = _live_segments(job_id, conf, fps, raw_writer)
+            for part in parts:
+                for frame_idx, dets in part:
+                    live(frame_idx, dets)
+        else:
+            def on_progress(frame_idx):
+                p = 0.05 + 0.85 * (frame_idx / frame_count)
+                _job_update(job_id, progress=min(0.90, p), message=f"Procesando... {int((frame_idx/frame_count)*100)}%")
+
+            _job_update(job_id, progress=0.05, message="Procesando frames")
+
+            run_detections(
+                cap,
+                lambda frames: _predict_frames(frames, infer_conf, mv),
+                frame_count=frame_count,
+                sampler=_new_sampler(stride),
+                batch_size=batch_size,
+                queue_size=VIDEO_QUEUE_SIZE,
+                on_progress=on_progress,
+                resize_to=resize_to,
+                min_conf=conf,
+                on_detections=_live_segments(job_id, conf, fps, raw_writer),
+            )
+        store = raw_writer.close(infer_conf, {"fps": fps, "frame_count": frame_count, "width": width, "height": height})
+        raw_writer = None
+        return store
+    finally:
+        cap.release()
+        if raw_writer is not None:
+            raw_writer.abort()
+
+
+# Tipos de job que procesan los workers (jobs.run_worker): kind -> fn(job_id, **params)
+JOB_HANDLERS = {
+    "video_annotated": _process_video_job,
+    "video_detections": _process_video_detections_job,
+}
+
+
+@app.on_event("startup")
+def _start_job_workers():
+    if JOB_RUNNER == "thread":
+        start_worker_threads(JOB_HANDLERS, MAX_CONCURRENT_JOBS, job_sema)
+
+
 # ---------------- Posts ----------------
 @app.post("/posts")
 def create_post(
@@ -667,6 +1265,77 @@ def get_public_post_video(post_id: str, db: Session = Depends(get_db)):
 
 
 # ---------------- Image + Frame (unified format) ----------------
+def _retry_after_seconds() -> int:
+    # Lo que tardaría en vaciarse lo que ya hay en curso, a la latencia mediana actual
+    mv = models.peek()
+    p50_ms = (mv and mv.predictor.metrics()["latency_ms"]["p50"]) or 1000.0
+    return max(1, math.ceil(image_executor.inflight / image_executor.workers * p50_ms / 1000.0))
+
+
+def _busy() -> HTTPException:
+    return HTTPException(status_code=503, detail="Servidor ocupado, vuelve a intentarlo en unos segundos.",
+                         headers={"Retry-After": str(_retry_after_seconds())})
+
+
+def _submit_image_task(fn, *args):
+    # Awaitable con el resultado de fn en image_executor; lleno => 503 inmediato
+    try:
+        return asyncio.wrap_future(image_executor.submit(fn, *args))
+    except Saturated:
+        raise _busy()
+
+
+def _decode_upload(data: bytes) -> tuple[np.ndarray, int, int] | None:
+    # JPEG grande => decodificado ya reducido (ver decoding.py); w, h son los originales
+    try:
+        return decode_image(data, INFER_IMGSZ, IMAGE_MAX_PIXELS)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+
+def _content_digest(data: bytes) -> str | None:
+    return hashlib.sha256(data).hexdigest() if result_cache.enabled else None
+
+
+def _cached_result(kind: str, digest: str | None, conf: float):
+    # Resultado ya calculado con los pesos activos; None si no hay (o el modelo aún no cargó)
+    mv = models.peek()
+    if digest is None or mv is None:
+        return None
+    return result_cache.get(result_key(kind, digest, mv.sha256, conf, INFER_IMGSZ))
+
+
+def _image_detections(data: bytes, conf: float) -> tuple[list[dict], int, int]:
+    # En image_executor: el sha256 del contenido y la consulta a la cache (que puede leer de
+    # disco) tampoco se hacen en el event loop
+    digest = _content_digest(data)
+    cached = _cached_result("image", digest, conf)
+    if cached is not None:
+        return tuple(cached)
+
+    decoded = _decode_upload(data)
+    if decoded is None:
+        raise HTTPException(status_code=400, detail="No se pudo decodificar la imagen")
+
+    img, w, h = decoded
+    sx, sy = w / img.shape[1], h / img.shape[0]
+    dets = []
+    with models.use() as mv:
+        raw = mv.predictor.submit(img, float(conf)).result()
+    for det in raw:
+        x1, y1, x2, y2 = det["bbox"]
+        bbox_norm, bbox_px = _to_bbox_norm_xyxy(x1 * sx, y1 * sy, x2 * sx, y2 * sy, w, h)
+        dets.append({
+            "class": det["class"],
+            "confidence": det["confidence"],
+            "bbox": bbox_px,
+            "bbox_norm": bbox_norm,
+        })
+    if digest is not None:
+        result_cache.put(result_key("image", digest, mv.sha256, conf, INFER_IMGSZ), [dets, w, h])
+    return dets, w, h
+
+
 @app.post("/predict_image")
 async def predict_image(
     file: UploadFile = File(...),
@@ -678,32 +1347,7 @@ async def predict_image(
         if not data:
             raise HTTPException(status_code=400, detail="Imagen vacía")
 
-        arr = np.frombuffer(data, dtype=np.uint8)
-        img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-        if img is None:
-            raise HTTPException(status_code=400, detail="No se pudo decodificar la imagen")
-
-        h, w = img.shape[:2]
-        results = model.predict(source=img, conf=float(conf), imgsz=640, verbose=False)
-        r = results[0]
-        boxes = r.boxes
-        names = r.names
-
-        dets = []
-        if boxes is not None and len(boxes) > 0:
-            for box in boxes:
-                x1, y1, x2, y2 = box.xyxy[0].tolist()
-                cls_id = int(box.cls[0])
-                c = float(box.conf[0])
-                cls_name = names.get(cls_id, f"class_{cls_id}")
-
-                bbox_norm, bbox_px = _to_bbox_norm_xyxy(x1, y1, x2, y2, w, h)
-                dets.append({
-                    "class": cls_name,
-                    "confidence": float(c),
-                    "bbox": bbox_px,
-                    "bbox_norm": bbox_norm,
-                })
+        dets, w, h = await _submit_image_task(_image_detections, data, float(conf))
 
         return {
             "ok": True,
@@ -718,6 +1362,43 @@ async def predict_image(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _frame_detections(data: bytes, conf: float) -> list[dict]:
+    # Detecciones de un frame de directo (solo bbox_norm); frame ilegible => sin detecciones.
+    # Como _image_detections, la cache se consulta ya en image_executor
+    digest = _content_digest(data)
+    cached = _cached_result("frame", digest, conf)
+    if cached is not None:
+        return cached
+
+    decoded = _decode_upload(data)
+    if decoded is None:
+        return []
+
+    img = decoded[0]
+    # bbox_norm respecto a la imagen decodificada (reducida o no, la proporción es la misma)
+    h, w = img.shape[:2]
+
+    dets = []
+    with models.use() as mv:
+        raw = mv.predictor.submit(img, float(conf)).result()
+    for det in raw:
+        x1, y1, x2, y2 = det["bbox"]
+        dets.append({
+            "class": det["class"],
+            "confidence": det["confidence"],
+            "bbox_norm": [
+                max(0.0, min(x1 / w, 1.0)),
+                max(0.0, min(y1 / h, 1.0)),
+                max(0.0, min(x2 / w, 1.0)),
+                max(0.0, min(y2 / h, 1.0)),
+            ],
+        })
+
+    if digest is not None:
+        result_cache.put(result_key("frame", digest, mv.sha256, conf, INFER_IMGSZ), dets)
+    return dets
+
+
 @app.post("/predict_frame_fast")
 async def predict_frame_fast(
     file: UploadFile = File(...),
@@ -728,38 +1409,386 @@ async def predict_frame_fast(
     if not data:
         return {"ok": True, "detections": []}
 
-    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
-    if img is None:
-        return {"ok": True, "detections": []}
+    return {"ok": True, "detections": await _submit_image_task(_frame_detections, data, float(conf))}
+
+
+# ---------------- Lotes de imágenes ----------------
+def _zip_images(zf: zipfile.ZipFile) -> list[zipfile.ZipInfo]:
+    return [
+        info for info in zf.infolist()
+        if not info.is_dir()
+        and info.filename.lower().endswith(BATCH_IMAGE_EXTS)
+        and not info.filename.startswith("__MACOSX/")
+        and not os.path.basename(info.filename).startswith("._")
+    ]
+
+
+def _read_member(zf: zipfile.ZipFile, info: zipfile.ZipInfo) -> bytes:
+    # Un miembro cada vez y en memoria (nada se extrae a disco); el tope se aplica a lo leído,
+    # no al tamaño declarado en el ZIP
+    with zf.open(info) as member:
+        data = member.read(BATCH_MAX_IMAGE_BYTES + 1)
+    if len(data) > BATCH_MAX_IMAGE_BYTES:
+        raise HTTPException(status_code=413, detail=f"Imagen demasiado grande. Máximo {BATCH_MAX_IMAGE_BYTES // (1024 * 1024)}MB.")
+    return data
+
+
+def _batch_sources(files: list[UploadFile]) -> tuple[list[tuple[str, object]], list[zipfile.ZipFile]]:
+    # (nombre, fn que devuelve los bytes) por imagen: ficheros sueltos y miembros de ZIPs
+    sources = []
+    archives = []
+    for f in files:
+        if zipfile.is_zipfile(f.file):
+            f.file.seek(0)
+            try:
+                zf = zipfile.ZipFile(f.file)
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"ZIP ilegible: {f.filename}")
+            archives.append(zf)
+            sources.extend((info.filename, partial(_read_member, zf, info)) for info in _zip_images(zf))
+        else:
+            f.file.seek(0)
+            sources.append((f.filename or "", f.file.read))
+    return sources, archives
 
-    h, w = img.shape[:2]
 
-    results = model.predict(
-        source=img,
-        conf=float(conf),
-        imgsz=640,
-        verbose=False,
-        device="cpu"  # explícito (mejor control)
-    )
+def _batch_detections(data: bytes, conf: float) -> tuple[list[dict], int, int]:
+    if not data:
+        raise HTTPException(status_code=400, detail="Imagen vacía")
+    return _image_detections(data, conf)
+
+
+def _batch_line(index: int, name: str, fut: Future) -> dict:
+    # Mismo formato que /predict_image (+ índice y nombre); los errores no cortan el lote
+    try:
+        dets, w, h = fut.result()
+    except HTTPException as e:
+        return {"index": index, "file": name, "ok": False, "error": e.detail}
+    except Exception as e:
+        return {"index": index, "file": name, "ok": False, "error": str(e)}
+    return {
+        "index": index,
+        "file": name,
+        "ok": True,
+        "num_detections": len(dets),
+        "image_size": {"width": int(w), "height": int(h)},
+        "detections": dets,
+    }
 
-    r = results[0]
-    dets = []
 
-    if r.boxes is not None:
-        for box in r.boxes:
-            x1, y1, x2, y2 = box.xyxy[0].tolist()
-            cls_id = int(box.cls[0])
-            c = float(box.conf[0])
-
-            dets.append({
-                "class": r.names.get(cls_id, str(cls_id)),
-                "confidence": c,
-                "bbox_norm": [
-                    max(0.0, min(x1 / w, 1.0)),
-                    max(0.0, min(y1 / h, 1.0)),
-                    max(0.0, min(x2 / w, 1.0)),
-                    max(0.0, min(y2 / h, 1.0)),
-                ],
+def _batch_results(sources: list, conf: float):
+    # Resultados en orden de entrada. Las imágenes se leen de una en una y se decodifican en
+    # image_executor (el mismo tope que /predict_image), como mucho BATCH_WORKERS a la vez
+    # (memoria acotada). Las inferencias las agrupa el BatchPredictor en lotes
+    window = max(1, BATCH_WORKERS)
+    pending = deque()
+    try:
+        for index, (name, load) in enumerate(sources):
+            try:
+                data = load()
+            except Exception as e:
+                fut = Future()
+                fut.set_exception(e)
+            else:
+                deadline = None
+                while True:
+                    try:
+                        fut = image_executor.submit(_batch_detections, data, float(conf))
+                        break
+                    except Saturated:
+                        # Lleno por otras peticiones: se espera a la imagen más antigua del lote
+                        # o, si no queda ninguna en vuelo, a que se libere un hueco
+                        if pending:
+                            yield _batch_line(*pending.popleft())
+                            continue
+                        if deadline is None:
+                            deadline = time.monotonic() + BATCH_SLOT_WAIT_SECONDS
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not image_executor.wait_for_slot(remaining):
+                            fut = Future()
+                            fut.set_exception(_busy())
+                            break
+            pending.append((index, name, fut))
+            if len(pending) >= window:
+                yield _batch_line(*pending.popleft())
+        while pending:
+            yield _batch_line(*pending.popleft())
+    finally:
+        # Cliente desconectado o job cancelado: lo que no ha empezado no se procesa
+        for _, _, fut in pending:
+            fut.cancel()
+
+
+def _batch_lines(sources: list, conf: float, summary: dict):
+    # Las mismas líneas, acumulando en summary el resumen final (errores, conteo por especie)
+    summary.update(images=0, errors=0, num_detections=0, species={})
+    for line in _batch_results(sources, conf):
+        summary["images"] += 1
+        if not line["ok"]:
+            summary["errors"] += 1
+        for det in line.get("detections", ()):
+            summary["num_detections"] += 1
+            summary["species"][det["class"]] = summary["species"].get(det["class"], 0) + 1
+        yield line
+
+
+def _ndjson(obj: dict) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def _stream_batch(sources: list, archives: list, conf: float):
+    try:
+        summary = {}
+        for line in _batch_lines(sources, conf, summary):
+            yield _ndjson(line)
+        yield _ndjson({"summary": summary})
+    finally:
+        for zf in archives:
+            zf.close()
+
+
+def _save_archive(file: UploadFile) -> str:
+    # El job (quizá en otro proceso) necesita el ZIP: se copia tal cual a UPLOAD_DIR
+    file.file.seek(0)
+    total = 0
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".zip", dir=UPLOAD_DIR) as tmp:
+        while True:
+            chunk = file.file.read(1024 * 1024)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > BATCH_MAX_ARCHIVE_BYTES:
+                tmp.close()
+                _remove_upload(tmp.name)
+                raise HTTPException(status_code=413, detail=f"ZIP demasiado grande. Máximo {BATCH_MAX_ARCHIVE_BYTES // (1024 * 1024)}MB.")
+            tmp.write(chunk)
+        return tmp.name
+
+
+@app.post("/predict_images")
+def predict_images(
+    files: list[UploadFile] = File(...),
+    conf: confloat(ge=0.0, le=1.0) = Form(DEFAULT_MIN_CONF),
+    background: bool = Form(False),
+    current: User = Depends(get_current_user),
+):
+    # Varias imágenes y/o ZIPs -> NDJSON (una línea por imagen + resumen) en streaming.
+    # Un único ZIP grande (o background=true) se procesa como job: GET /status/{job_id}
+    sources, archives = _batch_sources(files)
+    if not sources:
+        raise HTTPException(status_code=400, detail="No hay imágenes")
+    if len(sources) > BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=413, detail=f"Demasiadas imágenes ({len(sources)}). Máximo {BATCH_MAX_IMAGES}.")
+
+    if background or len(sources) > BATCH_SYNC_MAX_IMAGES:
+        if len(files) != 1 or len(archives) != 1:
+            raise HTTPException(status_code=400,
+                                detail=f"Más de {BATCH_SYNC_MAX_IMAGES} imágenes: súbelas en un único ZIP (se procesa en segundo plano).")
+        archives[0].close()
+        tmp_path = _save_archive(files[0])
+        job_id = uuid.uuid4().hex
+        # Coste: una inferencia por imagen (misma unidad que los frames de vídeo)
+        submit_job(job_id, current.id, "image_batch",
+                   {"tmp_path": tmp_path, "conf": float(conf), "user_id": current.id}, cost=float(len(sources)))
+        return {"job_id": job_id, "images": len(sources), "background": True}
+
+    if image_executor.inflight >= image_executor.capacity:
+        for zf in archives:
+            zf.close()
+        raise _busy()
+    return StreamingResponse(_stream_batch(sources, archives, float(conf)), media_type="application/x-ndjson")
+
+
+def _process_image_batch_job(job_id: str, tmp_path: str, conf: float, user_id: str):
+    out_path = os.path.join(OUTPUT_DIR, f"{job_id}.ndjson")
+    part_path = out_path + ".part"
+    try:
+        _job_update(job_id, state="running", progress=0.01, message="Abriendo ZIP")
+        with zipfile.ZipFile(tmp_path) as zf, open(part_path, "w", encoding="utf-8") as out:
+            infos = _zip_images(zf)
+            sources = [(info.filename, partial(_read_member, zf, info)) for info in infos]
+            step = max(1, len(sources) // 100)
+            summary = {}
+            for done, line in enumerate(_batch_lines(sources, conf, summary), 1):
+                out.write(_ndjson(line))
+                if done % step == 0:
+                    _job_update(job_id, progress=0.01 + 0.98 * done / len(sources),
+                                message=f"Procesando... {done}/{len(sources)} imágenes")
+            out.write(_ndjson({"summary": summary}))
+        os.replace(part_path, out_path)
+
+        result = {**summary, "results_url": f"/images/batches/{job_id}.ndjson"}
+        _job_update(job_id, state="done", progress=1.0, message="Listo", result=result)
+    except JobCancelled:
+        _job_update(job_id, state="cancelled", message="Cancelado")
+    except Exception as e:
+        _job_update(job_id, state="error", progress=1.0, error=str(e))
+    finally:
+        _remove_upload(tmp_path)
+        if os.path.exists(part_path):
+            try:
+                os.remove(part_path)
+            except Exception:
+                pass
+
+
+JOB_HANDLERS["image_batch"] = _process_image_batch_job
+
+
+@app.get("/images/batches/{job_id}.ndjson")
+def get_image_batch(job_id: str, current: User = Depends(get_current_user)):
+    if current.id not in job_users(job_id):
+        raise HTTPException(status_code=404, detail="Job no encontrado.")
+    path = os.path.join(OUTPUT_DIR, f"{job_id}.ndjson")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Resultados no encontrados o expirados.")
+    return FileResponse(path, media_type="application/x-ndjson", filename=f"{job_id}.ndjson")
+
+
+# Los frames en directo van a image_executor y el BatchPredictor los agrupa: en paralelo caben
+# tantos como hilos tenga el executor, hasta el tamaño máximo de lote
+live_load = LiveLoad(infer_slots=min(image_executor.workers, INFER_MAX_BATCH))
+
+
+@app.get("/metrics/inference")
+def inference_metrics():
+    # Cola y lotes del micro-batching (versión activa del modelo) + carga del directo
+    mv = models.peek()
+    return {
+        **(mv.predictor.metrics() if mv else {}),
+        "model_version": mv.version if mv else None,
+        "image_executor": image_executor.metrics(),
+        "result_cache": result_cache.metrics(),
+        "live_connections": live_load.connections,
+        "live_suggested_interval_ms": live_load.suggested_interval_ms(),
+    }
+
+
+@app.get("/model")
+def model_status():
+    # Versión activa, tiempos de carga y warmup, y versiones retiradas que aún usa algún job
+    return models.status()
+
+
+@app.post("/model/swap")
+def model_swap(payload: dict = Body(...), x_admin_token: str | None = Header(default=None)):
+    if not MODEL_ADMIN_TOKEN or x_admin_token != MODEL_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="No autorizado")
+    if INFER_ENGINE == "remote":
+        raise HTTPException(status_code=409, detail="El modelo lo sirve infer_server.py: cámbialo allí (MODEL_PATH).")
+    path = (payload.get("path") or "").strip()
+    if not path:
+        raise HTTPException(status_code=400, detail="path requerido")
+    engine_name = (payload.get("engine") or "").strip().lower() or None
+
+    try:
+        mv = models.swap(path, engine_name)
+    except (FileNotFoundError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"No se pudo cargar el modelo: {e}")
+    return {"ok": True, **mv.info()}
+
+
+def _ws_user_id(token: str) -> str | None:
+    db = SessionLocal()
+    try:
+        return user_from_token(db, token).id
+    except HTTPException:
+        return None
+    finally:
+        db.close()
+
+
+@app.websocket("/ws/frames")
+async def ws_frames(websocket: WebSocket, access_token: str | None = None):
+    # Directo por WebSocket: autenticación una sola vez (?access_token= o primer mensaje
+    # {"token": ...}), frames JPEG como mensajes binarios y {"conf": x} para cambiar el umbral.
+    # Solo se procesa el frame más reciente: los que llegan mientras se infiere sustituyen al
+    # pendiente y se cuentan como descartados. Cada respuesta lleva interval_ms sugerido.
+    await websocket.accept()
+    token = access_token
+    if not token:
+        try:
+            token = json.loads(await websocket.receive_text()).get("token")
+        except Exception:
+            token = None
+    user_id = await run_in_threadpool(_ws_user_id, token) if token else None
+    if user_id is None:
+        await websocket.close(code=1008, reason="Token inválido")
+        return
+
+    state = {"conf": DEFAULT_MIN_CONF, "frame": None, "seq": 0, "dropped": 0, "closed": False}
+    ready = asyncio.Event()
+
+    async def receive_frames():
+        try:
+            while True:
+                msg = await websocket.receive()
+                if msg["type"] == "websocket.disconnect":
+                    return
+                if msg.get("bytes") is not None:
+                    data = msg["bytes"]
+                    if len(data) > LIVE_MAX_FRAME_BYTES:
+                        await websocket.close(code=1009, reason="Frame demasiado grande")
+                        return
+                    state["seq"] += 1
+                    if state["frame"] is not None:
+                        state["dropped"] += 1
+                    state["frame"] = (state["seq"], data)
+                    ready.set()
+                elif msg.get("text"):
+                    try:
+                        state["conf"] = min(1.0, max(0.0, float(json.loads(msg["text"])["conf"])))
+                    except (ValueError, KeyError, TypeError):
+                        await websocket.send_json({"type": "error", "detail": "Mensaje no válido"})
+        finally:
+            state["closed"] = True
+            ready.set()
+
+    async def process_frames():
+        while True:
+            await ready.wait()
+            ready.clear()
+            if state["closed"]:
+                return
+            if state["frame"] is None:
+                continue
+            (seq, data), state["frame"] = state["frame"], None
+            dropped, state["dropped"] = state["dropped"], 0
+            t0 = time.perf_counter()
+            try:
+                dets = await asyncio.wrap_future(image_executor.submit(_frame_detections, data, state["conf"]))
+            except HTTPException as e:
+                await websocket.close(code=1009, reason=e.detail)
+                return
+            except Saturated:
+                # Sin hueco: se descarta el frame y se pide al cliente que espace los envíos
+                await websocket.send_json({"type": "busy", "seq": seq,
+                                           "interval_ms": max(live_load.suggested_interval_ms(),
+                                                              _retry_after_seconds() * 1000)})
+                continue
+            infer_ms = (time.perf_counter() - t0) * 1000
+            live_load.observe(infer_ms)
+            await websocket.send_json({
+                "type": "detections",
+                "seq": seq,
+                "detections": dets,
+                "infer_ms": round(infer_ms, 1),
+                "dropped": dropped,
+                "interval_ms": live_load.suggested_interval_ms(),
             })
 
-    return {"ok": True, "detections": dets}
+    live_load.connect()
+    tasks = [asyncio.create_task(receive_frames()), asyncio.create_task(process_frames())]
+    try:
+        await websocket.send_json({"type": "ready", "interval_ms": live_load.suggested_interval_ms()})
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for t in done:
+            t.result()
+    except Exception as e:
+        log.info("ws/frames: conexión cerrada (%s)", e)
+    finally:
+        live_load.disconnect()
+        for t in tasks:
+            t.cancel()
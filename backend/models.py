@@ -1,4 +1,4 @@
-from sqlalchemy import String, DateTime, ForeignKey, Integer, Float, Text
+from sqlalchemy import String, DateTime, ForeignKey, Integer, Float, Text, Boolean
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from datetime import datetime
 import uuid
@@ -54,3 +54,46 @@ class Post(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True, nullable=False)
 
     user = relationship("User", back_populates="posts")
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    user_id: Mapped[str] = mapped_column(String, ForeignKey("users.id"), index=True, nullable=False)
+    kind: Mapped[str] = mapped_column(String(32), nullable=False)
+
+    state: Mapped[str] = mapped_column(String(16), index=True, nullable=False, default="queued")
+    progress: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    message: Mapped[str] = mapped_column(String(255), nullable=False, default="")
+    error: Mapped[str] = mapped_column(Text, nullable=True)
+
+    params_json: Mapped[str] = mapped_column(Text, nullable=False, default="{}")
+    result_json: Mapped[str] = mapped_column(Text, nullable=True)
+    # Coste esperado (frames a inferir, frame_count/stride) para el planificador y la ETA
+    cost: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    cancel_requested: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+
+    worker_id: Mapped[str] = mapped_column(String(128), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True, nullable=False)
+    started_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class JobWatcher(Base):
+    # Usuarios que enviaron el mismo vídeo mientras su job estaba en curso (se unen al job)
+    __tablename__ = "job_watchers"
+
+    job_id: Mapped[str] = mapped_column(String(64), ForeignKey("jobs.id", ondelete="CASCADE"), primary_key=True)
+    user_id: Mapped[str] = mapped_column(String, ForeignKey("users.id"), primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class JobPartial(Base):
+    # Resultados parciales ya cerrados (segmentos) mientras el job está en curso: una fila por
+    # resultado, así añadir uno no reescribe los anteriores
+    __tablename__ = "job_partials"
+
+    job_id: Mapped[str] = mapped_column(String(64), ForeignKey("jobs.id", ondelete="CASCADE"), primary_key=True)
+    index: Mapped[int] = mapped_column(Integer, primary_key=True)
+    item_json: Mapped[str] = mapped_column(Text, nullable=False)
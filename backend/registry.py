@@ -0,0 +1,291 @@
+# Registro del modelo activo: carga perezosa o en segundo plano (importar main no carga torch
+# ni los pesos), warmup al imgsz configurado y cambio atómico a otros pesos sin reiniciar.
+# Cada versión tiene su motor y su BatchPredictor; los jobs la fijan con use() durante todo el
+# vídeo, así que un cambio solo afecta a lo que empieza después y la versión vieja se libera
+# cuando termina lo último que la usaba.
+# El cambio se anota en un fichero puntero (en outputs/) que los demás procesos (worker.py,
+# otros workers de gunicorn) revisan cada pocos segundos para cargar los mismos pesos.
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from engines import load_engine, engine_for
+from batching import BatchPredictor
+
+
+log = logging.getLogger("birds-backend")
+
+
+def file_sha256(path: str) -> str:
+    # Huella de los pesos (clave de los caches); si path no es un fichero, la de la propia ruta
+    if not os.path.isfile(path):
+        return hashlib.sha256(path.encode()).hexdigest()
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ModelVersion:
+    def __init__(self, version: int, path: str, engine_name: str | None, engine, predictor: BatchPredictor,
+                 sha256: str, load_ms: float, warmup_ms: dict):
+        self.version = version
+        self.path = path
+        self.engine_name = engine_name  # el pedido (None => según extensión), para comparar con el puntero
+        self.engine = engine
+        self.predictor = predictor
+        self.sha256 = sha256
+        self.load_ms = load_ms
+        self.warmup_ms = warmup_ms
+        self.loaded_at = time.time()
+        self.refs = 0
+        self.retired = False
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "path": self.path,
+            "engine": self.engine.name,
+            "sha256": self.sha256,
+            "imgsz": self.engine.imgsz,
+            "classes": len(self.engine.names),
+            "load_ms": self.load_ms,
+            "warmup_ms": self.warmup_ms,
+            "loaded_at": self.loaded_at,
+            "in_use": self.refs,
+        }
+
+
+class ModelRegistry:
+    def __init__(self, path: str, imgsz: int, engine: str | None = None, max_batch: int = 8,
+                 max_wait_ms: float = 5.0, warmup_runs: int = 2, pointer_path: str | None = None,
+                 pointer_check_seconds: float = 5.0, on_retire=None):
+        self.path = path
+        self.imgsz = imgsz
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.warmup_runs = max(0, warmup_runs)
+        self.pointer_path = pointer_path
+        self.pointer_check_seconds = pointer_check_seconds
+        self.on_retire = on_retire  # fn(ModelVersion) cuando una versión retirada deja de usarse
+
+        self._lock = threading.Lock()
+        self._swap_lock = threading.Lock()
+        self._loaded = threading.Event()
+        self._current = None
+        self._retired = []
+        self._next_version = 1
+        self._loader = None
+        self._state = "idle"  # idle | loading | ready | error
+        self._swapping = None
+        self._last_error = None
+        self._pointer_mtime = None
+        self._pointer_checked = 0.0
+
+    # ---------------- Carga ----------------
+    def start(self):
+        # Carga inicial en segundo plano (idempotente); current() espera a que termine
+        with self._lock:
+            if self._loader is not None:
+                return
+            self._state = "loading"
+            self._loader = threading.Thread(target=self._initial_load, name="model-loader", daemon=True)
+            self._loader.start()
+
+    def _initial_load(self):
+        # Si otro proceso ya cambió de modelo se arranca con ese; si falla, con MODEL_PATH
+        targets = [{"path": self.path, "engine": self.engine}]
+        pointer = self._read_pointer()
+        if pointer and (pointer["path"], pointer.get("engine")) != (self.path, self.engine):
+            targets.insert(0, pointer)
+        if self.pointer_path and os.path.exists(self.pointer_path):
+            self._pointer_mtime = os.stat(self.pointer_path).st_mtime
+        for target in targets:
+            try:
+                self._swap(target["path"], target.get("engine"))
+                return
+            except Exception as e:
+                log.exception("No se pudo cargar el modelo %s", target["path"])
+                with self._lock:
+                    self._last_error = str(e)
+        with self._lock:
+            self._state = "error"
+        self._loaded.set()
+
+    def _load(self, path: str, engine: str | None) -> ModelVersion:
+        t0 = time.perf_counter()
+        eng = load_engine(path, self.imgsz, engine)
+        load_ms = round((time.perf_counter() - t0) * 1000, 1)
+
+        # Warmup: la primera inferencia (y el primer lote completo) no la paga una petición real
+        warmup_ms = {}
+        for size in sorted({1, self.max_batch}) if self.warmup_runs else ():
+            images = [np.zeros((eng.imgsz, eng.imgsz, 3), dtype=np.uint8)] * size
+            times = []
+            for _ in range(self.warmup_runs):
+                t1 = time.perf_counter()
+                eng.predict(images, 0.99)
+                times.append(round((time.perf_counter() - t1) * 1000, 1))
+            warmup_ms[f"batch_{size}"] = times
+
+        sha256 = getattr(eng, "model_sha256", None) or file_sha256(path)
+        predictor = BatchPredictor(eng.predict, self.max_batch, self.max_wait_ms)
+        with self._lock:
+            version = self._next_version
+            self._next_version += 1
+        log.info("Modelo v%d cargado: %s (%s) en %.0f ms, warmup %s", version, path, eng.name, load_ms, warmup_ms)
+        return ModelVersion(version, path, engine, eng, predictor, sha256, load_ms, warmup_ms)
+
+    def _swap(self, path: str, engine: str | None) -> ModelVersion:
+        with self._swap_lock:
+            with self._lock:
+                self._swapping = path
+            try:
+                mv = self._load(path, engine)
+            finally:
+                with self._lock:
+                    self._swapping = None
+            with self._lock:
+                old = self._current
+                self._current = mv
+                self._state = "ready"
+                self._last_error = None
+                if old is not None:
+                    old.retired = True
+                    self._retired.append(old)
+            self._loaded.set()
+            if old is not None:
+                self._release_if_idle(old)
+            return mv
+
+    def swap(self, path: str, engine: str | None = None) -> ModelVersion:
+        # Carga y warmup en el hilo que llama; las peticiones siguen con la versión actual hasta
+        # el cambio. Los demás procesos lo recogen del puntero
+        engine_for(path, engine)  # valida el motor antes de cargar nada
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No existe el modelo {path}")
+        mv = self._swap(path, engine)
+        self._write_pointer(mv)
+        return mv
+
+    # ---------------- Uso ----------------
+    def current(self, timeout: float | None = None) -> ModelVersion:
+        self._maybe_refresh()
+        if not self._loaded.is_set():
+            self.start()
+            if not self._loaded.wait(timeout):
+                raise RuntimeError("El modelo aún se está cargando")
+        mv = self._current
+        if mv is None:
+            raise RuntimeError(f"No se pudo cargar el modelo: {self._last_error}")
+        return mv
+
+    def peek(self) -> ModelVersion | None:
+        # Versión activa sin esperar a la carga (métricas)
+        return self._current
+
+    @contextmanager
+    def use(self, timeout: float | None = None):
+        # Fija la versión actual mientras dura el bloque (un job de vídeo entero, una imagen)
+        with self._lock:
+            mv = self._current
+            if mv is not None:
+                mv.refs += 1
+        if mv is None:
+            self.current(timeout)
+            with self._lock:
+                mv = self._current
+                mv.refs += 1
+        self._maybe_refresh()
+        try:
+            yield mv
+        finally:
+            with self._lock:
+                mv.refs -= 1
+            if mv.retired:
+                self._release_if_idle(mv)
+
+    def _release_if_idle(self, mv: ModelVersion):
+        with self._lock:
+            if mv.refs > 0 or mv not in self._retired:
+                return
+            self._retired.remove(mv)
+        log.info("Modelo v%d liberado", mv.version)
+        mv.predictor.close()
+        close = getattr(mv.engine, "close", None)
+        if close is not None:
+            close()
+        if self.on_retire is not None:
+            self.on_retire(mv)
+
+    # ---------------- Puntero compartido ----------------
+    def _read_pointer(self) -> dict | None:
+        if not self.pointer_path:
+            return None
+        try:
+            with open(self.pointer_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return data if data.get("path") else None
+
+    def _write_pointer(self, mv: ModelVersion):
+        if not self.pointer_path:
+            return
+        tmp = f"{self.pointer_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"path": mv.path, "engine": mv.engine_name, "sha256": mv.sha256, "swapped_at": time.time()}, f)
+        os.replace(tmp, self.pointer_path)
+        self._pointer_mtime = os.stat(self.pointer_path).st_mtime
+
+    def _maybe_refresh(self):
+        # Como mucho un stat cada pointer_check_seconds; si otro proceso cambió de modelo se carga
+        # el mismo en segundo plano y se sigue con el actual mientras tanto
+        if not self.pointer_path:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._pointer_checked < self.pointer_check_seconds or self._swapping or self._current is None:
+                return
+            self._pointer_checked = now
+        try:
+            mtime = os.stat(self.pointer_path).st_mtime
+        except OSError:
+            return
+        if mtime == self._pointer_mtime:
+            return
+        self._pointer_mtime = mtime
+        target = self._read_pointer()
+        mv = self._current
+        if target is None or (target["path"], target.get("engine")) == (mv.path, mv.engine_name):
+            return
+        log.info("Otro proceso cambió el modelo a %s; cargándolo", target["path"])
+        threading.Thread(target=self._refresh, args=(target["path"], target.get("engine")),
+                         name="model-refresh", daemon=True).start()
+
+    def _refresh(self, path: str, engine: str | None):
+        try:
+            self._swap(path, engine)
+        except Exception as e:
+            log.exception("No se pudo cargar el modelo %s", path)
+            with self._lock:
+                self._last_error = str(e)
+
+    def status(self) -> dict:
+        with self._lock:
+            mv = self._current
+            return {
+                "state": self._state,
+                "current": mv.info() if mv else None,
+                "loading": self._swapping,
+                "retired_in_use": [{"version": r.version, "path": r.path, "in_use": r.refs} for r in self._retired],
+                "last_error": self._last_error,
+            }
@@ -0,0 +1,170 @@
+# Cache de resultados de imágenes y frames por contenido: clave = tipo + sha256 de los bytes +
+# versión de los pesos + conf + imgsz. LRU en memoria con tope de entradas y de bytes, y
+# opcionalmente un nivel en disco (write-through, compartible entre procesos) con su propio
+# tope en bytes. Los valores se guardan ya serializados en JSON: el tamaño contado es el real.
+import os
+import json
+import threading
+from collections import OrderedDict
+
+
+def result_key(kind: str, digest: str, model_sha256: str, conf: float, imgsz: int) -> str:
+    return f"{kind}-{digest}-{model_sha256[:16]}-c{round(float(conf), 4):.4f}-i{imgsz}"
+
+
+class ResultCache:
+    def __init__(self, max_entries: int, max_bytes: int, disk_dir: str | None = None, disk_max_bytes: int = 0):
+        self.max_entries = max(0, max_entries)
+        self.max_bytes = max(0, max_bytes)
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = max(0, disk_max_bytes)
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> bytes (JSON)
+        self._bytes = 0
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._disk_evictions = 0
+        self._disk_writes = 0
+        self._disk_bytes = None  # se calcula en la primera poda
+        self._prune_lock = threading.Lock()  # una poda a la vez
+
+    @property
+    def enabled(self) -> bool:
+        return (self.max_entries > 0 and self.max_bytes > 0) or bool(self.disk_dir)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def get(self, key: str):
+        with self._lock:
+            raw = self._entries.get(key)
+            if raw is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+        if raw is None and self.disk_dir:
+            raw = self._disk_get(key)
+        if raw is None:
+            with self._lock:
+                self._misses += 1
+            return None
+        return json.loads(raw)
+
+    def _disk_get(self, key: str) -> bytes | None:
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+            os.utime(path)  # mtime = último uso, para podar por LRU
+        except OSError:
+            return None
+        with self._lock:
+            self._disk_hits += 1
+            self._insert(key, raw)
+        return raw
+
+    def put(self, key: str, value):
+        raw = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        with self._lock:
+            self._insert(key, raw)
+        if self.disk_dir:
+            self._disk_put(key, raw)
+
+    def _insert(self, key: str, raw: bytes):
+        # Con el lock tomado
+        if self.max_entries <= 0 or len(raw) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._entries[key] = raw
+        self._bytes += len(raw)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self._evictions += 1
+
+    def _disk_put(self, key: str, raw: bytes):
+        path = self._disk_path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(raw)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_writes += 1
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(raw)
+            prune = self._disk_bytes is None or self._disk_bytes > self.disk_max_bytes
+        if prune:
+            self._schedule_prune()
+
+    def _schedule_prune(self):
+        # La poda (listdir + stat de todo el directorio) va en su propio hilo para no retrasar la
+        # petición que escribió; si ya hay una en curso no se lanza otra
+        if not self._prune_lock.acquire(blocking=False):
+            return
+        threading.Thread(target=self._prune_in_background, name="result-cache-prune", daemon=True).start()
+
+    def _prune_in_background(self):
+        try:
+            self._disk_prune()
+        finally:
+            self._prune_lock.release()
+
+    def _disk_prune(self):
+        # Borra los menos usados (mtime más antiguo) hasta quedar en el 90% del tope
+        entries = []
+        total = 0
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.disk_dir, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+        removed = 0
+        if total > self.disk_max_bytes:
+            target = self.disk_max_bytes * 0.9
+            for _, size, name in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.remove(os.path.join(self.disk_dir, name))
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+        with self._lock:
+            self._disk_bytes = total
+            self._disk_evictions += removed
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._disk_hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_ratio": round((self._hits + self._disk_hits) / lookups, 3) if lookups else None,
+                "evictions": self._evictions,
+                "disk": {
+                    "dir": self.disk_dir,
+                    "bytes": self._disk_bytes,
+                    "max_bytes": self.disk_max_bytes,
+                    "writes": self._disk_writes,
+                    "evictions": self._disk_evictions,
+                } if self.disk_dir else None,
+            }
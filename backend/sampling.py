@@ -0,0 +1,85 @@
+# Qué frames de un vídeo pasan por el modelo.
+# is_candidate(): frames que hay que decodificar para decidir (el resto solo grab/skip);
+# decide(): se infiere o no ese frame; observe(): resultado de la inferencia (puede llegar
+# con retraso por el batching, el sampler decide con lo último que conoce).
+import cv2
+
+
+class FixedSampler:
+    def __init__(self, stride: int):
+        self.stride = max(1, stride)
+        self.max_stride = self.stride  # hueco máximo entre dos frames inferidos
+
+    def is_candidate(self, frame_idx: int) -> bool:
+        return frame_idx % self.stride == 0
+
+    def decide(self, frame_idx: int, frame) -> bool:
+        return True
+
+    def observe(self, frame_idx: int, dets: list[dict]):
+        pass
+
+
+class MotionSampler:
+    # Stride adaptativo con diferencia de frames reducidos:
+    # - con aves en escena se infiere cada `stride` frames;
+    # - escena vacía: el stride se dobla hasta max_stride, y solo se infiere antes si hay
+    #   movimiento respecto al último frame inferido;
+    # - nunca pasan más de max_stride frames sin inferir (aves quietas, cambios de luz lentos).
+    def __init__(self, stride: int, max_stride: int, motion_threshold: float, small_width: int = 96,
+                 pixel_delta: int = 25):
+        # motion_threshold: fracción de píxeles (en el frame reducido) que cambian más de pixel_delta
+        self.stride = max(1, stride)
+        # Rejilla de evaluación divisora del stride: con aves la cadencia es exactamente `stride`
+        self.check_every = next(d for d in range(max(1, self.stride // 2), 0, -1) if self.stride % d == 0)
+        self.max_stride = max(self.stride, max_stride)
+        self.motion_threshold = motion_threshold
+        self.small_width = small_width
+        self.pixel_delta = pixel_delta
+
+        self.current_stride = self.stride
+        self.last_infer_idx = None
+        self.ref = None
+        self.birds_present = False
+
+    def is_candidate(self, frame_idx: int) -> bool:
+        return frame_idx % self.check_every == 0
+
+    def _small(self, frame):
+        h, w = frame.shape[:2]
+        sh = max(1, int(h * self.small_width / max(1, w)))
+        small = cv2.resize(frame, (self.small_width, sh), interpolation=cv2.INTER_AREA)
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def decide(self, frame_idx: int, frame) -> bool:
+        small = self._small(frame)
+        if self.last_infer_idx is None:
+            infer = True
+        else:
+            since = frame_idx - self.last_infer_idx
+            if since >= self.max_stride:
+                infer = True
+            elif self.birds_present:
+                infer = since >= self.stride
+            else:
+                motion = float((cv2.absdiff(small, self.ref) > self.pixel_delta).mean())
+                infer = motion >= self.motion_threshold or since >= self.current_stride
+
+        if infer:
+            self.last_infer_idx = frame_idx
+            self.ref = small
+        return infer
+
+    def observe(self, frame_idx: int, dets: list[dict]):
+        self.birds_present = bool(dets)
+        if dets:
+            self.current_stride = self.stride
+        else:
+            self.current_stride = min(self.max_stride, self.current_stride * 2)
+
+
+def make_sampler(stride: int, adaptive: bool, max_stride_mult: int, motion_threshold: float):
+    if adaptive:
+        return MotionSampler(stride, stride * max(1, max_stride_mult), motion_threshold)
+    return FixedSampler(stride)
@@ -0,0 +1,105 @@
+# Estadísticas de un vídeo en streaming: se alimenta frame a frame (en orden) y construye
+# los segmentos online. Los tiempos de cada especie quedan ordenados por construcción, así que
+# el conteo por segmento es una búsqueda binaria en vez de recorrer todas las detecciones.
+from bisect import bisect_left, bisect_right
+
+
+class _SegmentBuilder:
+    # Agrupa tiempos crecientes en segmentos separados por más de gap_s
+    def __init__(self, gap_s: float):
+        self.gap_s = gap_s
+        self.segments = []
+        self.start = None
+        self.last = None
+
+    def add(self, t: float):
+        if self.last is None:
+            self.start = self.last = t
+        elif (t - self.last) <= self.gap_s:
+            self.last = t
+        else:
+            self.segments.append({"start_time": self.start, "end_time": self.last})
+            self.start = self.last = t
+
+    def result(self) -> list[dict]:
+        if self.last is None:
+            return list(self.segments)
+        return self.segments + [{"start_time": self.start, "end_time": self.last}]
+
+
+def _ranking(counts: dict) -> list[dict]:
+    return sorted(
+        [{"species": sp, "count": c} for sp, c in counts.items()],
+        key=lambda x: x["count"],
+        reverse=True
+    )
+
+
+class StatsAccumulator:
+    def __init__(self, fps: float, gap_s: float, on_segment=None):
+        # on_segment(segmento enriquecido) se llama en cuanto un segmento se cierra
+        self.fps = fps
+        self.gap_s = gap_s
+        self.on_segment = on_segment
+        self.num_detect_points = 0
+        self.segments = _SegmentBuilder(gap_s)
+        self.species_counter = {}
+        self.species_times = {}  # especie -> tiempos (ordenados) de cada detección
+        self.species_segments = {}
+
+    def add(self, frame_idx: int, dets: list[dict]):
+        # Frames inferidos en orden creciente de frame_idx
+        tsec = frame_idx / self.fps if self.fps > 0 else None
+        for det in dets:
+            cls_name = det["class"]
+            self.species_counter[cls_name] = self.species_counter.get(cls_name, 0) + 1
+            if tsec is not None:
+                self.species_times.setdefault(cls_name, []).append(tsec)
+                if cls_name not in self.species_segments:
+                    self.species_segments[cls_name] = _SegmentBuilder(self.gap_s)
+                self.species_segments[cls_name].add(tsec)
+        if dets and tsec is not None:
+            self.num_detect_points += 1
+            closed = len(self.segments.segments)
+            self.segments.add(tsec)
+            if self.on_segment is not None and len(self.segments.segments) > closed:
+                self.on_segment(self._enrich(self.segments.segments[-1]))
+
+    def count_between(self, species: str, start: float, end: float) -> int:
+        ts = self.species_times.get(species, [])
+        return bisect_right(ts, end) - bisect_left(ts, start)
+
+    def top_for_segment(self, start: float, end: float) -> dict:
+        best_sp, best_cnt = None, 0
+        for sp in self.species_times:
+            cnt = self.count_between(sp, start, end)
+            if cnt > best_cnt:
+                best_cnt = cnt
+                best_sp = sp
+        return {"species": best_sp, "count": best_cnt}
+
+    def _enrich(self, seg: dict) -> dict:
+        enriched = dict(seg)
+        enriched["top_species"] = self.top_for_segment(seg["start_time"], seg["end_time"])
+        return enriched
+
+    def result(self, individuals: dict | None = None) -> dict:
+        # individuals: especie -> nº de individuos según el tracker (None sin tracking)
+        segments_enriched = [self._enrich(seg) for seg in self.segments.result()]
+
+        species_ranking = _ranking(self.species_counter)
+        return {
+            "num_inference_points_with_detections": self.num_detect_points,
+            "top_species_overall": species_ranking[0]["species"] if species_ranking else None,
+            "segments": segments_enriched,
+            "species_ranking": species_ranking,
+            "species_individuals": _ranking(individuals) if individuals is not None else None,
+            "species_segments": {sp: b.result() for sp, b in self.species_segments.items()},
+        }
+
+
+def video_stats(frame_dets, fps: float, gap_s: float, individuals: dict | None = None) -> dict:
+    acc = StatsAccumulator(fps, gap_s)
+    for frame_idx, dets in frame_dets:
+        acc.add(frame_idx, dets)
+    return acc.result(individuals)
@@ -0,0 +1,82 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from admission import BoundedExecutor, Saturated
+
+
+def _wait_idle(executor: BoundedExecutor, timeout: float = 5.0):
+    # El hueco se libera en el callback del future, justo después de tener el resultado
+    deadline = time.monotonic() + timeout
+    while executor.inflight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert executor.inflight == 0
+
+
+def test_submit_rejects_beyond_workers_plus_queue():
+    executor = BoundedExecutor(2, 1, "test-admission")
+    release = threading.Event()
+    futures = [executor.submit(release.wait, 5) for _ in range(3)]
+    with pytest.raises(Saturated):
+        executor.submit(release.wait, 5)
+    m = executor.metrics()
+    assert (m["capacity"], m["inflight"], m["accepted"], m["rejected"]) == (3, 3, 3, 1)
+
+    release.set()
+    for fut in futures:
+        fut.result(5)
+    _wait_idle(executor)
+    assert executor.submit(lambda: 42).result(5) == 42
+
+
+def test_slot_is_released_when_the_task_raises():
+    executor = BoundedExecutor(1, 0, "test-admission")
+
+    def boom():
+        raise ValueError("imagen corrupta")
+
+    fut = executor.submit(boom)
+    with pytest.raises(ValueError):
+        fut.result(5)
+    _wait_idle(executor)
+    assert executor.submit(lambda: "ok").result(5) == "ok"
+    assert executor.metrics()["rejected"] == 0
+
+
+def test_wait_for_slot():
+    executor = BoundedExecutor(1, 0, "test-admission")
+    release = threading.Event()
+    executor.submit(release.wait, 5)
+    assert not executor.wait_for_slot(0.05)
+    threading.Timer(0.05, release.set).start()
+    assert executor.wait_for_slot(5)
+
+
+@pytest.fixture
+def saturated(monkeypatch):
+    # image_executor lleno por otras peticiones y un usuario autenticado cualquiera
+    executor = BoundedExecutor(1, 0, "test-admission")
+    release = threading.Event()
+    executor.submit(release.wait, 10)
+    monkeypatch.setattr(main, "image_executor", executor)
+    main.app.dependency_overrides[main.get_current_user] = lambda: SimpleNamespace(id="test-user")
+    yield executor
+    main.app.dependency_overrides.clear()
+    release.set()
+
+
+def test_predict_image_answers_503_with_retry_after_when_saturated(saturated):
+    # Sin "with": no arrancan los eventos de startup (carga del modelo, workers de jobs)
+    client = TestClient(main.app)
+    r = client.post("/predict_image", files={"file": ("a.jpg", b"\xff\xd8\xff", "image/jpeg")})
+    assert r.status_code == 503
+    assert int(r.headers["Retry-After"]) >= 1
+    assert saturated.metrics()["rejected"] == 1
+
+    r = client.post("/predict_images", files=[("files", ("a.jpg", b"\xff\xd8\xff", "image/jpeg"))])
+    assert r.status_code == 503
+    assert int(r.headers["Retry-After"]) >= 1
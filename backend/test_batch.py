@@ -0,0 +1,44 @@
+import threading
+import time
+
+import main
+from admission import BoundedExecutor
+
+
+def _sources(n: int) -> list:
+    return [(f"{i}.jpg", lambda i=i: b"img%d" % i) for i in range(n)]
+
+
+def _fill(executor: BoundedExecutor) -> threading.Event:
+    # Ocupa todo el executor (otras peticiones) hasta que se suelte el evento
+    release = threading.Event()
+    for _ in range(executor.capacity):
+        executor.submit(release.wait, 10)
+    return release
+
+
+def test_batch_waits_for_a_free_slot(monkeypatch):
+    executor = BoundedExecutor(1, 0, "test-batch")
+    monkeypatch.setattr(main, "image_executor", executor)
+    monkeypatch.setattr(main, "_batch_detections", lambda data, conf: ([], 10, 10))
+    release = _fill(executor)
+    threading.Timer(0.2, release.set).start()
+
+    t0 = time.monotonic()
+    lines = list(main._batch_results(_sources(3), 0.25))
+    assert time.monotonic() - t0 >= 0.2
+    assert [line["ok"] for line in lines] == [True, True, True]
+    assert [line["index"] for line in lines] == [0, 1, 2]
+
+
+def test_batch_item_fails_with_503_after_the_deadline(monkeypatch):
+    executor = BoundedExecutor(1, 0, "test-batch")
+    monkeypatch.setattr(main, "image_executor", executor)
+    monkeypatch.setattr(main, "BATCH_SLOT_WAIT_SECONDS", 0.1)
+    release = _fill(executor)
+    try:
+        lines = list(main._batch_results(_sources(2), 0.25))
+    finally:
+        release.set()
+    assert [line["ok"] for line in lines] == [False, False]
+    assert lines[0]["error"] == main._busy().detail
@@ -0,0 +1,74 @@
+import struct
+
+import cv2
+import numpy as np
+import pytest
+
+from decoding import ImageTooLarge, decode_image, image_header, reduced_factor
+
+
+def _jpeg(w: int, h: int) -> bytes:
+    img = np.zeros((h, w, 3), dtype=np.uint8)
+    img[:, : w // 2] = (0, 0, 255)
+    return cv2.imencode(".jpg", img)[1].tobytes()
+
+
+def _png(w: int, h: int) -> bytes:
+    return cv2.imencode(".png", np.zeros((h, w, 3), dtype=np.uint8))[1].tobytes()
+
+
+def _with_orientation(jpeg: bytes, orientation: int) -> bytes:
+    # Segmento APP1 Exif mínimo (little endian) con una sola entrada: Orientation
+    tiff = b"II*\x00" + struct.pack("<I", 8) + struct.pack("<H", 1)
+    tiff += struct.pack("<HHIHH", 0x0112, 3, 1, orientation, 0) + struct.pack("<I", 0)
+    payload = b"Exif\x00\x00" + tiff
+    return jpeg[:2] + b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload + jpeg[2:]
+
+
+def test_image_header():
+    assert image_header(_jpeg(320, 200)) == ("jpeg", 320, 200)
+    assert image_header(_png(33, 17)) == ("png", 33, 17)
+    assert image_header(b"GIF89a....") is None
+    assert image_header(b"\xff\xd8\xff\xe0\x00") is None
+
+
+def test_reduced_factor_keeps_long_side_above_target():
+    assert reduced_factor(6000, 4000, 640) == 8
+    assert reduced_factor(4000, 3000, 640) == 4
+    assert reduced_factor(1920, 1080, 640) == 2
+    assert reduced_factor(1000, 800, 640) == 1
+    assert reduced_factor(640, 480, 640) == 1
+
+
+def test_large_jpeg_is_decoded_reduced_with_original_size():
+    img, w, h = decode_image(_jpeg(4000, 3000), 640, 0)
+    assert (w, h) == (4000, 3000)
+    assert img.shape[:2] == (750, 1000)
+    assert max(img.shape[:2]) >= 640
+
+
+def test_small_and_png_images_are_decoded_at_full_size():
+    img, w, h = decode_image(_jpeg(800, 600), 640, 0)
+    assert img.shape[:2] == (600, 800) and (w, h) == (800, 600)
+    img, w, h = decode_image(_png(3000, 2000), 640, 0)
+    assert img.shape[:2] == (2000, 3000) and (w, h) == (3000, 2000)
+
+
+def test_too_many_pixels_is_rejected_from_the_header():
+    with pytest.raises(ImageTooLarge):
+        decode_image(_jpeg(4000, 3000), 640, 10_000_000)
+    with pytest.raises(ImageTooLarge):
+        decode_image(_png(4000, 3000), 640, 10_000_000)
+    assert decode_image(_jpeg(4000, 3000), 640, 12_000_000) is not None
+
+
+def test_undecodable_data():
+    assert decode_image(b"not an image", 640, 0) is None
+
+
+def test_exif_rotation_swaps_original_size():
+    # Orientation 6 (90º): el decodificador devuelve la imagen en vertical
+    img, w, h = decode_image(_with_orientation(_jpeg(4000, 3000), 6), 640, 0)
+    assert img.shape[:2] == (1000, 750)
+    assert (w, h) == (3000, 4000)
+    assert w / img.shape[1] == pytest.approx(4.0) and h / img.shape[0] == pytest.approx(4.0)
@@ -0,0 +1,79 @@
+import os
+import random
+
+import pytest
+
+from detstore import DetectionStore, DetectionWriter, store_paths
+
+VIDEO = {"fps": 10.0, "frame_count": 300, "width": 640, "height": 480}
+
+
+def _frames(seed: int = 0) -> list:
+    rnd = random.Random(seed)
+    out = []
+    for frame_idx in range(0, 300, 3):
+        dets = []
+        for _ in range(rnd.randint(0, 3)):
+            x, y = rnd.uniform(0, 600), rnd.uniform(0, 440)
+            dets.append({
+                "class": rnd.choice(["robin", "sparrow", "blackbird"]),
+                "confidence": round(rnd.uniform(0.05, 1.0), 3),
+                "bbox": [x, y, x + 40.0, y + 40.0],
+            })
+        out.append((frame_idx, dets))
+    return out
+
+
+def _write(base: str, frames: list, buffer_rows: int = 4096) -> DetectionStore:
+    writer = DetectionWriter(base, buffer_rows=buffer_rows)
+    for frame_idx, dets in frames:
+        writer.add(frame_idx, dets)
+    return writer.close(0.05, VIDEO)
+
+
+def _approx(frames: list) -> list:
+    # float32 en disco
+    return [
+        (idx, [{**d, "confidence": pytest.approx(d["confidence"], abs=1e-6),
+                "bbox": pytest.approx(d["bbox"], abs=1e-3)} for d in dets])
+        for idx, dets in frames
+    ]
+
+
+@pytest.mark.parametrize("buffer_rows", [4096, 7])
+def test_round_trip_after_reopen(tmp_path, buffer_rows):
+    frames = _frames()
+    base = str(tmp_path / "raw")
+    _write(base, frames, buffer_rows)
+
+    store = DetectionStore.open(base)
+    assert store.min_conf == 0.05 and store.video == VIDEO
+    assert store.frame_dets() == _approx(frames)
+    # Los frames inferidos sin detecciones también se conservan
+    assert [idx for idx, _ in store.frame_dets()] == [idx for idx, _ in frames]
+
+
+def test_conf_filter_and_frame_ranges(tmp_path):
+    frames = _frames(1)
+    store = _write(str(tmp_path / "raw"), frames)
+
+    filtered = [(idx, [d for d in dets if d["confidence"] >= 0.5]) for idx, dets in frames]
+    assert store.frame_dets(min_conf=0.5) == _approx(filtered)
+    part = [(idx, dets) for idx, dets in frames if 30 <= idx < 120]
+    assert store.frame_dets(30, 120) == _approx(part)
+    dets, inferred = store.slice_time(3.0, 12.0)
+    assert inferred.tolist() == [idx for idx, _ in part]
+    assert len(dets) == sum(len(d) for _, d in part)
+
+
+def test_incomplete_store_is_not_opened(tmp_path):
+    base = str(tmp_path / "raw")
+    writer = DetectionWriter(base)
+    writer.add(0, _frames()[1][1])
+    assert DetectionStore.open(base) is None
+    writer.abort()
+    assert os.listdir(tmp_path) == []
+
+    _write(base, _frames())
+    os.remove(store_paths(base)[0])
+    assert DetectionStore.open(base) is None
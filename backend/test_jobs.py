@@ -0,0 +1,256 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+import jobs
+from db import Base, SessionLocal, engine
+from models import Job, User
+
+
+@pytest.fixture(autouse=True)
+def fresh_db():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    jobs._invalidate_queue_info()
+    yield
+
+
+def _user() -> str:
+    db = SessionLocal()
+    try:
+        u = User(email=f"{time.time_ns()}@test", password_hash="x")
+        db.add(u)
+        db.commit()
+        return u.id
+    finally:
+        db.close()
+
+
+def _age(job_id: str, seconds: float):
+    db = SessionLocal()
+    try:
+        db.execute(update(Job).where(Job.id == job_id)
+                   .values(updated_at=datetime.utcnow() - timedelta(seconds=seconds)))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _worker_of(job_id: str) -> str:
+    db = SessionLocal()
+    try:
+        return db.get(Job, job_id).worker_id
+    finally:
+        db.close()
+
+
+def test_claim_job_marks_running_and_returns_params():
+    uid = _user()
+    assert jobs.submit_job("j1", uid, "video", {"stride": 5}, cost=10)
+    assert jobs.claim_job("w1", ["video"]) == ("j1", "video", {"stride": 5})
+    j = jobs.get_job("j1")
+    assert j["state"] == "running"
+    assert jobs.claim_job("w2", ["video"]) is None
+
+
+def test_claim_job_filters_by_kind():
+    uid = _user()
+    jobs.submit_job("j1", uid, "image_batch", {})
+    assert jobs.claim_job("w1", ["video"]) is None
+    assert jobs.claim_job("w1", ["image_batch"])[0] == "j1"
+
+
+def test_requeue_stale_only_requeues_expired_leases():
+    uid = _user()
+    jobs.submit_job("dead", uid, "video", {})
+    jobs.submit_job("alive", uid, "video", {})
+    jobs.claim_job("w1", ["video"])
+    jobs.claim_job("w2", ["video"])
+    _age("dead", 120)
+    _age("alive", 120)
+    assert jobs.heartbeat("alive", _worker_of("alive"))
+
+    assert jobs.requeue_stale(60) == 1
+    assert jobs.get_job("dead")["state"] == "queued"
+    assert jobs.get_job("alive")["state"] == "running"
+
+
+def test_heartbeat_is_refused_after_the_job_changes_hands():
+    uid = _user()
+    jobs.submit_job("j1", uid, "video", {})
+    jobs.claim_job("w1", ["video"])
+    _age("j1", 120)
+    jobs.requeue_stale(60)
+    jobs.claim_job("w2", ["video"])
+    assert not jobs.heartbeat("j1", "w1")
+    assert jobs.heartbeat("j1", "w2")
+
+
+def test_requeue_stale_cancels_stale_jobs_with_cancel_requested():
+    uid = _user()
+    jobs.submit_job("j1", uid, "video", {})
+    jobs.claim_job("w1", ["video"])
+    assert jobs.cancel_job("j1", uid)[0] == "cancelling"
+    _age("j1", 120)
+    assert jobs.requeue_stale(60) == 0
+    assert jobs.get_job("j1")["state"] == "cancelled"
+
+
+def test_running_job_keeps_its_lease_while_the_handler_is_busy(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_HEARTBEAT_SECONDS", 0.05)
+    uid = _user()
+    jobs.submit_job("j1", uid, "video", {})
+    release = threading.Event()
+
+    def handler(job_id):
+        release.wait(5)
+        jobs.update_job(job_id, state="done", progress=1.0)
+
+    stop = jobs.start_worker_threads({"video": handler}, 1)
+    try:
+        deadline = time.monotonic() + 5
+        while jobs.get_job("j1")["state"] != "running" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        for _ in range(5):
+            time.sleep(0.1)
+            assert jobs.requeue_stale(0.3) == 0
+        assert jobs.get_job("j1")["state"] == "running"
+    finally:
+        release.set()
+        stop.set()
+    deadline = time.monotonic() + 5
+    while jobs.get_job("j1")["state"] != "done" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert jobs.get_job("j1")["state"] == "done"
+
+
+def test_worker_claims_only_with_a_free_slot():
+    uid = _user()
+    jobs.submit_job("j1", uid, "video", {})
+    slots = threading.Semaphore(1)
+    slots.acquire()  # el único hueco está ocupado
+    stop = threading.Event()
+    t = threading.Thread(target=jobs.run_worker,
+                         args=({"video": lambda job_id: jobs.update_job(job_id, state="done")}, stop, 0.02, slots))
+    t.start()
+    try:
+        time.sleep(0.2)
+        assert jobs.get_job("j1")["state"] == "queued"
+        slots.release()
+        deadline = time.monotonic() + 5
+        while jobs.get_job("j1")["state"] != "done" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert jobs.get_job("j1")["state"] == "done"
+    finally:
+        stop.set()
+        t.join(5)
+
+
+def test_handler_errors_and_cancellation_are_recorded():
+    uid = _user()
+    jobs.submit_job("bad", uid, "video", {})
+    jobs.submit_job("cancel", uid, "other", {})
+
+    def boom(job_id):
+        raise ValueError("vídeo corrupto")
+
+    def cancelled(job_id):
+        raise jobs.JobCancelled(job_id)
+
+    stop = jobs.start_worker_threads({"video": boom, "other": cancelled}, 1)
+    try:
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and not (
+            jobs.get_job("bad")["state"] == "error" and jobs.get_job("cancel")["state"] == "cancelled"
+        ):
+            time.sleep(0.01)
+    finally:
+        stop.set()
+    assert jobs.get_job("bad")["error"] == "vídeo corrupto"
+    assert jobs.get_job("cancel")["state"] == "cancelled"
+
+
+def test_submit_job_is_single_flight():
+    owner, other = _user(), _user()
+    assert jobs.submit_job("j1", owner, "video", {})
+    assert not jobs.submit_job("j1", other, "video", {})
+    assert jobs.job_users("j1") == [owner, other]
+
+
+def test_claim_job_prefers_least_served_user_then_cheapest():
+    heavy, light = _user(), _user()
+    jobs.submit_job("h1", heavy, "video", {}, cost=100)
+    jobs.submit_job("h2", heavy, "video", {}, cost=5)
+    jobs.submit_job("l1", light, "video", {}, cost=50)
+    assert jobs.claim_job("w", ["video"])[0] == "h2"
+    # heavy ya consumió 5: ahora le toca a light aunque su job sea más caro que h1
+    assert jobs.claim_job("w", ["video"])[0] == "l1"
+    assert jobs.claim_job("w", ["video"])[0] == "h1"
+
+
+def test_partials_are_ordered_and_reset_on_claim():
+    uid = _user()
+    jobs.submit_job("j1", uid, "video", {})
+    jobs.claim_job("w1", ["video"])
+    for i in range(3):
+        jobs.add_partial("j1", {"segment": i})
+    assert jobs.get_job("j1")["partial"] == [{"segment": 0}, {"segment": 1}, {"segment": 2}]
+
+    _age("j1", 120)
+    jobs.requeue_stale(60)
+    jobs.claim_job("w2", ["video"])
+    assert jobs.get_job("j1")["partial"] == []
+
+
+def test_concurrent_partials_are_not_lost():
+    uid = _user()
+    jobs.submit_job("j1", uid, "video", {})
+    threads = [threading.Thread(target=lambda k=k: [jobs.add_partial("j1", {"w": k, "i": i}) for i in range(10)])
+               for k in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(jobs.get_job("j1")["partial"]) == 40
+
+
+def test_queue_info_eta_uses_the_rate_of_each_kind(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_DEFAULT_SECONDS_PER_INFERENCE", 1.0)
+    uid = _user()
+    # Un lote terminado: 4 imágenes en 2 s => 0.5 s por inferencia para image_batch
+    jobs.submit_job("old", uid, "image_batch", {}, cost=4)
+    jobs.claim_job("w1", ["image_batch"])
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        db.execute(update(Job).where(Job.id == "old")
+                   .values(state="done", started_at=now - timedelta(seconds=2), updated_at=now))
+        db.commit()
+    finally:
+        db.close()
+
+    jobs.submit_job("v", uid, "video", {}, cost=10)
+    jobs.submit_job("b", uid, "image_batch", {}, cost=20)
+    assert jobs.queue_info("v", 1) == {"queue_position": 1, "eta_seconds": 10.0}
+    assert jobs.queue_info("b", 1) == {"queue_position": 2, "eta_seconds": 20.0}
+    assert jobs.queue_info("old", 1) == {"queue_position": None, "eta_seconds": None}
+
+
+def test_queue_info_is_computed_once_per_queue_change(monkeypatch):
+    calls = []
+    order = jobs._queue_order
+    monkeypatch.setattr(jobs, "_queue_order", lambda *a: calls.append(1) or order(*a))
+    uid = _user()
+    jobs.submit_job("a", uid, "video", {}, cost=1)
+    jobs.submit_job("b", uid, "video", {}, cost=2)
+    for _ in range(5):
+        jobs.queue_info("a", 1)
+        jobs.queue_info("b", 1)
+    assert len(calls) == 1
+
+    jobs.claim_job("w1", ["video"])
+    assert jobs.queue_info("b", 1)["queue_position"] == 1
+    assert len(calls) == 2
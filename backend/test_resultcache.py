@@ -0,0 +1,95 @@
+import os
+import time
+
+from resultcache import ResultCache, result_key
+
+
+def test_result_key_depends_on_model_conf_and_imgsz():
+    base = result_key("image", "d" * 64, "m" * 64, 0.25, 640)
+    assert base == result_key("image", "d" * 64, "m" * 64, 0.25000001, 640)
+    assert base != result_key("frame", "d" * 64, "m" * 64, 0.25, 640)
+    assert base != result_key("image", "d" * 64, "n" * 64, 0.25, 640)
+    assert base != result_key("image", "d" * 64, "m" * 64, 0.3, 640)
+    assert base != result_key("image", "d" * 64, "m" * 64, 0.25, 768)
+
+
+def test_hit_returns_a_copy_of_the_stored_value():
+    rc = ResultCache(10, 1 << 20)
+    rc.put("k", [[{"class": "robin"}], 640, 480])
+    first = rc.get("k")
+    first[0].clear()
+    assert rc.get("k") == [[{"class": "robin"}], 640, 480]
+    assert rc.get("missing") is None
+    m = rc.metrics()
+    assert (m["hits"], m["misses"]) == (2, 1)
+
+
+def test_lru_evicts_least_recently_used_entry():
+    rc = ResultCache(2, 1 << 20)
+    rc.put("a", 1)
+    rc.put("b", 2)
+    rc.get("a")
+    rc.put("c", 3)
+    assert rc.get("b") is None
+    assert rc.get("a") == 1 and rc.get("c") == 3
+    assert rc.metrics()["evictions"] == 1
+
+
+def test_byte_limit_and_oversized_values():
+    rc = ResultCache(100, 300)
+    for i in range(6):
+        rc.put(f"k{i}", "x" * 100)
+    m = rc.metrics()
+    assert m["bytes"] <= 300
+    assert m["entries"] == 2
+    rc.put("big", "x" * 1000)
+    assert rc.get("big") is None
+
+
+def test_disabled_memory_tier():
+    rc = ResultCache(0, 0)
+    assert not rc.enabled
+    rc.put("k", 1)
+    assert rc.get("k") is None
+
+
+def test_disk_tier_is_shared_between_instances(tmp_path):
+    writer = ResultCache(10, 1 << 20, str(tmp_path), 1 << 20)
+    writer.put("k", {"dets": [1, 2]})
+    reader = ResultCache(10, 1 << 20, str(tmp_path), 1 << 20)
+    assert reader.get("k") == {"dets": [1, 2]}
+    assert reader.metrics()["disk_hits"] == 1
+    # El acierto en disco queda en memoria
+    assert reader.get("k") == {"dets": [1, 2]}
+    assert reader.metrics()["hits"] == 1
+
+
+def _wait_pruned(rc: ResultCache, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if rc.metrics()["disk"]["bytes"] is not None and not rc._prune_lock.locked():
+            return
+        time.sleep(0.01)
+    raise AssertionError("la poda no terminó")
+
+
+def test_disk_prune_keeps_directory_under_limit(tmp_path):
+    rc = ResultCache(0, 0, str(tmp_path), 1000)
+    for i in range(20):
+        rc.put(f"k{i}", "x" * 100)
+        _wait_pruned(rc)
+    total = sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path))
+    assert total <= 1000
+    assert rc.metrics()["disk"]["evictions"] > 0
+    assert rc.get("k19") is not None
+
+
+def test_prune_runs_once_at_a_time(tmp_path):
+    rc = ResultCache(0, 0, str(tmp_path), 1)
+    rc._prune_lock.acquire()
+    try:
+        rc.put("k", "x" * 100)
+        # Con una poda en curso no se lanza otra: el fichero sigue ahí
+        assert os.path.exists(tmp_path / "k.json")
+    finally:
+        rc._prune_lock.release()
@@ -0,0 +1,41 @@
+import random
+
+import pytest
+
+from bench_stats import legacy_stats, synthetic
+from stats import StatsAccumulator, video_stats
+
+
+@pytest.mark.parametrize("seed,fps,stride", [(0, 30.0, 1), (1, 25.0, 5), (2, 10.0, 3), (3, 30.0, 15)])
+def test_matches_naive_recomputation(seed, fps, stride):
+    frame_dets = synthetic(2, fps, stride, seed=seed)
+    assert video_stats(frame_dets, fps, 1.0) == legacy_stats(frame_dets, fps, 1.0)
+
+
+def test_empty_video():
+    assert video_stats([], 25.0, 1.0) == legacy_stats([], 25.0, 1.0)
+    assert video_stats([(0, []), (5, [])], 25.0, 1.0) == legacy_stats([(0, []), (5, [])], 25.0, 1.0)
+
+
+def test_count_between_matches_a_scan():
+    rnd = random.Random(7)
+    frame_dets = synthetic(1, 30.0, 2, seed=7)
+    acc = StatsAccumulator(30.0, 1.0)
+    for frame_idx, dets in frame_dets:
+        acc.add(frame_idx, dets)
+    times = [(frame_idx / 30.0, d["class"]) for frame_idx, dets in frame_dets for d in dets]
+    for _ in range(200):
+        sp = rnd.choice([c for _, c in times])
+        a, b = sorted((rnd.uniform(0, 60), rnd.uniform(0, 60)))
+        assert acc.count_between(sp, a, b) == sum(1 for t, c in times if c == sp and a <= t <= b)
+
+
+def test_closed_segments_are_published_as_final():
+    frame_dets = synthetic(2, 25.0, 5, seed=4)
+    published = []
+    acc = StatsAccumulator(25.0, 1.0, on_segment=published.append)
+    for frame_idx, dets in frame_dets:
+        acc.add(frame_idx, dets)
+    final = acc.result()["segments"]
+    # Todos menos el último (sigue abierto al acabar el vídeo) se publican tal cual quedan
+    assert published == final[:-1]
@@ -0,0 +1,116 @@
+import main
+from detstore import DetectionWriter
+from stats import video_stats
+from tracker import IouTracker
+
+
+def _det(x: float, y: float, cls: str = "robin", size: float = 10.0) -> dict:
+    return {"class": cls, "confidence": 0.9, "bbox": [x, y, x + size, y + size]}
+
+
+def test_same_track_across_frames():
+    tr = IouTracker(max_age=5)
+    ids = set()
+    for f in range(5):
+        dets = [_det(2.0 * f, 0.0)]
+        tr.update(f, dets)
+        ids.add(dets[0]["track_id"])
+    assert ids == {1}
+
+
+def test_centroid_fallback_for_fast_motion():
+    # Sin solape entre frames inferidos, pero dentro de centroid_factor * diagonal
+    tr = IouTracker(max_age=5)
+    a, b = [_det(0.0, 0.0)], [_det(9.0, 0.0)]
+    tr.update(0, a)
+    tr.update(1, b)
+    assert a[0]["track_id"] == b[0]["track_id"]
+
+
+def test_boxes_are_extrapolated_between_inferred_frames():
+    tr = IouTracker(max_age=10)
+    tr.update(0, [_det(0.0, 0.0)])
+    tr.update(2, [_det(4.0, 0.0)])
+    (box,) = tr.boxes_at(4)
+    assert box["track_id"] == 1
+    assert box["bbox"][0] > 4.0
+
+
+def test_majority_class_labels_the_track():
+    tr = IouTracker(max_age=5)
+    for f, cls in enumerate(["robin", "sparrow", "sparrow"]):
+        tr.update(f, [_det(0.0, 0.0, cls)])
+    assert tr.boxes_at(3)[0]["class"] == "sparrow"
+
+
+def test_expired_tracks_release_votes_and_count_individuals():
+    tr = IouTracker(max_age=2)
+    for f in range(3):
+        tr.update(f, [_det(0.0, 0.0, "robin")])
+    tr.update(3, [_det(100.0, 100.0, "sparrow")])
+    assert set(tr.class_votes) == {1, 2}
+
+    for f in range(4, 10):
+        tr.update(f, [])
+    assert tr.tracks == []
+    assert tr.class_votes == {}
+    assert tr.species_individuals() == {"robin": 1, "sparrow": 1}
+
+
+def test_species_individuals_includes_live_tracks():
+    tr = IouTracker(max_age=2)
+    tr.update(0, [_det(0.0, 0.0, "robin")])
+    for f in range(1, 5):
+        tr.update(f, [_det(50.0, 50.0, "sparrow")] if f == 4 else [])
+    assert tr.individuals == {"robin": 1}
+    assert tr.species_individuals() == {"robin": 1, "sparrow": 1}
+
+
+def test_class_votes_stay_bounded_on_long_videos():
+    tr = IouTracker(max_age=3)
+    for f in range(0, 2000, 2):
+        # Un pájaro nuevo cada 10 frames en otra posición
+        tr.update(f, [_det(float((f // 10) % 7) * 100.0, 0.0)])
+    assert len(tr.class_votes) == len(tr.tracks) <= 2
+    assert sum(tr.species_individuals().values()) == tr.next_id - 1
+
+
+def _store(base: str, frame_dets: list):
+    writer = DetectionWriter(base)
+    for idx, dets in frame_dets:
+        writer.add(idx, dets)
+    return writer.close(0.05, {"fps": 10.0, "frame_count": 40, "width": 640, "height": 480})
+
+
+def test_video_results_count_individuals_from_the_tracker(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "VIDEO_TRACKING", True)
+    low = {"class": "crow", "confidence": 0.1, "bbox": [300.0, 300.0, 310.0, 310.0]}
+    frames = [(f, [_det(0.0, 0.0), _det(200.0, 0.0)]) for f in range(0, 15, 5)]
+    frames += [(15, [low]), (20, []), (25, []), (30, [_det(100.0, 100.0, "sparrow")]), (35, [])]
+    store = _store(str(tmp_path / "raw"), frames)
+
+    frame_dets, individuals = main._filtered_tracked(store, 0.5, 5)
+    assert individuals == {"robin": 2, "sparrow": 1}
+    stats = video_stats(frame_dets, 10.0, main.SEGMENT_GAP_SECONDS, individuals)
+    assert stats["species_individuals"] == [{"species": "robin", "count": 2}, {"species": "sparrow", "count": 1}]
+
+    monkeypatch.setattr(main, "VIDEO_TRACKING", False)
+    frame_dets, individuals = main._filtered_tracked(store, 0.5, 5)
+    assert individuals is None
+    assert video_stats(frame_dets, 10.0, main.SEGMENT_GAP_SECONDS, individuals)["species_individuals"] is None
+
+
+def test_tracks_outlive_the_longest_adaptive_gap(monkeypatch):
+    monkeypatch.setattr(main, "VIDEO_TRACKING", True)
+    monkeypatch.setattr(main, "VIDEO_ADAPTIVE_STRIDE", True)
+    monkeypatch.setattr(main, "VIDEO_MAX_STRIDE_MULT", 6)
+    tr = main._new_tracker(5)
+    assert tr.max_age == main.TTL_MULT * 30
+    # Escena "vacía" para el sampler: la siguiente inferencia llega con el stride máximo
+    a, b = [_det(0.0, 0.0)], [_det(1.0, 0.0)]
+    tr.update(0, a)
+    tr.update(30, b)
+    assert a[0]["track_id"] == b[0]["track_id"]
+
+    monkeypatch.setattr(main, "VIDEO_ADAPTIVE_STRIDE", False)
+    assert main._new_tracker(5).max_age == main.TTL_MULT * 5
@@ -0,0 +1,155 @@
+# Tracker ligero (asociación IoU + centroide, movimiento lineal) para vídeo con stride:
+# entre inferencias las cajas se extrapolan con la velocidad estimada de cada track.
+
+
+def _iou(a, b) -> float:
+    ix1 = max(a[0], b[0])
+    iy1 = max(a[1], b[1])
+    ix2 = min(a[2], b[2])
+    iy2 = min(a[3], b[3])
+    iw = max(0.0, ix2 - ix1)
+    ih = max(0.0, iy2 - iy1)
+    inter = iw * ih
+    if inter <= 0.0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / max(1e-9, area_a + area_b - inter)
+
+
+def _center(b) -> tuple[float, float]:
+    return (b[0] + b[2]) / 2.0, (b[1] + b[3]) / 2.0
+
+
+class IouTracker:
+    def __init__(self, max_age: int, iou_threshold: float = 0.3, centroid_factor: float = 0.75,
+                 velocity_alpha: float = 0.5):
+        # max_age: frames que un track se mantiene visible sin volver a emparejarse
+        self.max_age = max_age
+        self.iou_threshold = iou_threshold
+        self.centroid_factor = centroid_factor
+        self.velocity_alpha = velocity_alpha
+        self.tracks = []
+        self.next_id = 1
+        self.class_votes = {}  # track_id -> {clase: nº detecciones}, solo de los tracks vivos
+        self.individuals = {}  # especie -> tracks ya cerrados (por su clase mayoritaria)
+
+    def _predict_bbox(self, t: dict, frame_idx: int) -> list[float]:
+        dt = frame_idx - t["last_frame"]
+        vx, vy = t["velocity"]
+        x1, y1, x2, y2 = t["bbox"]
+        return [x1 + vx * dt, y1 + vy * dt, x2 + vx * dt, y2 + vy * dt]
+
+    def _class_of(self, track_id: int) -> str:
+        votes = self.class_votes[track_id]
+        return max(votes.items(), key=lambda x: x[1])[0]
+
+    def update(self, frame_idx: int, dets: list[dict]):
+        # Empareja las detecciones de un frame inferido con los tracks y añade det["track_id"]
+        predicted = [self._predict_bbox(t, frame_idx) for t in self.tracks]
+
+        pairs = []
+        for ti, pb in enumerate(predicted):
+            for di, det in enumerate(dets):
+                iou = _iou(pb, det["bbox"])
+                if iou >= self.iou_threshold:
+                    pairs.append((iou, ti, di))
+        pairs.sort(key=lambda x: x[0], reverse=True)
+
+        matched_t = {}
+        matched_d = set()
+        for _, ti, di in pairs:
+            if ti in matched_t or di in matched_d:
+                continue
+            matched_t[ti] = di
+            matched_d.add(di)
+
+        # Sin solape suficiente (movimiento rápido o stride grande): centroide más cercano
+        fallback = []
+        for ti, pb in enumerate(predicted):
+            if ti in matched_t:
+                continue
+            pcx, pcy = _center(pb)
+            diag = ((pb[2] - pb[0]) ** 2 + (pb[3] - pb[1]) ** 2) ** 0.5
+            for di, det in enumerate(dets):
+                if di in matched_d:
+                    continue
+                dcx, dcy = _center(det["bbox"])
+                dist = ((pcx - dcx) ** 2 + (pcy - dcy) ** 2) ** 0.5
+                if dist <= self.centroid_factor * diag:
+                    fallback.append((dist, ti, di))
+        fallback.sort(key=lambda x: x[0])
+        for _, ti, di in fallback:
+            if ti in matched_t or di in matched_d:
+                continue
+            matched_t[ti] = di
+            matched_d.add(di)
+
+        for ti, di in matched_t.items():
+            t = self.tracks[ti]
+            det = dets[di]
+            dt = max(1, frame_idx - t["last_frame"])
+            ocx, ocy = _center(t["bbox"])
+            ncx, ncy = _center(det["bbox"])
+            a = self.velocity_alpha
+            t["velocity"] = [
+                a * ((ncx - ocx) / dt) + (1 - a) * t["velocity"][0],
+                a * ((ncy - ocy) / dt) + (1 - a) * t["velocity"][1],
+            ]
+            t["bbox"] = list(det["bbox"])
+            t["confidence"] = det["confidence"]
+            t["last_frame"] = frame_idx
+            det["track_id"] = t["id"]
+            votes = self.class_votes[t["id"]]
+            votes[det["class"]] = votes.get(det["class"], 0) + 1
+
+        for di, det in enumerate(dets):
+            if di in matched_d:
+                continue
+            tid = self.next_id
+            self.next_id += 1
+            self.tracks.append({
+                "id": tid,
+                "bbox": list(det["bbox"]),
+                "velocity": [0.0, 0.0],
+                "confidence": det["confidence"],
+                "last_frame": frame_idx,
+            })
+            self.class_votes[tid] = {det["class"]: 1}
+            det["track_id"] = tid
+
+        alive = []
+        for t in self.tracks:
+            if frame_idx - t["last_frame"] <= self.max_age:
+                alive.append(t)
+            else:
+                self._close(t["id"])
+        self.tracks = alive
+
+    def _close(self, track_id: int):
+        # El voto final del track pasa al conteo de individuos y sus votos se liberan
+        sp = self._class_of(track_id)
+        self.individuals[sp] = self.individuals.get(sp, 0) + 1
+        del self.class_votes[track_id]
+
+    def species_individuals(self) -> dict:
+        # Individuos por especie: tracks cerrados + los que siguen abiertos
+        out = dict(self.individuals)
+        for t in self.tracks:
+            sp = self._class_of(t["id"])
+            out[sp] = out.get(sp, 0) + 1
+        return out
+
+    def boxes_at(self, frame_idx: int) -> list[dict]:
+        # Cajas visibles en cualquier frame (inferido o no), con la posición extrapolada
+        out = []
+        for t in self.tracks:
+            if frame_idx - t["last_frame"] > self.max_age:
+                continue
+            out.append({
+                "class": self._class_of(t["id"]),
+                "confidence": t["confidence"],
+                "bbox": self._predict_bbox(t, frame_idx),
+                "track_id": t["id"],
+            })
+        return out
@@ -0,0 +1,220 @@
+# Subida reanudable por trozos. Cada subida es un par de ficheros en UPLOAD_DIR:
+#   upload-<id>.json  metadatos (usuario, tamaño, sufijo, sha256 declarado)
+#   upload-<id>.part  bytes recibidos; su tamaño es el offset desde el que se continúa
+# El sha256 se calcula según llegan los trozos; si el proceso cambia (reinicio, otro worker
+# de la API) se rehace leyendo lo que ya hay en disco. Un PUT a la vez por subida, también
+# entre procesos: flock sobre el .part mientras se escribe.
+# La E/S de disco (y el rehash) va al threadpool para no bloquear el event loop.
+import os
+import re
+import json
+import time
+import uuid
+import fcntl
+import hashlib
+import logging
+import tempfile
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+
+log = logging.getLogger("birds-backend")
+
+# Subidas pendientes de procesar; con JOB_RUNNER=external debe ser compartido con los workers
+UPLOAD_DIR = os.path.abspath(os.getenv("UPLOAD_DIR", tempfile.gettempdir()))
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+UPLOAD_CHUNK_MB = int(os.getenv("UPLOAD_CHUNK_MB", "8"))
+UPLOAD_CHUNK_BYTES = UPLOAD_CHUNK_MB * 1024 * 1024
+UPLOAD_TTL_SECONDS = 24 * 60 * 60  # subidas abandonadas
+_WRITE_BYTES = 1024 * 1024  # se acumula el cuerpo y se escribe en bloques de este tamaño
+
+_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+_hashers = {}  # upload_id -> (offset, sha256 hasta ese offset)
+
+
+def _paths(upload_id: str) -> tuple[str, str]:
+    if not _ID_RE.match(upload_id):
+        raise HTTPException(status_code=404, detail="Subida no encontrada.")
+    base = os.path.join(UPLOAD_DIR, f"upload-{upload_id}")
+    return f"{base}.json", f"{base}.part"
+
+
+def _load_meta(upload_id: str, user_id: str) -> dict:
+    meta_path, _ = _paths(upload_id)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Subida no encontrada o expirada.")
+    if meta["user_id"] != user_id:
+        raise HTTPException(status_code=403, detail="No autorizado.")
+    return meta
+
+
+def _info(upload_id: str, meta: dict, offset: int) -> dict:
+    return {
+        "upload_id": upload_id,
+        "offset": offset,
+        "size_bytes": meta["size_bytes"],
+        "chunk_bytes": UPLOAD_CHUNK_BYTES,
+        "complete": offset == meta["size_bytes"],
+    }
+
+
+def _hasher_at(upload_id: str, part_path: str, offset: int):
+    cached = _hashers.get(upload_id)
+    if cached and cached[0] == offset:
+        return cached[1]
+    h = hashlib.sha256()
+    with open(part_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    _hashers[upload_id] = (offset, h)
+    return h
+
+
+def cleanup_uploads():
+    # Una subida caduca por su última actividad: el .json no se reescribe, así que cuenta el
+    # último trozo escrito en el .part y se borran los dos ficheros juntos
+    now = time.time()
+    uploads = {}  # upload_id -> [(ruta, mtime)]
+    try:
+        for name in os.listdir(UPLOAD_DIR):
+            if not name.startswith("upload-"):
+                continue
+            path = os.path.join(UPLOAD_DIR, name)
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            uploads.setdefault(name[len("upload-"):].split(".")[0], []).append((path, mtime))
+    except OSError as e:
+        log.warning("cleanup: error listando uploads: %s", e)
+
+    for upload_id, files in uploads.items():
+        if now - max(mtime for _, mtime in files) <= UPLOAD_TTL_SECONDS:
+            continue
+        _hashers.pop(upload_id, None)
+        for path, _ in files:
+            try:
+                os.remove(path)
+            except OSError as e:
+                log.warning("cleanup: no se pudo borrar %s: %s", path, e)
+
+
+def create_upload(user_id: str, size_bytes: int, suffix: str, sha256: str | None) -> dict:
+    cleanup_uploads()
+    upload_id = uuid.uuid4().hex
+    meta_path, part_path = _paths(upload_id)
+    meta = {
+        "user_id": user_id,
+        "size_bytes": size_bytes,
+        "suffix": suffix,
+        "sha256": sha256,
+        "created_at": time.time(),
+    }
+    open(part_path, "wb").close()
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return _info(upload_id, meta, 0)
+
+
+def upload_info(upload_id: str, user_id: str) -> dict:
+    meta = _load_meta(upload_id, user_id)
+    _, part_path = _paths(upload_id)
+    return _info(upload_id, meta, os.path.getsize(part_path))
+
+
+def _open_locked(part_path: str):
+    # -> (fichero al final con flock exclusivo, tamaño actual). Otro PUT en curso sobre la
+    # misma subida (en este u otro proceso) => 409 y el cliente vuelve a pedir el offset
+    try:
+        f = open(part_path, "r+b")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Subida no encontrada o expirada.")
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        current = os.path.getsize(part_path)
+        raise HTTPException(status_code=409, detail="Ya hay otro trozo de esta subida en curso.",
+                            headers={"Upload-Offset": str(current)})
+    return f, f.seek(0, os.SEEK_END)
+
+
+def _write(f, h, data: bytes):
+    f.write(data)
+    h.update(data)
+
+
+def _close(f):
+    # Cerrar el fichero suelta el flock
+    f.close()
+
+
+async def append_upload(upload_id: str, user_id: str, offset: int, stream) -> dict:
+    # Escribe el cuerpo en offset; si la conexión se corta, lo recibido hasta entonces queda
+    # guardado y GET /uploads/{id} devuelve desde dónde seguir
+    meta = await run_in_threadpool(_load_meta, upload_id, user_id)
+    _, part_path = _paths(upload_id)
+    f, current = await run_in_threadpool(_open_locked, part_path)
+    h = None
+    written = 0
+    try:
+        if offset != current:
+            raise HTTPException(status_code=409, detail=f"Offset incorrecto: el servidor tiene {current} bytes.",
+                                headers={"Upload-Offset": str(current)})
+
+        h = await run_in_threadpool(_hasher_at, upload_id, part_path, current)
+        buf = bytearray()
+        try:
+            async for chunk in stream:
+                if not chunk:
+                    continue
+                if written + len(buf) + len(chunk) > UPLOAD_CHUNK_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Trozo demasiado grande. Máximo {UPLOAD_CHUNK_MB}MB.")
+                if current + written + len(buf) + len(chunk) > meta["size_bytes"]:
+                    raise HTTPException(status_code=400, detail="Se han enviado más bytes que size_bytes.")
+                buf += chunk
+                if len(buf) >= _WRITE_BYTES:
+                    await run_in_threadpool(_write, f, h, bytes(buf))
+                    written += len(buf)
+                    buf.clear()
+        finally:
+            # Lo recibido antes de un error o un corte también se guarda
+            if buf:
+                await run_in_threadpool(_write, f, h, bytes(buf))
+                written += len(buf)
+    finally:
+        if h is not None:
+            _hashers[upload_id] = (current + written, h)
+        await run_in_threadpool(_close, f)
+
+    return _info(upload_id, meta, current + written)
+
+
+def finish_upload(upload_id: str, user_id: str) -> tuple[str, str, int]:
+    # Devuelve (ruta del vídeo, sha256, tamaño) como _stream_upload_to_tempfile_and_hash
+    meta = _load_meta(upload_id, user_id)
+    meta_path, part_path = _paths(upload_id)
+    size = os.path.getsize(part_path)
+    if size != meta["size_bytes"]:
+        raise HTTPException(status_code=409, detail=f"Subida incompleta: {size} de {meta['size_bytes']} bytes.",
+                            headers={"Upload-Offset": str(size)})
+
+    sha256_hex = _hasher_at(upload_id, part_path, size).hexdigest()
+    _hashers.pop(upload_id, None)
+    if meta.get("sha256") and meta["sha256"] != sha256_hex:
+        for path in (part_path, meta_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        raise HTTPException(status_code=422, detail="El sha256 no coincide con el declarado; vuelve a subir el archivo.")
+
+    fd, tmp_path = tempfile.mkstemp(suffix=meta["suffix"], dir=UPLOAD_DIR)
+    os.close(fd)
+    os.replace(part_path, tmp_path)
+    os.remove(meta_path)
+    return tmp_path, sha256_hex, size
@@ -0,0 +1,572 @@
+import os
+import hashlib
+import queue
+import logging
+import tempfile
+import threading
+import subprocess
+
+import cv2
+
+from engines import load_engine
+
+
+log = logging.getLogger("birds-backend")
+
+
+# ---------------- Dibujo ----------------
+def _species_color(species: str) -> tuple[int, int, int]:
+    digest = hashlib.md5(species.encode("utf-8")).digest()
+    b = 80 + digest[0] % 176
+    g = 80 + digest[1] % 176
+    r = 80 + digest[2] % 176
+    return int(b), int(g), int(r)
+
+
+def draw_annotations(frame, dets: list[dict], species_counter: dict):
+    annotated = frame.copy()
+
+    top_now = sorted(species_counter.items(), key=lambda x: x[1], reverse=True)[:3]
+    y0 = 30
+    cv2.putText(annotated, f"Aves: {len(dets)}", (10, y0),
+                cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2, cv2.LINE_AA)
+    y = y0 + 28
+    if top_now:
+        cv2.putText(annotated, "Top:", (10, y),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255,255,255), 2, cv2.LINE_AA)
+        y += 24
+        for sp, cnt in top_now:
+            col = _species_color(sp)
+            cv2.rectangle(annotated, (10, y-16), (28, y+2), col, -1)
+            cv2.putText(annotated, f"{sp} ({cnt})", (36, y),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.65, (255,255,255), 2, cv2.LINE_AA)
+            y += 22
+
+    for det in dets:
+        x1, y1, x2, y2 = map(int, det["bbox"])
+        sp = det["class"]
+        col = _species_color(sp)
+        label = f'{sp} {det["confidence"]*100:.1f}%'
+        if det.get("track_id") is not None:
+            label = f'{sp} #{det["track_id"]} {det["confidence"]*100:.1f}%'
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), col, 2)
+        cv2.putText(annotated, label, (x1, max(20, y1 - 8)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, col, 2, cv2.LINE_AA)
+
+    return annotated
+
+
+# ---------------- Detecciones ----------------
+def filter_dets(dets: list[dict], min_conf: float) -> list[dict]:
+    # Copias: el tracker anota track_id sin tocar las detecciones crudas
+    return [dict(d) for d in dets if d["confidence"] >= min_conf]
+
+
+def compact_detections(frame_dets: list, fps: float, w: int, h: int) -> dict:
+    # Formato compacto: índice de clase + confianza + bbox normalizada, solo frames con detecciones
+    classes = []
+    class_idx = {}
+    frames_out = []
+    tracked = any(det.get("track_id") is not None for _, dets in frame_dets for det in dets)
+    for frame_idx, dets in frame_dets:
+        if not dets:
+            continue
+        rows = []
+        for det in dets:
+            cls_name = det["class"]
+            if cls_name not in class_idx:
+                class_idx[cls_name] = len(classes)
+                classes.append(cls_name)
+            x1, y1, x2, y2 = det["bbox"]
+            row = [
+                class_idx[cls_name],
+                round(float(det["confidence"]), 3),
+                round(max(0.0, min(x1 / w, 1.0)), 4),
+                round(max(0.0, min(y1 / h, 1.0)), 4),
+                round(max(0.0, min(x2 / w, 1.0)), 4),
+                round(max(0.0, min(y2 / h, 1.0)), 4),
+            ]
+            if tracked:
+                row.append(det.get("track_id"))
+            rows.append(row)
+        tsec = frame_idx / fps if fps > 0 else 0.0
+        frames_out.append([frame_idx, round(tsec, 3), rows])
+    return {
+        "classes": classes,
+        "frame_fields": ["frame_idx", "time", "detections"],
+        "detection_fields": ["class", "confidence", "x1", "y1", "x2", "y2"] + (["track_id"] if tracked else []),
+        "frames": frames_out,
+    }
+
+
+# ---------------- Encoders ----------------
+def _x264_args(fps: float) -> list[str]:
+    gop = max(24, int(fps * 2))
+    return [
+        "-c:v", "libx264",
+        "-profile:v", "baseline",
+        "-level", "3.0",
+        "-preset", "veryfast",
+        "-tune", "fastdecode",
+        "-crf", "23",
+        "-pix_fmt", "yuv420p",
+        "-movflags", "+faststart",
+        "-g", str(gop),
+        "-keyint_min", str(gop),
+    ]
+
+
+def transcode_h264(src_path: str, dst_path: str, fps: float):
+    subprocess.run(
+        ["ffmpeg", "-y", "-i", src_path, *_x264_args(fps), dst_path],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=True
+    )
+
+
+class FfmpegPipeWriter:
+    # Misma interfaz que cv2.VideoWriter: frames BGR crudos por stdin a ffmpeg/libx264,
+    # sin fichero intermedio ni segunda pasada de transcodificación.
+    def __init__(self, out_path: str, fps: float, size: tuple[int, int]):
+        w, h = size
+        self.out_path = out_path
+        self.cmd = [
+            "ffmpeg", "-y",
+            "-f", "rawvideo",
+            "-pix_fmt", "bgr24",
+            "-s", f"{w}x{h}",
+            "-framerate", str(float(fps)),
+            "-i", "-",
+            "-an",
+            *_x264_args(fps),
+            out_path,
+        ]
+        self.proc = subprocess.Popen(
+            self.cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def isOpened(self) -> bool:
+        return self.proc.poll() is None
+
+    def write(self, frame):
+        try:
+            self.proc.stdin.write(frame.data if frame.flags.c_contiguous else frame.tobytes())
+        except (BrokenPipeError, ValueError):
+            raise subprocess.CalledProcessError(self.proc.poll() or -1, self.cmd)
+
+    def release(self):
+        try:
+            self.proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        code = self.proc.wait()
+        if code != 0:
+            raise subprocess.CalledProcessError(code, self.cmd)
+
+    def abort(self):
+        # Job fallido: matar ffmpeg y no dejar un mp4 a medias en OUTPUT_DIR
+        try:
+            self.proc.kill()
+            self.proc.wait()
+        except Exception:
+            pass
+        if os.path.exists(self.out_path):
+            try:
+                os.remove(self.out_path)
+            except Exception:
+                pass
+
+
+def open_writer(out_path: str, fps: float, size: tuple[int, int], encoder: str):
+    # Devuelve (writer, raw_path); raw_path != None => hay que transcodificar tras release()
+    if encoder == "pipe":
+        try:
+            return FfmpegPipeWriter(out_path, fps, size), None
+        except OSError as e:
+            log.warning("encoder pipe no disponible (%s), usando mp4v + transcode", e)
+
+    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+    raw_path = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4").name
+    writer = cv2.VideoWriter(raw_path, fourcc, fps, size)
+    if not writer.isOpened():
+        writer.release()
+        os.remove(raw_path)
+        raise RuntimeError("No se pudo inicializar VideoWriter (mp4v).")
+    return writer, raw_path
+
+
+def discard_writer(writer, raw_path: str | None):
+    try:
+        if isinstance(writer, FfmpegPipeWriter):
+            writer.abort()
+        elif writer is not None:
+            writer.release()
+    except Exception:
+        pass
+    if raw_path and os.path.exists(raw_path):
+        try:
+            os.remove(raw_path)
+        except Exception:
+            pass
+
+
+def concat_mp4(paths: list[str], out_path: str):
+    # Concat demuxer sin recodificar: todos los trozos salen del mismo encoder/ajustes
+    with tempfile.NamedTemporaryFile("w", delete=False, suffix=".txt") as lst:
+        for p in paths:
+            lst.write(f"file '{p}'\n")
+    try:
+        subprocess.run(
+            [
+                "ffmpeg", "-y",
+                "-f", "concat",
+                "-safe", "0",
+                "-i", lst.name,
+                "-c", "copy",
+                "-movflags", "+faststart",
+                out_path
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True
+        )
+    finally:
+        os.remove(lst.name)
+
+
+# ---------------- Pipeline por etapas ----------------
+# decoder -> inferencia (por lotes) -> anotación -> writer, con colas acotadas.
+# Cada etapa procesa los frames en orden, así que el orden de salida se mantiene.
+_END = object()
+
+
+class _Stop(Exception):
+    pass
+
+
+def _put(q: queue.Queue, item, stop: threading.Event):
+    while True:
+        if stop.is_set():
+            raise _Stop()
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    while True:
+        if stop.is_set():
+            raise _Stop()
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+
+
+def _frame_range(frame_count: int, start_frame: int, end_frame: int | None) -> range:
+    if end_frame is None:
+        end_frame = frame_count if frame_count > 0 else 10**9
+    return range(start_frame, end_frame)
+
+
+def _run_stages(stages: list):
+    stop = threading.Event()
+    errors = []
+
+    def run(target):
+        try:
+            target(stop)
+        except _Stop:
+            pass
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    threads = [
+        threading.Thread(target=run, args=(fn,), name=f"video-{fn.__name__}", daemon=True)
+        for fn in stages
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    if errors:
+        raise errors[0]
+
+
+def run_pipeline(
+    cap,
+    writer,
+    predict_frames,
+    *,
+    frame_count: int,
+    sampler,
+    resize_to: tuple[int, int] | None,
+    batch_size: int,
+    max_pending: int,
+    ttl_frames: int,
+    queue_size: int = 32,
+    on_progress=None,
+    start_frame: int = 0,
+    end_frame: int | None = None,
+    precomputed: dict | None = None,
+    initial_counter: dict | None = None,
+    tracker=None,
+    min_conf: float = 0.0,
+    on_detections=None,
+) -> list:
+    # sampler: decide qué frames se infieren (ver sampling.py);
+    # max_pending: techo de frames retenidos en memoria esperando a su lote;
+    # precomputed: {frame_idx: dets} ya inferidas (no se usan sampler ni predict_frames);
+    # initial_counter: conteos previos para el HUD (trozos de un vídeo en paralelo);
+    # tracker: si se pasa, sustituye al TTL y propaga las cajas entre inferencias;
+    # min_conf: umbral para dibujar/seguir (predict_frames puede devolver detecciones por debajo).
+    # Devuelve [(frame_idx, dets)] crudas de los frames inferidos, en orden; con
+    # on_detections(frame_idx, dets) se entregan ahí según se infieren y no se acumulan.
+    q_dec = queue.Queue(maxsize=queue_size)
+    q_inf = queue.Queue(maxsize=queue_size)
+    q_ann = queue.Queue(maxsize=queue_size)
+    frame_dets = []
+    record = on_detections or (lambda idx, dets: frame_dets.append((idx, dets)))
+
+    def decoder(stop):
+        if start_frame > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        progress_every = max(1, frame_count // 100) if frame_count > 0 else 0
+        for frame_idx in _frame_range(frame_count, start_frame, end_frame):
+            ret, frame = cap.read()
+            if not ret:
+                break
+
+            if on_progress is not None and progress_every and frame_idx % progress_every == 0:
+                on_progress(frame_idx)
+
+            if resize_to is not None:
+                frame = cv2.resize(frame, resize_to, interpolation=cv2.INTER_AREA)
+            _put(q_dec, (frame_idx, frame), stop)
+        _put(q_dec, _END, stop)
+
+    def inference(stop):
+        pending = []  # (frame_idx, frame) esperando a que se infiera el lote
+        pending_infer = []  # frame_idx de los frames a inferir dentro de pending
+
+        def flush():
+            by_idx = {}
+            if pending_infer and precomputed is not None:
+                by_idx = {idx: precomputed.get(idx, []) for idx in pending_infer}
+            elif pending_infer:
+                frames = [fr for idx, fr in pending if idx in pending_infer]
+                by_idx = dict(zip(pending_infer, predict_frames(frames)))
+            for idx in pending_infer:
+                record(idx, by_idx[idx])
+                by_idx[idx] = filter_dets(by_idx[idx], min_conf)
+                if precomputed is None:
+                    sampler.observe(idx, by_idx[idx])
+            for idx, fr in pending:
+                _put(q_inf, (idx, fr, by_idx.get(idx)), stop)
+            pending.clear()
+            pending_infer.clear()
+
+        while True:
+            item = _get(q_dec, stop)
+            if item is _END:
+                break
+            frame_idx, frame = item
+            if precomputed is not None:
+                infer = frame_idx in precomputed
+            else:
+                infer = sampler.is_candidate(frame_idx) and sampler.decide(frame_idx, frame)
+            if infer:
+                pending.append((frame_idx, frame))
+                pending_infer.append(frame_idx)
+                if len(pending_infer) >= batch_size:
+                    flush()
+            elif pending:
+                pending.append((frame_idx, frame))
+            else:
+                _put(q_inf, (frame_idx, frame, None), stop)
+            if len(pending) >= max_pending:
+                flush()
+        flush()
+        _put(q_inf, _END, stop)
+
+    def annotation(stop):
+        # dets != None solo en frames inferidos; TTL para mantener cajas entre inferencias
+        species_counter = dict(initial_counter or {})
+        last_dets = []
+        last_det_frame = -10**9
+        while True:
+            item = _get(q_inf, stop)
+            if item is _END:
+                break
+            frame_idx, frame, dets = item
+            if dets is not None:
+                for det in dets:
+                    species_counter[det["class"]] = species_counter.get(det["class"], 0) + 1
+                if tracker is not None:
+                    tracker.update(frame_idx, dets)
+                if dets:
+                    last_det_frame = frame_idx
+                last_dets = dets
+
+            if tracker is not None:
+                last_dets = tracker.boxes_at(frame_idx)
+            elif frame_idx - last_det_frame > ttl_frames:
+                last_dets = []
+
+            _put(q_ann, draw_annotations(frame, last_dets, species_counter), stop)
+        _put(q_ann, _END, stop)
+
+    def writer_stage(stop):
+        while True:
+            item = _get(q_ann, stop)
+            if item is _END:
+                break
+            writer.write(item)
+
+    _run_stages([decoder, inference, annotation, writer_stage])
+    return frame_dets
+
+
+# ---------------- Solo detecciones (sin render) ----------------
+def run_detections(
+    cap,
+    predict_frames,
+    *,
+    frame_count: int,
+    sampler,
+    batch_size: int,
+    queue_size: int = 32,
+    on_progress=None,
+    resize_to: tuple[int, int] | None = None,
+    start_frame: int = 0,
+    end_frame: int | None = None,
+    min_conf: float = 0.0,
+    on_detections=None,
+) -> list:
+    # Los frames que el sampler no necesita evaluar solo se hacen grab() (sin decodificar a BGR).
+    # Devuelve [(frame_idx, dets)] crudas de los frames inferidos, en orden (o las entrega a
+    # on_detections, como run_pipeline).
+    q_dec = queue.Queue(maxsize=queue_size)
+    frame_dets = []
+    record = on_detections or (lambda idx, dets: frame_dets.append((idx, dets)))
+
+    def decoder(stop):
+        if start_frame > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        progress_every = max(1, frame_count // 100) if frame_count > 0 else 0
+        for frame_idx in _frame_range(frame_count, start_frame, end_frame):
+            if on_progress is not None and progress_every and frame_idx % progress_every == 0:
+                on_progress(frame_idx)
+
+            if not sampler.is_candidate(frame_idx):
+                if not cap.grab():
+                    break
+                continue
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if resize_to is not None:
+                frame = cv2.resize(frame, resize_to, interpolation=cv2.INTER_AREA)
+            _put(q_dec, (frame_idx, frame), stop)
+        _put(q_dec, _END, stop)
+
+    def inference(stop):
+        batch = []
+
+        def flush():
+            if batch:
+                for idx, dets in zip([idx for idx, _ in batch], predict_frames([fr for _, fr in batch])):
+                    sampler.observe(idx, [d for d in dets if d["confidence"] >= min_conf])
+                    record(idx, dets)
+                batch.clear()
+
+        while True:
+            item = _get(q_dec, stop)
+            if item is _END:
+                break
+            if not sampler.decide(*item):
+                continue
+            batch.append(item)
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+
+    _run_stages([decoder, inference])
+    return frame_dets
+
+
+# ---------------- Trozos en paralelo (process pool) ----------------
+# Un vídeo largo se parte en rangos de frames alineados al stride. Fase 1: cada proceso
+# (con su decoder y su modelo) infiere su rango. Fase 2: con todas las detecciones ya
+# conocidas, cada proceso renderiza y codifica su rango (el HUD arranca con los conteos
+# acumulados de los trozos anteriores y el tracker con su estado al inicio del trozo)
+# y el padre une los mp4 con el concat demuxer.
+_worker_model = None
+
+
+def init_chunk_worker(model_path: str, threads: int, imgsz: int, engine: str | None = None):
+    global _worker_model
+    _worker_model = load_engine(model_path, imgsz, engine, threads)
+
+
+def _worker_predict(frames: list, conf: float) -> list[list[dict]]:
+    if not frames:
+        return []
+    return _worker_model.predict(frames, conf)
+
+
+def plan_chunks(frame_count: int, fps: float, stride: int, workers: int, min_seconds: float) -> list[tuple[int, int]]:
+    if workers <= 1 or frame_count <= 0 or fps <= 0:
+        return [(0, frame_count)]
+    n = int(min(workers, (frame_count / fps) // max(min_seconds, 1e-6)))
+    if n <= 1:
+        return [(0, frame_count)]
+    size = -(-frame_count // n)
+    size = -(-size // stride) * stride  # inicio de cada trozo alineado al stride
+    return [(s, min(s + size, frame_count)) for s in range(0, frame_count, size)]
+
+
+def detect_chunk(path: str, start: int, end: int, frame_count: int, conf: float, sampler,
+                 resize_to: tuple[int, int] | None, batch_size: int, min_conf: float) -> list:
+    # Fase 1 (y único paso en modo solo detecciones): inferir los frames del rango
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            raise RuntimeError("No se pudo abrir el vídeo.")
+        return run_detections(cap, lambda frames: _worker_predict(frames, conf), frame_count=frame_count,
+                              sampler=sampler, batch_size=batch_size, resize_to=resize_to,
+                              start_frame=start, end_frame=end, min_conf=min_conf)
+    finally:
+        cap.release()
+
+
+def render_chunk(path: str, start: int, end: int, frame_count: int, out_path: str, fps: float,
+                 size: tuple[int, int], resize_to: tuple[int, int] | None, ttl_frames: int,
+                 precomputed: dict, initial_counter: dict, encoder: str, tracker=None,
+                 min_conf: float = 0.0) -> str:
+    cap = cv2.VideoCapture(path)
+    writer, raw_path = None, None
+    try:
+        if not cap.isOpened():
+            raise RuntimeError("No se pudo abrir el vídeo.")
+        writer, raw_path = open_writer(out_path, fps, size, encoder)
+        run_pipeline(cap, writer, None, frame_count=frame_count, sampler=None, resize_to=resize_to,
+                     batch_size=1, max_pending=1, ttl_frames=ttl_frames, start_frame=start, end_frame=end,
+                     precomputed=precomputed, initial_counter=initial_counter, tracker=tracker,
+                     min_conf=min_conf)
+        writer.release()
+        writer = None
+        if raw_path:
+            transcode_h264(raw_path, out_path, fps)
+        return out_path
+    finally:
+        discard_writer(writer, raw_path)
+        cap.release()
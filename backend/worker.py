@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# Workers de jobs de vídeo fuera de la API (JOB_RUNNER=external en la API).
+# Cada proceso carga su propio modelo y reclama jobs de la tabla jobs; se pueden lanzar
+# tantas réplicas/máquinas como haga falta mientras compartan DATABASE_URL, UPLOAD_DIR y outputs.
+# Uso: python worker.py   (JOB_WORKERS procesos, por defecto 1)
+import os
+import signal
+import multiprocessing
+
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+
+
+def _worker_main():
+    import main
+    from jobs import run_worker
+
+    main._init_db_once()
+    main.models.current()  # carga + warmup antes de reclamar el primer job
+    run_worker(main.JOB_HANDLERS, slots=main.job_sema)
+
+
+def run():
+    if JOB_WORKERS <= 1:
+        _worker_main()
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_worker_main, name=f"job-worker-{i}") for i in range(JOB_WORKERS)]
+    for p in procs:
+        p.start()
+
+    def _terminate(signum, frame):
+        for p in procs:
+            p.terminate()
+
+    signal.signal(signal.SIGTERM, _terminate)
+    signal.signal(signal.SIGINT, _terminate)
+    for p in procs:
+        p.join()
+
+
+if __name__ == "__main__":
+    run()
@@ -35,6 +35,7 @@ function Section({title, children, right}) {
 export default function StreamDetector() {
 	const {token} = useAuth();
 	const API_PREDICT = `${API_BASE}/predict_frame_fast`;
+	const WS_FRAMES = `${API_BASE.replace(/^http/, "ws")}/ws/frames`;
 
 	const videoRef = useRef(null);
 	const overlayRef = useRef(null);
@@ -44,6 +45,12 @@ export default function StreamDetector() {
 	const inFlightRef = useRef(false);
 	const lastSentRef = useRef(0);
 
+	// WebSocket de directo; si no está abierto se usa el POST a /predict_frame_fast
+	const wsRef = useRef(null);
+	const wsSeqRef = useRef(0);
+	const wsSentAtRef = useRef(new Map());
+	const serverIntervalRef = useRef(0);
+
 	const [running, setRunning] = useState(false);
 	const [error, setError] = useState("");
 	const [conf, setConf] = useState(0.25);
@@ -128,6 +135,52 @@ export default function StreamDetector() {
 	};
 	useEffect(drawOverlay, [detections]);
 
+	// Conexión WebSocket (se autentica una sola vez al abrirla)
+	useEffect(() => {
+		if (!running || !token) return;
+
+		const ws = new WebSocket(WS_FRAMES);
+		ws.binaryType = "arraybuffer";
+		wsSeqRef.current = 0;
+		wsSentAtRef.current.clear();
+
+		ws.onopen = () => {
+			ws.send(JSON.stringify({token}));
+			ws.send(JSON.stringify({conf}));
+		};
+		ws.onmessage = e => {
+			const msg = JSON.parse(e.data);
+			if (msg.interval_ms) serverIntervalRef.current = msg.interval_ms;
+			if (msg.type !== "detections") return;
+
+			setDetections(msg.detections || []);
+
+			const sentAt = wsSentAtRef.current.get(msg.seq);
+			for (const seq of wsSentAtRef.current.keys()) if (seq <= msg.seq) wsSentAtRef.current.delete(seq);
+			if (sentAt) {
+				const ms = performance.now() - sentAt;
+				setStats({
+					lastMs: Math.round(ms),
+					fps: ms > 0 ? Math.round(1000 / Math.max(ms, serverIntervalRef.current)) : 0
+				});
+			}
+		};
+		ws.onclose = () => {
+			if (wsRef.current === ws) wsRef.current = null;
+		};
+		wsRef.current = ws;
+
+		return () => {
+			wsRef.current = null;
+			ws.close();
+		};
+	}, [running, token]); // eslint-disable-line react-hooks/exhaustive-deps
+
+	useEffect(() => {
+		const ws = wsRef.current;
+		if (ws?.readyState === WebSocket.OPEN) ws.send(JSON.stringify({conf}));
+	}, [conf]);
+
 	// Loop inferència
 	useEffect(() => {
 		if (!running || !token) return;
@@ -138,7 +191,13 @@ export default function StreamDetector() {
 			if (!alive) return;
 
 			const now = Date.now();
-			if (inFlightRef.current || now - lastSentRef.current < intervalMs) {
+			const ws = wsRef.current;
+			const wsOpen = ws?.readyState === WebSocket.OPEN;
+			// Con WebSocket no se espera la respuesta (el servidor se queda con el frame más reciente),
+			// pero se respeta el intervalo que sugiere según la carga
+			const minInterval = wsOpen ? Math.max(intervalMs, serverIntervalRef.current) : intervalMs;
+			const busy = wsOpen ? ws.bufferedAmount > 0 : inFlightRef.current;
+			if (busy || now - lastSentRef.current < minInterval) {
 				requestAnimationFrame(loop);
 				return;
 			}
@@ -172,6 +231,15 @@ export default function StreamDetector() {
 				return;
 			}
 
+			if (wsOpen && ws.readyState === WebSocket.OPEN) {
+				wsSeqRef.current += 1;
+				wsSentAtRef.current.set(wsSeqRef.current, t0);
+				ws.send(await blob.arrayBuffer());
+				inFlightRef.current = false;
+				requestAnimationFrame(loop);
+				return;
+			}
+
 			const form = new FormData();
 			form.append("file", blob);
 			form.append("conf", conf.toString());
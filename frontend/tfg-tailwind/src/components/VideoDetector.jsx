@@ -12,6 +12,8 @@ function VideoDetector() {
 	const [jobState, setJobState] = useState(null);
 	const [progress, setProgress] = useState(0);
 	const [statusMsg, setStatusMsg] = useState("");
+	// Segmentos ya cerrados mientras el vídeo se procesa
+	const [liveSegments, setLiveSegments] = useState([]);
 
 	const [result, setResult] = useState(null);
 	const [loading, setLoading] = useState(false);
@@ -70,6 +72,7 @@ function VideoDetector() {
 		setJobState(null);
 		setProgress(0);
 		setStatusMsg("");
+		setLiveSegments([]);
 		setPublishedOk(false);
 		setShowPublish(false);
 
@@ -108,6 +111,7 @@ function VideoDetector() {
 		setJobState("queued");
 		setProgress(0);
 		setStatusMsg("Enviando vídeo...");
+		setLiveSegments([]);
 		setPublishedOk(false);
 		setShowPublish(false);
 
@@ -140,72 +144,113 @@ function VideoDetector() {
 		}
 	};
 
-	// Poll status
+	// Estado del job: stream SSE (/status/{id}/events) y, si no está disponible, polling
 	useEffect(() => {
 		if (!jobId) return;
 		if (!token) return;
 
 		let alive = true;
+		let finished = false;
+		let interval = null;
+		let source = null;
+
+		const stop = () => {
+			finished = true;
+			if (interval) clearInterval(interval);
+			if (source) source.close();
+		};
 
-		const interval = setInterval(async () => {
-			try {
-				const res = await fetch(API_STATUS(jobId), {
-					headers: {Authorization: `Bearer ${token}`}
-				});
-				const st = await res.json().catch(() => ({}));
+		const handleStatus = async st => {
+			if (!alive || finished) return;
 
-				if (!res.ok) {
-					if (st?.detail) setError(st.detail);
-					return;
-				}
-				if (!alive) return;
-
-				setJobState(st.state);
-				setProgress(st.progress ?? 0);
-				setStatusMsg(st.message ?? "");
-
-				if (st.state === "done") {
-					setResult(st.result);
-					setLoading(false);
-					clearInterval(interval);
-
-					if (st.result?.video_url) {
-						const videoUrl = absApiUrl(st.result.video_url);
-
-						const vres = await fetch(videoUrl, {
-							headers: {Authorization: `Bearer ${token}`}
-						});
-						if (!vres.ok) {
-							throw new Error("No se pudo descargar el MP4 anotado (auth).");
-						}
-						const blob = await vres.blob();
-						const url = URL.createObjectURL(blob);
-						if (annotatedBlobUrl) URL.revokeObjectURL(annotatedBlobUrl);
-						setAnnotatedBlobUrl(url);
-
-						setTimeout(() => {
-							annotatedVideoRef.current?.load();
-							if (annotatedVideoRef.current) annotatedVideoRef.current.playbackRate = playbackRate;
-						}, 0);
+			setJobState(st.state);
+			setProgress(st.progress ?? 0);
+			setStatusMsg(st.message ?? "");
+
+			if (st.state === "done") {
+				stop();
+				setResult(st.result);
+				setLoading(false);
+
+				if (st.result?.video_url) {
+					const videoUrl = absApiUrl(st.result.video_url);
+
+					const vres = await fetch(videoUrl, {
+						headers: {Authorization: `Bearer ${token}`}
+					});
+					if (!vres.ok) {
+						throw new Error("No se pudo descargar el MP4 anotado (auth).");
 					}
+					const blob = await vres.blob();
+					const url = URL.createObjectURL(blob);
+					if (annotatedBlobUrl) URL.revokeObjectURL(annotatedBlobUrl);
+					setAnnotatedBlobUrl(url);
+
+					setTimeout(() => {
+						annotatedVideoRef.current?.load();
+						if (annotatedVideoRef.current) annotatedVideoRef.current.playbackRate = playbackRate;
+					}, 0);
 				}
+			}
 
-				if (st.state === "error") {
-					setError(st.error || "Error desconocido");
-					setLoading(false);
-					clearInterval(interval);
-				}
-			} catch (err) {
-				console.error(err);
-				setError(err.message || "Error desconocido");
+			if (st.state === "error" || st.state === "cancelled") {
+				stop();
+				setError(st.error || (st.state === "cancelled" ? "Análisis cancelado" : "Error desconocido"));
 				setLoading(false);
-				clearInterval(interval);
 			}
-		}, 800);
+		};
+
+		const fail = err => {
+			console.error(err);
+			setError(err.message || "Error desconocido");
+			setLoading(false);
+			stop();
+		};
+
+		const startPolling = () => {
+			interval = setInterval(async () => {
+				try {
+					const res = await fetch(API_STATUS(jobId), {
+						headers: {Authorization: `Bearer ${token}`}
+					});
+					const st = await res.json().catch(() => ({}));
+
+					if (!res.ok) {
+						if (st?.detail) setError(st.detail);
+						return;
+					}
+					await handleStatus(st);
+				} catch (err) {
+					fail(err);
+				}
+			}, 800);
+		};
+
+		if (typeof EventSource === "undefined") {
+			startPolling();
+		} else {
+			// EventSource no admite cabeceras: el token va en la query
+			source = new EventSource(`${API_STATUS(jobId)}/events?access_token=${encodeURIComponent(token)}`);
+			source.addEventListener("status", e => {
+				handleStatus(JSON.parse(e.data)).catch(fail);
+			});
+			source.addEventListener("partial", e => {
+				const {item} = JSON.parse(e.data);
+				if (alive && item?.type === "segment") setLiveSegments(prev => [...prev, item]);
+			});
+			source.onerror = () => {
+				// Se cortó el stream (proxy, reinicio...): se sigue por polling
+				if (finished || !alive) return;
+				source.close();
+				source = null;
+				if (!interval) startPolling();
+			};
+		}
 
 		return () => {
 			alive = false;
-			clearInterval(interval);
+			if (interval) clearInterval(interval);
+			if (source) source.close();
 		};
 	}, [jobId, token]); // eslint-disable-line react-hooks/exhaustive-deps
 
@@ -270,6 +315,15 @@ function VideoDetector() {
 									<div className="h-full bg-indigo-500" style={{width: `${Math.round(progress * 100)}%`}} />
 								</div>
 								<p className="text-[11px] text-slate-500">{statusMsg}</p>
+								{!result && liveSegments.length > 0 && (
+									<ul className="text-[11px] text-slate-500 space-y-0.5">
+										{liveSegments.map((seg, i) => (
+											<li key={i}>
+												{formatTime(seg.start_time)} - {formatTime(seg.end_time)}: {seg.top_species?.species ?? "-"}
+											</li>
+										))}
+									</ul>
+								)}
 							</div>
 						)}
 
@@ -4,17 +4,24 @@ from ultralytics import YOLO
 
 RUN_NAME = "yolo12l_final_768" 
 BEST_WEIGHTS = f"yolo_birds_tfg/{RUN_NAME}/weights/best.pt"
+IMG_SIZE = 640  # el mismo imgsz con el que infiere el backend (INFER_IMGSZ)
+
+def export_onnx(weights: str = BEST_WEIGHTS) -> str:
+    # También la usa quantize.py: el ONNX que se cuantiza es el mismo que se sirve
+    print("Cargando modelo:", weights)
+    model = YOLO(weights)
+
+    print("Exportando a ONNX...")
+    # Batch dinámico: el backend agrupa peticiones en lotes (INFER_ENGINE=onnxruntime/openvino)
+    return model.export(format="onnx", imgsz=IMG_SIZE, dynamic=True)
 
 def main():
     if not os.path.exists(BEST_WEIGHTS):
         raise FileNotFoundError(f"No se encuentra {BEST_WEIGHTS}")
 
-    print("Cargando modelo:", BEST_WEIGHTS)
-    model = YOLO(BEST_WEIGHTS)
-
-    print("Exportando a ONNX...")
-    onnx_path = model.export(format="onnx")
+    onnx_path = export_onnx()
     print("Modelo ONNX guardado en:", onnx_path)
+    print("Para servirlo: MODEL_PATH=<ruta .onnx> (INFER_ENGINE=onnxruntime u openvino)")
 
     print("\nEl modelo PyTorch (para FastAPI, etc.) está en:")
     print(BEST_WEIGHTS)
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# Cuantización INT8 estática (post-training) del ONNX exportado con export.py y comparación
+# con FP32 ONNX y .pt: mAP en val, AP por especie y latencia por imagen en CPU.
+# Requiere: pip install onnx onnxruntime
+import os
+import sys
+import json
+import time
+import random
+import platform
+
+import cv2
+from ultralytics import YOLO
+
+from export import RUN_NAME, BEST_WEIGHTS, IMG_SIZE, export_onnx
+
+# El preprocesado de calibración es el del motor onnxruntime del backend, no una copia
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from engines import preprocess  # noqa: E402
+
+WEIGHTS_DIR = os.path.dirname(BEST_WEIGHTS)
+FP32_ONNX = f"{WEIGHTS_DIR}/best.onnx"
+PREP_ONNX = f"{WEIGHTS_DIR}/best_prep.onnx"
+INT8_ONNX = f"{WEIGHTS_DIR}/best_int8.onnx"
+REPORT_JSON = f"{WEIGHTS_DIR}/quant_report.json"
+REPORT_MD = f"{WEIGHTS_DIR}/quant_report.md"
+
+DATA_YAML = "data_yolo/birds.yaml"
+VAL_IMAGES = "data_yolo/images/val"
+
+CALIB_IMAGES = 300        # muestra de val para calibrar los rangos de activación
+CALIB_METHOD = "MinMax"   # MinMax | Entropy | Percentile
+LATENCY_IMAGES = 100
+LATENCY_WARMUP = 5
+CONF = 0.25
+MAX_CLASS_AP_DROP = 0.02  # AP50-95 por especie: por encima se marca en el informe
+SEED = 42
+
+IMG_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def list_images(folder: str) -> list[str]:
+    return sorted(
+        os.path.join(folder, f) for f in os.listdir(folder)
+        if f.lower().endswith(IMG_EXTS)
+    )
+
+
+# =========================================================
+# CUANTIZACIÓN
+# =========================================================
+
+def export_fp32():
+    if os.path.exists(FP32_ONNX):
+        return
+    print("No existe", FP32_ONNX, "-> exportando con export.py")
+    path = export_onnx(BEST_WEIGHTS)
+    if os.path.abspath(path) != os.path.abspath(FP32_ONNX):
+        os.replace(path, FP32_ONNX)
+
+
+def head_nodes(onnx_path: str) -> list[str]:
+    # Nodos de la cabeza Detect (último módulo, "/model.N/..."): decodificación de cajas (DFL,
+    # anclas, concat final) en FP32, que es donde el INT8 más degrada la localización
+    import onnx
+    nodes = onnx.load(onnx_path).graph.node
+    idx = {}
+    for n in nodes:
+        parts = n.name.split("/")
+        if len(parts) > 1 and parts[1].startswith("model."):
+            try:
+                idx[n.name] = int(parts[1].split(".")[1])
+            except ValueError:
+                pass
+    if not idx:
+        return []
+    last = max(idx.values())
+    return [name for name, i in idx.items() if i == last]
+
+
+class ValCalibrationReader:
+    # CalibrationDataReader de onnxruntime: una imagen de val (preprocesada) por llamada
+    def __init__(self, images: list[str], input_name: str, size: int):
+        self.images = images
+        self.input_name = input_name
+        self.size = size
+        self.pos = 0
+
+    def get_next(self):
+        while self.pos < len(self.images):
+            img = cv2.imread(self.images[self.pos], cv2.IMREAD_COLOR)
+            self.pos += 1
+            if img is not None:
+                return {self.input_name: preprocess([img], self.size)[0]}
+        return None
+
+    def rewind(self):
+        self.pos = 0
+
+
+def quantize(calib_images: list[str]):
+    import onnxruntime as ort
+    from onnxruntime.quantization import (
+        CalibrationMethod, QuantFormat, QuantType, quantize_static,
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    print("Preprocesando el grafo FP32 (shape inference + optimización)...")
+    quant_pre_process(FP32_ONNX, PREP_ONNX)
+
+    input_name = ort.InferenceSession(PREP_ONNX, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    exclude = head_nodes(PREP_ONNX)
+    print(f"Calibrando con {len(calib_images)} imágenes de {VAL_IMAGES} ({CALIB_METHOD}); "
+          f"{len(exclude)} nodos de la cabeza quedan en FP32")
+
+    t0 = time.time()
+    quantize_static(
+        PREP_ONNX,
+        INT8_ONNX,
+        ValCalibrationReader(calib_images, input_name, IMG_SIZE),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        weight_type=QuantType.QInt8,
+        activation_type=QuantType.QUInt8,
+        calibrate_method=getattr(CalibrationMethod, CALIB_METHOD),
+        nodes_to_exclude=exclude,
+    )
+    print(f"Modelo INT8 guardado en: {INT8_ONNX} ({time.time() - t0:.0f}s)")
+
+
+# =========================================================
+# VALIDACIÓN
+# =========================================================
+
+def evaluate(name: str, path: str) -> dict:
+    print(f"\n==== {name}: {path} ====")
+    model = YOLO(path, task="detect")
+
+    m = model.val(data=DATA_YAML, split="val", imgsz=IMG_SIZE, batch=1, device="cpu",
+                  plots=False, verbose=False)
+    names = m.names
+    per_class = {names[i]: float(ap) for i, ap in enumerate(m.box.maps)}
+
+    # Latencia extremo a extremo (pre + inferencia + post) de una imagen, como en el backend
+    rng = random.Random(SEED)
+    images = list_images(VAL_IMAGES)
+    sample = rng.sample(images, min(LATENCY_IMAGES, len(images)))
+    frames = [img for img in (cv2.imread(p, cv2.IMREAD_COLOR) for p in sample) if img is not None]
+    for img in frames[:LATENCY_WARMUP]:
+        model.predict(source=img, conf=CONF, imgsz=IMG_SIZE, device="cpu", verbose=False)
+    times = []
+    for img in frames:
+        t0 = time.perf_counter()
+        model.predict(source=img, conf=CONF, imgsz=IMG_SIZE, device="cpu", verbose=False)
+        times.append((time.perf_counter() - t0) * 1000)
+    times.sort()
+
+    res = {
+        "path": path,
+        "size_mb": round(os.path.getsize(path) / 1e6, 2),
+        "map50": float(m.box.map50),
+        "map50_95": float(m.box.map),
+        "per_class_map50_95": per_class,
+        "val_speed_ms": {k: round(v, 2) for k, v in m.speed.items()},
+        "latency_ms": {
+            "mean": round(sum(times) / len(times), 2),
+            "p50": round(times[len(times) // 2], 2),
+            "p95": round(times[min(len(times) - 1, int(0.95 * len(times)))], 2),
+            "images": len(times),
+        },
+    }
+    print(f"mAP50={res['map50']:.4f}  mAP50-95={res['map50_95']:.4f}  "
+          f"latencia p50={res['latency_ms']['p50']}ms  tamaño={res['size_mb']}MB")
+    return res
+
+
+def compare(int8: dict, base: dict) -> dict:
+    drops = {
+        sp: round(base["per_class_map50_95"][sp] - ap, 4)
+        for sp, ap in int8["per_class_map50_95"].items()
+        if sp in base["per_class_map50_95"]
+    }
+    return {
+        "map50_delta": round(int8["map50"] - base["map50"], 4),
+        "map50_95_delta": round(int8["map50_95"] - base["map50_95"], 4),
+        "speedup_p50": round(base["latency_ms"]["p50"] / max(int8["latency_ms"]["p50"], 1e-9), 2),
+        "size_ratio": round(int8["size_mb"] / max(base["size_mb"], 1e-9), 3),
+        "species_over_max_drop": {sp: d for sp, d in sorted(drops.items(), key=lambda x: -x[1])
+                                  if d > MAX_CLASS_AP_DROP},
+    }
+
+
+def write_report(results: dict, comparisons: dict):
+    report = {
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "host": {"machine": platform.machine(), "processor": platform.processor(), "cpus": os.cpu_count()},
+        "config": {
+            "img_size": IMG_SIZE, "calib_images": CALIB_IMAGES, "calib_method": CALIB_METHOD,
+            "latency_images": LATENCY_IMAGES, "max_class_ap_drop": MAX_CLASS_AP_DROP,
+        },
+        "models": results,
+        "int8_vs": comparisons,
+    }
+    with open(REPORT_JSON, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    lines = [
+        f"# Cuantización INT8 - {RUN_NAME}",
+        "",
+        f"CPU: {report['host']['processor'] or report['host']['machine']} ({report['host']['cpus']} hilos), "
+        f"imgsz {IMG_SIZE}, calibración {CALIB_IMAGES} imágenes ({CALIB_METHOD})",
+        "",
+        "| modelo | tamaño (MB) | mAP50 | mAP50-95 | latencia p50 (ms) | p95 (ms) |",
+        "|---|---|---|---|---|---|",
+    ]
+    for name, r in results.items():
+        lines.append(f"| {name} | {r['size_mb']} | {r['map50']:.4f} | {r['map50_95']:.4f} | "
+                     f"{r['latency_ms']['p50']} | {r['latency_ms']['p95']} |")
+    for base, c in comparisons.items():
+        lines += [
+            "",
+            f"## INT8 frente a {base}",
+            "",
+            f"- mAP50: {c['map50_delta']:+.4f}, mAP50-95: {c['map50_95_delta']:+.4f}",
+            f"- Aceleración (p50): x{c['speedup_p50']}, tamaño: {c['size_ratio']:.0%}",
+        ]
+        if c["species_over_max_drop"]:
+            lines.append(f"- Especies que pierden más de {MAX_CLASS_AP_DROP} de AP50-95:")
+            lines += [f"  - {sp}: -{d:.4f}" for sp, d in c["species_over_max_drop"].items()]
+        else:
+            lines.append(f"- Ninguna especie pierde más de {MAX_CLASS_AP_DROP} de AP50-95")
+    with open(REPORT_MD, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    print(f"\nInforme: {REPORT_JSON} / {REPORT_MD}")
+
+
+def main():
+    if not os.path.exists(BEST_WEIGHTS):
+        raise FileNotFoundError(f"No se encuentra {BEST_WEIGHTS}")
+    images = list_images(VAL_IMAGES)
+    if not images:
+        raise FileNotFoundError(f"No hay imágenes en {VAL_IMAGES}")
+
+    export_fp32()
+    calib = random.Random(SEED).sample(images, min(CALIB_IMAGES, len(images)))
+    quantize(calib)
+
+    results = {
+        "pt": evaluate("PyTorch", BEST_WEIGHTS),
+        "onnx_fp32": evaluate("ONNX FP32", FP32_ONNX),
+        "onnx_int8": evaluate("ONNX INT8", INT8_ONNX),
+    }
+    comparisons = {
+        "onnx_fp32": compare(results["onnx_int8"], results["onnx_fp32"]),
+        "pt": compare(results["onnx_int8"], results["pt"]),
+    }
+    write_report(results, comparisons)
+
+    print("\nPara servirlo: MODEL_PATH=" + INT8_ONNX + " (INFER_ENGINE=onnxruntime)")
+
+
+if __name__ == "__main__":
+    main()